@@ -0,0 +1,429 @@
+#!/usr/bin/env python3
+# -*- coding: iso-8859-1 -*
+
+import debug
+import io
+import os
+import packed_room
+import random
+import sys
+import tempfile
+import time
+import pygame
+
+from array import array
+from config_reader import ConfigReader
+from manager import AudioManager, BlockManager, SpriteManager, TileManager
+from navigation import Navigation
+from room import Room
+from schema import Schema
+from sprites import DirtyLayerGrid, DynamicEntity, SingleEntity
+from utilities import get_grid_data
+
+"""
+Benchmarks, run from the source directory:
+  python3 benchmark.py config [size in MB]
+  python3 benchmark.py config_cache
+  python3 benchmark.py sheets [rounds]
+  python3 benchmark.py tiles [rounds]
+  python3 benchmark.py collide [queries]
+  python3 benchmark.py sprites [sprites]
+  python3 benchmark.py room [size in tiles]
+
+Practices:
++ Comply to PEP 0008 for programming with modules, classes, methods and
+  functions (Style Guide for Python Codestyle), see:
+  https://www.python.org/dev/peps/pep-0008
++ Comply to PEP 0257 (Docstring convention), see:
+  https://www.python.org/dev/peps/pep-0257
+
+@author: Peter Borgstedt (peter.borgstedt@gmail.com)
+"""
+
+_CONF_FILE = 'hack_and_hijack.conf'
+
+debug.DEBUG = False  # Keep debug prints out of the measurements.
+
+
+def _timed(function, *args):
+  """Run function and return the elapsed time in milliseconds and the
+  result."""
+  start = time.perf_counter()
+  result = function(*args)
+  return (time.perf_counter() - start) * 1000, result
+
+
+def _print_result(caption, millis, size):
+  """Print a benchmark result with throughput."""
+  mb = size / (1024.0 * 1024.0)
+  print('  %-28s %10.1f ms %8.1f MB/s' % (caption, millis,
+                                           mb / max(millis / 1000, 1e-9)))
+
+
+def _write_synthetic_config(f, size):
+  """Write a synthetic configuration of (approximately) given size in
+  bytes, containing many rooms with large matrix layers."""
+  cells = ('WTA', 'WTB', '---', 'IDA', 'SSG', 'SPB')
+  row = '(' + ','.join("'%s'" % cells[i % len(cells)]
+                       for i in range(100)) + '),\n'
+  matrix = '<<[\n' + row * 100 + ']>>\n'
+  room = ("tile.map=<<{\n'WTA': ('wall', (0, 1)),\n'WTB': ('wall', (0, 0)),"
+          "\n'---': None\n}>>\n"
+          "blocking.map=<<{\n'WTA': (0, 0, 0, 0), # full block\n}>>\n")
+  room += ''.join('matrix.layer.%s=%s' % (i, matrix) for i in range(5))
+  room += 'matrix.block=' + matrix
+  f.write('[]\nwindow.size=(1024,768)\nmax_time=120\n')
+  written = i = 0
+  while written < size:
+    section = '\n[room*synthetic_%s]\n' % i + room
+    f.write(section)
+    written += len(section)
+    i += 1
+  return i
+
+
+def _parse(data):
+  """Parse raw configuration data."""
+  return ConfigReader.StreamParser(io.TextIOWrapper(io.BytesIO(data))).read()
+
+
+def bench_config(size_mb=50):
+  """Benchmark configuration parsing, both the shipped configuration and
+  a synthetic configuration with many rooms."""
+  with open(_CONF_FILE, 'rb') as f:
+    shipped = f.read()
+
+  with tempfile.TemporaryFile('w+b') as f:
+    text = io.TextIOWrapper(f, write_through=True)
+    rooms = _write_synthetic_config(text, int(size_mb * 1024 * 1024))
+    f.seek(0)
+    synthetic = f.read()
+    text.detach()
+
+  print('Parse configuration:')
+  for caption, data in (('Shipped', shipped),
+                        ('Synthetic (%s rooms)' % rooms, synthetic)):
+    millis, _ = _timed(_parse, data)
+    _print_result(caption, millis, len(data))
+
+
+def bench_config_cache():
+  """Benchmark reading the shipped configuration with and without the
+  compiled cache."""
+  def read_and_compile():
+    ConfigReader.read_config(_CONF_FILE, cache=False).compile()
+
+  print('Read configuration (%s):' % _CONF_FILE)
+  millis, _ = _timed(read_and_compile)
+  print('  %-28s %10.1f ms' % ('Text parsing and evaluation', millis))
+  ConfigReader.read_config(_CONF_FILE)  # Make sure cache exists.
+  millis, _ = _timed(ConfigReader.read_config, _CONF_FILE)
+  print('  %-28s %10.1f ms' % ('Compiled cache', millis))
+
+
+def _init_display():
+  """Initialize a (hidden) display, needed to convert surfaces."""
+  os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+  pygame.display.init()
+  pygame.display.set_mode((1, 1))
+
+
+def bench_tiles(rounds=200):
+  """Benchmark blitting all tiles of the tile sheets with alpha, with per
+  pixel alpha on every tile versus classified tiles (see
+  manager.TileManager)."""
+  _init_display()
+  game_schema = Schema.compile(ConfigReader.read_config(_CONF_FILE))
+  tile_manager = TileManager(game_schema)
+  target = pygame.Surface((1024, 768)).convert()
+  w, h = game_schema.tile_size
+  for key, sheet in sorted(game_schema.tile_sheets.items()):
+    if not sheet.alpha:
+      continue
+    tile_manager.load_sheets((key,))  # Sheets are loaded lazily.
+    first, rows, columns, _ = tile_manager._sheets[key]
+    atlas = TileManager._decode_atlas(sheet, (w, h)).convert_alpha()
+    per_pixel = [atlas.subsurface((x * w, y * h, w, h))
+                 for y in range(rows) for x in range(columns)]
+    classified = [tile for tile in tile_manager.tiles[
+        first:first + rows * columns] if not tile_manager.is_empty(tile)]
+    print('Sheet %s, %s tiles (%s not empty):' % (key, len(per_pixel),
+                                                  len(classified)))
+    for caption, tiles in (('Per pixel alpha', per_pixel),
+                           ('Classified', classified)):
+      def blit_all():
+        for _ in range(int(rounds)):
+          for tile in tiles:
+            target.blit(tile, (0, 0))
+      millis, _ = _timed(blit_all)
+      print('  %-28s %10.1f ms' % (caption, millis))
+
+
+def bench_sheets(rounds=5):
+  """Benchmark startup loading of tile sheets: eager loading of all sheets
+  versus lazy loading of the sheets referenced by the main room only (best
+  of rounds)."""
+  _init_display()
+  game_schema = Schema.compile(ConfigReader.read_config(_CONF_FILE))
+  room = game_schema.get_room('main_room')
+  keys = set(v[0] if isinstance(v, tuple) else v
+             for v in room.tile_map.values() if v is not None)
+  keys.update(game_schema.sprites[key].sheet
+              for key in room.sprite_map.values() if key is not None)
+  keys = sorted(key for key in keys if key is not None)
+  all_keys = sorted(game_schema.tile_sheets.keys())
+
+  def load(sheet_keys):
+    TileManager(game_schema).load_sheets(sheet_keys)
+
+  print('Load tile sheets (%s of %s used by main room):' % (len(keys),
+                                                            len(all_keys)))
+  for caption, sheet_keys in (('Eager', all_keys),
+                              ('Lazy (main room)', keys)):
+    millis = min(_timed(load, sheet_keys)[0] for _ in range(int(rounds)))
+    print('  %-28s %10.1f ms' % (caption, millis))
+
+
+def bench_collide(queries=200000):
+  """Benchmark block collision queries in the main room, the previous
+  dictionary of blocks (rectangles per row and column) versus the grid
+  array of block modifiers (see manager.BlockManager), best of three:
+  random rectangles, the sweeps of moving sprites and the collisions of
+  the walkability grid."""
+  config = ConfigReader.read_config(_CONF_FILE)
+  spec = Schema.compile(config).get_room('main_room')
+  packed = packed_room.load_room(config, spec)
+  columns, rows, grid = packed.blocks
+  block_manager = BlockManager(columns, rows)
+  blocks = {}
+  for i, modifier_id in enumerate(grid):
+    if modifier_id != 0:
+      x, y = i % columns, i // columns
+      block_manager.add(x, y, packed.modifiers[modifier_id])
+      block = block_manager.get_block(x, y)
+      if block is not None:
+        blocks.setdefault(y, {})[x] = block
+  del grid  # A view of the memory map, release it before close.
+  packed.close()
+
+  def collide_blocks(target_rect):
+    for block in get_grid_data(target_rect, blocks):
+      if block.colliderect(target_rect):
+        return True
+    return False
+
+  random.seed(0)
+  rects = [pygame.Rect(random.randrange(columns * 32),
+                       random.randrange(rows * 32), 32, 32)
+           for _ in range(int(queries))]
+  print('Collide %s rectangles with %s blocks:' % (
+      len(rects), sum(len(row) for row in blocks.values())))
+  for caption, function in (
+      ('Dictionary of blocks', lambda: [collide_blocks(r) for r in rects]),
+      ('Grid array', lambda: [block_manager.collide(r) for r in rects]),
+      ('Grid array, batched',
+       lambda: block_manager.collide_many(rects))):
+    millis = min(_timed(function)[0] for _ in range(3))
+    print('  %-28s %10.1f ms %8.0f queries/s' % (
+        caption, millis, len(rects) / max(millis / 1000, 1e-9)))
+
+  # The player and moving sprites sweep a few pixels each frame.
+  navigation = Navigation(block_manager)
+  walkable = [(x, y) for y in range(rows) for x in range(columns)
+              if navigation.is_walkable(x, y)]
+  moves = []
+  for _ in range(int(queries)):
+    x, y = random.choice(walkable)
+    moves.append((pygame.Rect(x * 32 + random.randrange(-8, 9),
+                              y * 32 + random.randrange(-8, 9), 32, 32),) +
+                 random.choice(((3, 0), (-3, 0), (0, 3), (0, -3))))
+  reach_left, reach_up, reach_right, reach_down = block_manager._reach
+
+  def sweep_blocks(target_rect, dx, dy):
+    if dx:
+      path = pygame.Rect(target_rect.right if dx > 0 else
+                         target_rect.left + dx, target_rect.top, abs(dx),
+                         target_rect.height)
+    else:
+      path = pygame.Rect(target_rect.left, target_rect.bottom if dy > 0 else
+                         target_rect.top + dy, target_rect.width, abs(dy))
+    distance = dx or dy
+    for block in get_grid_data((path.x - reach_right, path.y - reach_down,
+                                path.w + reach_left + reach_right,
+                                path.h + reach_up + reach_down), blocks):
+      if not block.colliderect(path):
+        continue
+      if dx > 0 and block.left >= target_rect.right:
+        distance = min(distance, block.left - target_rect.right)
+      elif dx < 0 and block.right <= target_rect.left:
+        distance = max(distance, block.right - target_rect.left)
+      elif dy > 0 and block.top >= target_rect.bottom:
+        distance = min(distance, block.top - target_rect.bottom)
+      elif dy < 0 and block.bottom <= target_rect.top:
+        distance = max(distance, block.bottom - target_rect.top)
+    return distance
+
+  print('Sweep %s moves of 3 pixels from walkable cells:' % len(moves))
+  for caption, function in (
+      ('Dictionary of blocks', lambda: [sweep_blocks(*m) for m in moves]),
+      ('Grid array', lambda: [block_manager.sweep(*m) for m in moves])):
+    millis = min(_timed(function)[0] for _ in range(3))
+    print('  %-28s %10.1f ms %8.0f sweeps/s' % (
+        caption, millis, len(moves) / max(millis / 1000, 1e-9)))
+
+  # All cells are collided when the walkability grid is built.
+  cells = [pygame.Rect(x * 32, y * 32, 32, 32)
+           for y in range(rows) for x in range(columns)] * 100
+  print('Walkability grid of %sx%s cells (see navigation.Navigation), 100 '
+        'times:' % (columns, rows))
+  for caption, function in (
+      ('Dictionary of blocks', lambda: [collide_blocks(r) for r in cells]),
+      ('Grid array', lambda: [block_manager.collide(r) for r in cells]),
+      ('Grid array, batched',
+       lambda: block_manager.collide_many(cells))):
+    millis = min(_timed(function)[0] for _ in range(3))
+    print('  %-28s %10.1f ms' % (caption, millis))
+
+
+def bench_sprites(count=10000):
+  """Benchmark drawing dirty sprites in a synthetic room (three sprite
+  layers), one draw call and blit per sprite versus the batched
+  Surface.blits per layer in sprites.DirtyLayerGrid.draw, best of
+  three."""
+  _init_display()
+  target = pygame.Surface((1024, 768)).convert()
+  images = []
+  for i in range(8):
+    image = pygame.Surface((32, 32), pygame.SRCALPHA)
+    image.fill((i * 32, 255 - i * 32, 128, 255 if i % 2 else 128))
+    images.append(image.convert_alpha())
+  random.seed(0)
+  renderer = DirtyLayerGrid('synthetic')
+  for i in range(int(count)):
+    x, y = random.randrange(992), random.randrange(736)
+    if i % 2:
+      sprite = SingleEntity([images[i % 8]], x, y)
+    else:
+      sprite = DynamicEntity(images, x, y)
+      sprite._index = i % 8
+    renderer.add(sprite, layer=i % 3)
+
+  def set_all_dirty():
+    for sprite in renderer._spritelist:
+      sprite._dirty = 1
+      renderer.modify_dirty(sprite)
+
+  def draw_per_sprite():  # Previous draw of dirty sprites.
+    for layer in sorted(renderer._layer_to_dirty.keys()):
+      for sprite in set(renderer._layer_to_dirty[layer]):
+        sprite.draw(target)
+        if sprite._dirty == 1:
+          sprite._dirty = 0
+        renderer.modify_dirty(sprite)
+
+  print('Draw %s dirty sprites:' % len(renderer._spritelist))
+  for caption, function in (
+      ('Draw and blit per sprite', draw_per_sprite),
+      ('Batched blits per layer', lambda: renderer.draw(target))):
+    millis = []
+    for _ in range(3):
+      set_all_dirty()
+      millis.append(_timed(function)[0])
+    print('  %-28s %10.1f ms %8.0f sprites/s' % (
+        caption, min(millis), count / max(min(millis) / 1000, 1e-9)))
+
+
+class _RoomContext():
+  """Context of the room benchmark, rooms are taken from the packed room
+  files in a temporary directory (as from an asset bundle)."""
+
+  def __init__(self, config, game_schema, directory):
+    self._config = config
+    self._schema = game_schema
+    self._directory = directory
+    tile_manager = TileManager(game_schema)
+    self._sprite_manager = SpriteManager(game_schema, tile_manager,
+                                         AudioManager(game_schema))
+
+  def get_config(self):
+    return self._config
+
+  def get_schema(self):
+    return self._schema
+
+  def get_bundle(self):
+    return self  # See get_room.
+
+  def get_sprite_manager(self):
+    return self._sprite_manager
+
+  def get_room(self, key):
+    return packed_room.PackedRoom.load(os.path.join(self._directory, key))
+
+
+def _tile_grid(grid, columns, rows, size):
+  """Repeat grid of columns x rows to a grid of size x size."""
+  tiled = array('H')
+  for y in range(int(size)):
+    row = array('H', grid[(y % rows) * columns:(y % rows + 1) * columns])
+    tiled.extend((row * (int(size) // columns + 1))[:int(size)])
+  return tiled
+
+
+def bench_room(size=300, rounds=3):
+  """Benchmark loading a synthetic room of size x size tiles (the main
+  room repeated) from a packed room file, and drawing it the first time
+  (render mode full, up to 512x512 tiles), best of rounds."""
+  _init_display()
+  config = ConfigReader.read_config(_CONF_FILE, lazy=Schema.LAZY)
+  game_schema = Schema.compile(config)
+  spec = game_schema.get_room('main_room')
+  packed = packed_room.load_room(config, spec)
+  layers = [(layer, int(size), int(size),
+             _tile_grid(grid, columns, rows, size))
+            for layer, columns, rows, grid in packed.layers]
+  columns, rows, grid = packed.blocks
+  blocks = (int(size), int(size), _tile_grid(grid, columns, rows, size))
+  synthetic = packed_room.PackedRoom(spec.key, layers, blocks, packed.legend,
+                                     packed.modifiers,
+                                     source_hash=packed.source_hash)
+  del grid  # A view of the memory map, release it before close.
+  packed.close()
+  directory = tempfile.mkdtemp()
+  try:
+    synthetic.save(os.path.join(directory, spec.key))
+    context = _RoomContext(config, game_schema, directory)
+    print('Room of %sx%s tiles:' % (int(size), int(size)))
+    rooms = []
+    millis = min(_timed(lambda: rooms.append(Room(spec.key, context)))[0]
+                 for _ in range(int(rounds)))
+    print('  %-28s %10.1f ms' % ('Read', millis))
+    if size * 32 > 16384:
+      print('  %-28s %13s' % ('First draw', 'too large'))
+    else:
+      millis = min(_timed(room.create_surface)[0] for room in rooms)
+      print('  %-28s %10.1f ms' % ('First draw', millis))
+  finally:
+    for name in os.listdir(directory):
+      os.remove(os.path.join(directory, name))
+    os.rmdir(directory)
+
+
+_BENCHMARKS = {
+    'collide': bench_collide,
+    'config': bench_config,
+    'config_cache': bench_config_cache,
+    'room': bench_room,
+    'sheets': bench_sheets,
+    'sprites': bench_sprites,
+    'tiles': bench_tiles
+}
+
+
+if __name__ == '__main__':
+  os.chdir(os.path.dirname(os.path.realpath(__file__)))
+  if len(sys.argv) < 2 or sys.argv[1] not in _BENCHMARKS:
+    print('Usage: benchmark.py <%s> [arguments]' % '|'.join(
+        sorted(_BENCHMARKS.keys())))
+    sys.exit(1)
+  _BENCHMARKS[sys.argv[1]](*[float(arg) for arg in sys.argv[2:]])
@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: iso-8859-1 -*
+
+import hashlib
+import io
+import mmap
+import os
+import pickle
+import pygame
+import struct
+
+from concurrent.futures import ProcessPoolExecutor
+from config_reader import ConfigReader
+from packed_room import PackedRoom
+from schema import Schema
+
+__all__ = ['Bundle', 'load_bundle', 'get_bundle_file', 'compile_bundle']
+
+"""
+Asset bundle. The configuration, the tile sheets and the rooms are compiled
+offline into one versioned file that is loaded on startup instead of the
+raw files, with the bundle no configuration parsing, PNG decoding or room
+packing is needed. Compile the bundle with:
+  python3 bundle.py
+
+File layout (little endian):
+  header:  magic, version, source hash (sha1 of the configuration).
+  meta:    size and pickled meta data: compiled configuration and schema,
+           file stats (for validation) and the offset of each sheet and
+           room in the bundle.
+  sheets:  atlases (tile sheets padded to whole tiles) in raw pixel format
+           (RGBA with alpha, otherwise RGB).
+  rooms:   packed rooms, see packed_room.PackedRoom.
+The bundle is stale if the configuration or any tile sheet has changed,
+the raw files are then used.
+
+Practices:
++ Comply to PEP 0008 for programming with modules, classes, methods and
+  functions (Style Guide for Python Codestyle), see:
+  https://www.python.org/dev/peps/pep-0008
++ Comply to PEP 0257 (Docstring convention), see:
+  https://www.python.org/dev/peps/pep-0257
+
+@author: Peter Borgstedt (peter.borgstedt@gmail.com)
+"""
+
+_MAGIC = b'HHBNDL'
+_VERSION = 4
+_HEADER = struct.Struct('<6sH40s')
+_SIZE = struct.Struct('<I')
+_SUFFIX = '.bundle'
+
+
+class Bundle():
+  """Loaded asset bundle, the sheets and rooms are read from a memory map
+  of the bundle file that is kept open as long as the bundle is used."""
+
+  def __init__(self, meta, buffer):
+    self.config = meta['config']
+    self.schema = meta['schema']
+    self._sheets = meta['sheets']  # Key -> (rows, columns, alpha, offset)
+    self._rooms = meta['rooms']  # Key -> offset
+    self._mmap = buffer
+    self._view = memoryview(buffer)
+
+  def read_atlas(self, key, tile_size):
+    """Read atlas of tile sheet (see manager.TileManager), None if not
+    bundled. Requires the display to be initialized as the atlas is
+    converted to the display format."""
+    sheet = self._sheets.get(key, None)
+    if sheet is None:
+      return None
+    rows, columns, alpha, offset = sheet
+    w, h = tile_size
+    pixel_format, size = ('RGBA', 4) if alpha else ('RGB', 3)
+    end = offset + rows * columns * w * h * size
+    image = pygame.image.frombuffer(self._view[offset:end],
+                                    (columns * w, rows * h), pixel_format)
+    return image.convert_alpha() if alpha else image.convert()
+
+  def get_room(self, key):
+    """Get packed room (packed_room.PackedRoom), None if not bundled."""
+    offset = self._rooms.get(key, None)
+    if offset is None:
+      return None
+    packed, _ = PackedRoom.read(self._view, offset)
+    return packed
+
+  def close(self):
+    """Release the memory map, rooms and tiles can no longer be read."""
+    if self._mmap is not None:
+      self._view.release()
+      self._mmap.close()
+      self._mmap = None
+
+
+def get_bundle_file(config_file):
+  """Get path of bundle, located next to the configuration file."""
+  return os.path.splitext(config_file)[0] + _SUFFIX
+
+
+def _get_stat(path):
+  """Get file stat used to validate the bundle: (modification, size)."""
+  stat = os.stat(path)
+  return (stat.st_mtime_ns, stat.st_size)
+
+
+def load_bundle(config_file):
+  """Load bundle for configuration file, None is returned if there is no
+  bundle or if it is stale (the raw files should then be used)."""
+  try:
+    with open(get_bundle_file(config_file), 'rb') as f:
+      buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+  except (OSError, ValueError):
+    return None  # No bundle (or an empty file).
+
+  try:
+    magic, version, source_hash = _HEADER.unpack_from(buffer, 0)
+    if magic != _MAGIC or version != _VERSION:
+      raise ValueError('Wrong bundle version')
+    meta_size, = _SIZE.unpack_from(buffer, _HEADER.size)
+    offset = _HEADER.size + _SIZE.size
+    meta = pickle.loads(buffer[offset:offset + meta_size])
+    if not _is_valid(meta, config_file, source_hash.decode('ascii')):
+      raise ValueError('Stale bundle')
+  except (OSError, ValueError, EOFError, TypeError, AttributeError,
+          ImportError, IndexError, KeyError, struct.error,
+          pickle.UnpicklingError):
+    buffer.close()
+    return None
+  meta['config']._source_file = config_file
+  return Bundle(meta, buffer)
+
+
+def _is_valid(meta, config_file, source_hash):
+  """Validate that neither the configuration nor any tile sheet has
+  changed since the bundle was compiled. The configuration content hash is
+  only calculated if its modification time or size differ."""
+  if _get_stat(config_file) != meta['config_stat']:
+    with open(config_file, 'rb') as f:
+      if hashlib.sha1(f.read()).hexdigest() != source_hash:
+        return False
+  for path, stat in meta['sheet_stats'].items():
+    if _get_stat(path) != stat:
+      return False
+  return True
+
+
+def _pad_sheet(arguments):
+  """Pad tile sheet to whole tiles and return it as raw pixels, run in a
+  worker process. Padding is the same as in manager.TileManager
+  (transparent with alpha, otherwise black)."""
+  key, path, alpha, (w, h) = arguments
+  image = pygame.image.load(path)
+  rows = -(-image.get_height() // h)
+  columns = -(-image.get_width() // w)
+  atlas = pygame.Surface((columns * w, rows * h),
+                         pygame.SRCALPHA if alpha else 0)
+  atlas.blit(image, (0, 0))
+  data = pygame.image.tobytes(atlas, 'RGBA' if alpha else 'RGB')
+  return key, rows, columns, alpha, data
+
+
+def compile_bundle(config_file, **kwargs):
+  """Compile bundle for configuration file, tile sheets are padded in a
+  process pool (key word argument 'workers', default is the CPU count).
+  Return the path of the bundle."""
+  config = ConfigReader.read_config(config_file, cache=False)
+  config.compile(lazy=Schema.LAZY)
+  game_schema = Schema.compile(config)
+  source_hash = config.get_source_hash()
+
+  sheets = sorted(game_schema.tile_sheets.values(), key=lambda s: s.key)
+  arguments = [(s.key, s.image, s.alpha, game_schema.tile_size)
+               for s in sheets]
+  with ProcessPoolExecutor(kwargs.get('workers', None)) as executor:
+    padded = list(executor.map(_pad_sheet, arguments))
+
+  # Rooms are packed from a copy, the matrices of the bundled configuration
+  # are kept unevaluated (see Schema.LAZY).
+  room_schema = Schema.compile(ConfigReader.read_config(config_file,
+                                                        cache=False))
+  rooms = io.BytesIO()
+  room_offsets = {}
+  for key in sorted(room_schema.rooms.keys()):
+    rooms.write(b'\0' * (rooms.tell() % 2))
+    room_offsets[key] = rooms.tell()
+    PackedRoom.from_spec(room_schema.get_room(key),
+                         source_hash=source_hash).write(rooms)
+
+  # Offsets are relative until the size of meta data is known.
+  sheet_offsets = {}
+  offset = 0
+  for key, rows, columns, alpha, data in padded:
+    sheet_offsets[key] = (rows, columns, alpha, offset)
+    offset += len(data)
+  rooms_offset = offset + offset % 2
+  meta = {'config': config, 'schema': game_schema,
+          'config_stat': _get_stat(config_file),
+          'sheet_stats': dict((s.image, _get_stat(s.image)) for s in sheets)}
+  start = 0
+  while True:  # Meta data size depend on offsets, iterate until stable.
+    meta['sheets'] = dict((key, (r, c, a, start + o))
+                          for key, (r, c, a, o) in sheet_offsets.items())
+    meta['rooms'] = dict((key, start + rooms_offset + o)
+                         for key, o in room_offsets.items())
+    data = pickle.dumps(meta, pickle.HIGHEST_PROTOCOL)
+    aligned = _HEADER.size + _SIZE.size + len(data)
+    aligned += -aligned % 4
+    if aligned == start:
+      break
+    start = aligned
+
+  path = get_bundle_file(config_file)
+  tmp_file = path + '.tmp'
+  with open(tmp_file, 'wb') as f:
+    f.write(_HEADER.pack(_MAGIC, _VERSION, source_hash.encode('ascii')))
+    f.write(_SIZE.pack(len(data)))
+    f.write(data)
+    f.write(b'\0' * (start - f.tell()))
+    for _, _, _, _, sheet_data in padded:
+      f.write(sheet_data)
+    f.write(b'\0' * (rooms_offset - offset))
+    f.write(rooms.getvalue())
+  os.replace(tmp_file, path)
+  return path
+
+
+if __name__ == '__main__':
+  os.chdir(os.path.dirname(os.path.realpath(__file__)))
+  conf = os.path.realpath('hack_and_hijack.conf')
+  print('Compiled bundle -> %s' % compile_bundle(conf))
@@ -51,15 +51,24 @@ var3=[section_a:const_d]
 @author: Peter Borgstedt (peter.borgstedt@gmail.com)
 '''
 
+import hashlib
+import io
+import os
+import pickle
 import re
 from ast import literal_eval
 
 __all__ = ['ConfigReader']
 
+_NOT_EVALUATED = object()  # Marker, value has not been evaluated.
+
 
 class Properties():
-  def __init__(self, properties):
+  def __init__(self, properties, **kwargs):
     self._properties = properties
+    self._lines = kwargs.get('lines', {})  # Key -> line number.
+    self._evaluated = {}  # Key -> already evaluated (typed) value.
+    self._index = {}  # Split -> key index, see _get_index.
 
   def get(self, key, **kwargs):
     value = self._properties.get(key, None)
@@ -68,52 +77,112 @@ class Properties():
   def get_keys(self):
     return list(self._properties.keys())
 
+  def get_line(self, key=None):
+    """Get line number of key in the configuration file, or the line
+    of the section if key is None. None is returned if unknown."""
+    return self._lines.get(key, None)
+
   def get_prefixed(self, prefix, split):
-    prefixed = {}
-    for key in list(self._properties.keys()):
-      if not key.startswith(prefix):
-        continue
-      stripped_key = key.lstrip(prefix + split)
-      if stripped_key is not None:
-        arr = stripped_key.rsplit(split)
-        arr_size = max(len(arr) - 1, 0)
-        if arr_size > 0:
-          sub_values = self.put_if_absent(prefixed, arr[0], {})
-          for i in range(1, arr_size):
-            sub_values = self.put_if_absent(sub_values, arr[i], {})
-          sub_values[arr[arr_size]] = self._properties[key]
-        else:
-          prefixed[arr[arr_size]] = self._properties[key]
-    return prefixed
-
-  def put_if_absent(self, dictionary, key, value):
-    if not dictionary.get(key, None):
-      dictionary[key] = value
-    return value
+    """Get values with keys prefixed with prefix (followed by split), the
+    remaining parts of the keys are structured as nested dictionaries:
+    {'a.b.c': 1, 'a.b.d': 2} -> get_prefixed('a', '.') -> {'b': {'c': 1,
+    'd': 2}}. The returned dictionary is shared and must not be modified.
+    """
+    node = self._get_index(split)
+    for part in prefix.split(split):
+      node = node.get(part, None)
+      if not isinstance(node, dict):
+        return {}
+    return node
+
+  def _get_index(self, split):
+    """Get (or build) the key index for split. The index is a tree of
+    nested dictionaries with the key parts as keys and raw values as
+    leafs."""
+    index = self._index.get(split, None)
+    if index is None:
+      self._index[split] = index = {}
+      for key, value in list(self._properties.items()):
+        if not isinstance(key, str):
+          continue
+        parts = key.split(split)
+        node = index
+        for part in parts[:-1]:
+          child = node.get(part, None)
+          if not isinstance(child, dict):
+            node[part] = child = {}  # Nested keys win over a value.
+          node = child
+        if not isinstance(node.get(parts[-1], None), dict):
+          node[parts[-1]] = value
+    return index
 
   def get_eval(self, key, **kwargs):
+    """Get evaluated (typed) value. The raw value is evaluated the first
+    time it is used and the result is kept, note that the returned value
+    is shared between all callers and must not be modified."""
     value = self.get(key)
     if value is None:
       return kwargs.get('default', None)
+    evaluated = self._evaluated.get(key, _NOT_EVALUATED)
+    if evaluated is _NOT_EVALUATED:
+      self._evaluated[key] = evaluated = literal_eval(value)
+    return evaluated
+
+  def set(self, key, value):
+    """Set raw value, any evaluated value for the key is invalidated."""
+    self._properties[key] = value
+    self._index.clear()  # Rebuilt upon next use.
+    self.invalidate(key)
+
+  def invalidate(self, key=None):
+    """Invalidate evaluated value of key (or all values if key is None),
+    the raw value will be evaluated again upon next use."""
+    if key is None:
+      self._evaluated.clear()
     else:
-      return literal_eval(value)
+      self._evaluated.pop(key, None)
+
+  def compile(self, **kwargs):
+    """Evaluate all values that are valid literals and keep the result,
+    values that are not literals (plain text) are only kept raw. Values
+    with keys starting with any of the prefixes in key word argument
+    'lazy' are evaluated upon first use instead."""
+    lazy = tuple(kwargs.get('lazy', ()))
+    for key, value in list(self._properties.items()):
+      if not isinstance(value, str) or (lazy and isinstance(key, str) and
+                                        key.startswith(lazy)):
+        continue
+      try:
+        self.get_eval(key)
+      except (ValueError, SyntaxError, TypeError, MemoryError,
+              RecursionError):
+        pass  # Not a literal, plain text value.
 
 
 class Config():
-  def __init__(self, config):
+  def __init__(self, config, **kwargs):
+    self._source_hash = None  # Content hash of the configuration file.
+    self._source_file = None  # Path of the configuration file.
     self._config = {}
+    self._prefixed = {}  # Section prefix -> Properties(name -> Properties).
+    lines = kwargs.get('lines', {})
     for key in list(config.keys()):
-      value = Properties(config[key])
+      value = Properties(config[key], lines=lines.get(key, {}))
+      value._get_index('.')  # Build key index once, upon load.
       self._config[key] = value
-
-  def get_prefixed_properties(self, prefix):
-    prefixed_properties = {}
-    for key in list(self._config.keys()):
       if key is not None:
         arr = key.rsplit('*', 1)
-        if len(arr) > 1 and arr[0] == prefix:
-          prefixed_properties[arr[1]] = self.get_properties(key)
-    return Properties(prefixed_properties)
+        if len(arr) > 1:
+          prefixed = self._prefixed.get(arr[0], None)
+          if prefixed is None:
+            self._prefixed[arr[0]] = prefixed = Properties({})
+          prefixed._properties[arr[1]] = value
+
+  def get_prefixed_properties(self, prefix):
+    """Get properties of all sections prefixed with prefix, i.e. the
+    sections [prefix*name] are returned as: name -> Properties."""
+    prefixed = self._prefixed.get(prefix, None)
+    return Properties({}) if prefixed is None else prefixed
 
   def get_properties(self, section):
     return self._config.get(section, None)
@@ -126,30 +195,139 @@ class Config():
     return None
 
   def get_eval_property(self, section, key):
-    value = self.get_property(section, key)
-    if value is not None:
-      return literal_eval(value)
+    properties = self.get_properties(section)
+    if properties is not None:
+      return properties.get_eval(key)
     return None
 
+  def get_source_file(self):
+    """Get path of the configuration file this configuration was read
+    from (None if unknown)."""
+    return self._source_file
+
+  def get_source_hash(self):
+    """Get content hash of the configuration file this configuration
+    was read from (None if unknown)."""
+    return self._source_hash
+
+  def invalidate(self, section=None):
+    """Invalidate evaluated values of section (or all sections if section
+    is None)."""
+    if section is not None:
+      properties = self.get_properties(section)
+      if properties is not None:
+        properties.invalidate()
+      return
+    for properties in list(self._config.values()):
+      properties.invalidate()
+
+  def compile(self, **kwargs):
+    """Evaluate all literal values in all sections, see
+    Properties.compile."""
+    for properties in list(self._config.values()):
+      properties.compile(**kwargs)
+
 
 class ConfigReader():
 
-  class LineReader():
+  class StreamParser():
+    """Streaming configuration parser. Reads the configuration in a single
+    pass as a state machine.
+
+    Patterns are precompiled and only applied on lines that may be a
+    section, multi-line values are collected in a list buffer and joined
+    once (instead of concatenating strings for each line).
+    States: _SECTION (key/value pairs), _BLOCK (inside a <<...>> value) and
+    _MACRO (inside a [define ...] section, see _get_macro).
+    """
+    _SECTION = 0
+    _BLOCK = 1
+    _MACRO = 2
+
+    _SECTION_PATTERN = re.compile(r'^\[(?P<section>.*)\].*$', re.DOTALL)
+    _MACRO_PATTERN = re.compile(
+        r'^\[define (?P<macro>.+)\((?P<variables>.+)?\)\]$', re.IGNORECASE)
 
     def __init__(self, f):
       self.f = f
+      self.macros = {}
+      self.lines = {}  # Section -> key -> line number (None: section).
 
-    def read_next(self):
-      line = next(self.f, None)
-      line = self.remove_comment(line)
-      self.current = None if line is None else line.rstrip('\r\n')
-      return self.current
+    def read(self):
+      """Read the whole stream and return content as a dictionary:
+      section -> key -> value. Line numbers are kept in self.lines."""
+      remove_comment = self.remove_comment
+      content = dict()
+      section = content[None] = {}
+      lines = self.lines[None] = {None: 0}
+      state = self._SECTION
+      key = buffer = None
+      length = lineno = 0
+      for line in self.f:
+        lineno += 1
+        if '#' in line:  # Most lines have no comment, skip the search.
+          line = remove_comment(line)
+        line = line.rstrip('\r\n')
+
+        if state == self._BLOCK:
+          # Values of at most two characters are joined without newline.
+          if length > 2:
+            buffer.append('\n')
+            length += 1
+            end = line.endswith('>>')
+          else:
+            end = (''.join(buffer) + line).endswith('>>')
+          buffer.append(line)
+          length += len(line)
+          if end:
+            section[key] = self._end_block(buffer)
+            state = self._SECTION
+          continue
+
+        pair = line.split('=', 1)
+        if len(pair) == 2:
+          key, value = pair
+          if state == self._MACRO:
+            section[key] = value
+            continue
+          lines[key] = lineno
+          if value.startswith('<<'):
+            value = value[2:]
+            if value.endswith('>>'):
+              section[key] = self._end_block([value])
+            else:
+              buffer, length = [value], len(value)
+              block_start = lineno
+              state = self._BLOCK
+          else:
+            section[key] = value
+          continue
 
-    def get_current(self):
-      return self.current
+        if state == self._MACRO and not line.startswith('['):
+          continue
+        match = self._SECTION_PATTERN.match(line)
+        if match:
+          macro_match = self._MACRO_PATTERN.match(line)
+          if macro_match:
+            section = self._get_macro(macro_match)
+            state = self._MACRO
+          else:
+            section = content[match.group('section')] = {}
+            lines = self.lines[match.group('section')] = {None: lineno}
+            state = self._SECTION
 
-    def unprocessed(self):
-      return self.current is not None
+      if state == self._BLOCK:
+        raise ValueError('Unterminated value \'%s\' starting on line %s'
+                         % (key, block_start))
+      return content
+
+    def _get_macro(self, match):
+      """Unfinished.
+      TODO: Complete this. I'll leave it here as I want to use the
+      configuration for other projects."""
+      values = {}
+      self.macros.update({match.group('macro'): values})
+      return values
 
     @staticmethod
     def remove_comment(line):
@@ -165,111 +343,100 @@ class ConfigReader():
           pass  # Do nothing for now, no comment found.
       return line
 
-  class ConfigAssembler():
-
-    def __init__(self, f):
-      self.line_reader = ConfigReader.LineReader(f)
-      self.macros = {}
-
-    def read(self):
-      content = dict()
-      content[None] = self.get_section()
-      while self.line_reader.unprocessed():
-        line = self.line_reader.get_current()
-        match = re.match(
-            '^\[define (?P<macro>.+)\((?P<variables>.+)?\)\]$',
-            line, re.IGNORECASE)
-        if match:
-          self.get_macro(match, line)
-        else:
-          match = re.match("^\[(?P<section>.*)\].*$", line,
-                           re.DOTALL)
-          if (match):
-            content[match.group('section')] = self.get_section()
-      return content
-
-    def get_section(self):
-      section = {}
-      while True:
-        line = self.read_next_line()
-        if line is None:
-          break
-        elif isinstance(line, dict):
-          section[line['key']] = line['value']
-        elif re.match("^\[(?P<section>.*)\].*$", line, re.DOTALL):
-          break
-      return section
-
-    def get_macro(self, result, _line):
-      """Unfinished.
-      TODO: Complete this. I'll leave it here as I want to use the
-      configuration for other projects."""
-      values = {}
-      _variables = [var.strip() for var in
-                    result.group('variables').split(',')]
-      # print variables
-      self.macros.update({result.group('macro'): values})
-      while True:
-        pair = self.next_line_value(True)
-        if isinstance(pair, list):
-          values.update({pair[0]: pair[1]})
-        elif pair is None or pair.startswith('['):
-          break
-      # print self.macros
-
-    def use_macro(self, line):
-      """Unfinished.
-      TODO: Complete this. I'll leave it here as I want to use the
-      configuration for other projects."""
-      result = re.match(
-          '^\[app_(?P<app>.+)_(dpfieldmap|offline)_(?P<cust>.+$)', line,
-          re.IGNORECASE)
-      if result:
-        values = {}
-        while True:
-          pair = self.next_line_value(True)
-          print(pair)
-          match = re.match(
-              '^\[use (?P<macro>.+)(.*)$', line, re.IGNORECASE)
-          if (match):
-            # print result.group('app')
-            continue
-
-          if pair == -1:
-            break
-          elif pair == -2:
-            continue
-          else:
-            values.update({pair[0]: pair[1]})
-
-    def read_next_line(self):
-      line = self.next_line_value(True)
-      if isinstance(line, list):
-        key = line[0]
-        value = line[1]
-        if value.startswith('<<'):
-          value = value[2:]
-          while not value.endswith('>>'):
-            n = self.line_reader.read_next()
-            value += '\n' + n if len(value) > 2 else n
-          value = value.rstrip('\r\n')
-          idx = value.rindex('>>')
-          if idx > -1:
-            value = value[:idx]
-        return {'key': key, 'value': value}
-      return line
+    @staticmethod
+    def _end_block(buffer):
+      """Join a buffered multi-line value and remove the end marker."""
+      value = ''.join(buffer).rstrip('\r\n')
+      return value[:value.rindex('>>')]
+
+  class ConfigCache():
+    """Compiled configuration cache, stored next to the configuration
+    file. Contain the parsed and evaluated configuration tree, which means
+    that no text parsing (or literal evaluation) is needed on startup as
+    long as the configuration file is unchanged.
+
+    The cache is keyed by modification time and size (fast path) and by
+    a content hash. If modification time differs but the content is the
+    same (i.e. file was touched) the cache is still used. The lazy prefixes
+    the configuration was compiled with (see Config.compile) are part of
+    the key, key word argument 'lazy'."""
+
+    _VERSION = 4  # Increase when the cached structure is changed.
+    _SUFFIX = '.cache'
+
+    def __init__(self, config_file, **kwargs):
+      self.config_file = config_file
+      self.cache_file = config_file + self._SUFFIX
+      self.lazy = tuple(sorted(kwargs.get('lazy', ())))
+
+    def load(self, stat, **kwargs):
+      """Load cached configuration, None is returned if there is no
+      valid cache. The content hash is only validated (if given as key word
+      argument 'digest') when modification time or size differ."""
+      try:
+        with open(self.cache_file, 'rb') as f:
+          header = pickle.load(f)
+          version, lazy, mtime, size, digest = header
+          if version != self._VERSION or lazy != self.lazy:
+            return None
+          if (mtime, size) != (stat.st_mtime_ns, stat.st_size):
+            if digest != kwargs.get('digest', None):
+              return None
+          return pickle.load(f)
+      except (OSError, EOFError, ValueError, TypeError, AttributeError,
+              ImportError, IndexError, pickle.UnpicklingError):
+        return None  # Missing or corrupt cache, just rebuild it.
+
+    def store(self, config, stat):
+      """Store compiled configuration. Failing to write the cache (for
+      example a read-only installation) is not an error."""
+      header = (self._VERSION, self.lazy, stat.st_mtime_ns, stat.st_size,
+                config.get_source_hash())
+      tmp_file = self.cache_file + '.tmp'
+      try:
+        with open(tmp_file, 'wb') as f:
+          pickle.dump(header, f, pickle.HIGHEST_PROTOCOL)
+          pickle.dump(config, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, self.cache_file)  # Atomic on all platforms.
+      except (OSError, pickle.PicklingError):
+        try:
+          os.remove(tmp_file)
+        except OSError:
+          pass
 
-    def next_line_value(self, split):
-      line = self.line_reader.read_next()
-      if line is not None:
-        if split:
-          pair = line.split("=", 1)
-          if (len(pair) == 2):
-            return pair
-      return line
+  @staticmethod
+  def read_config(config_file, **kwargs):
+    """Read configuration. A compiled cache is used and (re-)built unless
+    key word argument 'cache' is set to False. Key word argument 'lazy' is
+    passed to Config.compile."""
+    if not kwargs.get('cache', True):
+      with open(config_file, 'rb') as f:
+        config = ConfigReader._assemble(f.read())
+      config._source_file = config_file
+      return config
+
+    lazy = kwargs.get('lazy', ())
+    cache = ConfigReader.ConfigCache(config_file, lazy=lazy)
+    stat = os.stat(config_file)
+    config = cache.load(stat)  # Fast path, modification time and size.
+    if config is not None:
+      config._source_file = config_file
+      return config
+
+    with open(config_file, 'rb') as f:
+      data = f.read()
+    config = cache.load(stat, digest=hashlib.sha1(data).hexdigest())
+    if config is None:
+      config = ConfigReader._assemble(data)
+      config.compile(lazy=lazy)
+    cache.store(config, stat)
+    config._source_file = config_file
+    return config
 
   @staticmethod
-  def read_config(config_file):
-    f = open(config_file, 'r')
-    config_assembler = ConfigReader.ConfigAssembler(f)
-    return Config(config_assembler.read())
+  def _assemble(data):
+    """Parse raw configuration content into a configuration."""
+    parser = ConfigReader.StreamParser(io.TextIOWrapper(io.BytesIO(data)))
+    config = Config(parser.read(), lines=parser.lines)
+    config._source_hash = hashlib.sha1(data).hexdigest()
+    return config
@@ -3,7 +3,9 @@
 import os
 import pygame
 import manager
+import bundle
 import config_reader
+import schema
 import quiz
 import room
 import mini_games
@@ -43,6 +45,10 @@ class Context():
     self._debug = debug.DEBUG
 
     self._config = loader._config
+    self._schema = loader._schema
+    self._bundle = loader._bundle
+    debug.trace('Configuration loaded' if self._bundle is None else
+                'Configuration loaded (bundle)')
     self._screen = loader.create_screen()
     loader.draw_loading(self._screen)  # Draw 'Loading..." on screen.
 
@@ -55,6 +61,7 @@ class Context():
                                      self._audio_manager)
     self._bar = loader.create_bar(self._screen)
     self._interaction = self._build_interactions()
+    debug.trace('Context created')
 
   def _init(self):
     """Initialize pygame."""
@@ -72,13 +79,16 @@ class Context():
     return self._clock
 
   def _build_interactions(self):
-    """Build interactions.
+    """Register interactions, these are built when first needed (or one
+    at a time while the splash screen is shown, see
+    Interactions.build_next).
     TODO: move to loader?
     TODO: Read from configuration what interaction should be loaded."""
-    return {'bit_coin_collector':
-            mini_games.Collector(self, 'bit_coin_collector'),
-            'bit_eater':
-            mini_games.Collector(self, 'bit_eater')}
+    interactions = Interactions()
+    for game_key in ('bit_coin_collector', 'bit_eater'):
+      interactions.register(game_key, lambda key=game_key:
+                            mini_games.Collector(self, key))
+    return interactions
 
   def _setup_fonts(self):
     """Setup font "library", we probably want to load these from the
@@ -156,9 +166,21 @@ class Context():
     """Get full configuration."""
     return self._config
 
+  def get_schema(self):
+    """Get compiled configuration, see schema.Schema."""
+    return self._schema
+
+  def get_bundle(self):
+    """Get asset bundle, None if the raw files are used (see bundle)."""
+    return self._bundle
+
+  def get_interactions(self):
+    """Get interactions (mini games), see Interactions."""
+    return self._interaction
+
   def get_random_interaction(self):
-    """Get a random interaction."""
-    return self._interaction[random.choice(list(self._interaction.keys()))]
+    """Get a random interaction, it is built if it is not ready."""
+    return self._interaction.get(random.choice(self._interaction.keys()))
 
   def get_model(self):
     """Get model containing current game state."""
@@ -234,11 +256,10 @@ class Context():
 class Model():
   """Model, contain game state and data."""
 
-  def __init__(self, config):
+  def __init__(self, game_schema):
     self._active = 1  # 1: active, 0: not active (will cause exit)
     self._time = 0  # The amount of seconds that has past.
-    props = config.get_properties('')
-    self._max_time = props.get_eval('max_time', default=60)  # In seconds.
+    self._max_time = game_schema.max_time  # In seconds.
     self._time_ticker = utilities.TimeCount(1000, True)
 
   def tick_time(self):
@@ -250,6 +271,54 @@ class Model():
     return False  # No update yet.
 
 
+class Interactions():
+  """Interactions (mini games) registered as factories, each one is built
+  once: on first use or step by step, one for each call to build_next (for
+  example once per frame of the splash screen). Building create fonts and
+  convert surfaces, so it is always done on the main thread."""
+
+  def __init__(self):
+    self._factories = {}  # Key -> function that build the interaction.
+    self._interactions = {}  # Key -> built interaction.
+
+  def register(self, key, factory):
+    """Register factory (function without arguments) for interaction."""
+    self._factories[key] = factory
+
+  def keys(self):
+    """Get keys of all registered interactions (sorted)."""
+    return sorted(self._factories.keys())
+
+  def get(self, key):
+    """Get interaction, build it if it has not been built."""
+    interaction = self._interactions.get(key, None)
+    if interaction is None:
+      interaction = self._factories[key]()
+      self._interactions[key] = interaction
+      debug.trace('Interaction \'%s\' built' % key)
+    return interaction
+
+  def items(self):
+    """Get all (key, interaction), building those not yet built."""
+    return [(key, self.get(key)) for key in self.keys()]
+
+  def is_ready(self, key=None):
+    """Whether interaction (or all interactions if no key is given) has
+    been built."""
+    if key is None:
+      return len(self._interactions) == len(self._factories)
+    return key in self._interactions
+
+  def build_next(self):
+    """Build the next interaction not yet built, if any. Return True if
+    one was built."""
+    for key in self.keys():
+      if key not in self._interactions:
+        self.get(key)
+        return True
+    return False
+
+
 class _Loader():
   """Initiating classes, is only called upon on startup when the game
   context is created."""
@@ -257,14 +326,22 @@ class _Loader():
   _CONF_FILE = 'hack_and_hijack.conf'
 
   def __init__(self, font):
-    self._config = self._load_config()
+    config_file = os.path.dirname(os.path.realpath(__file__))
+    config_file = os.path.join(config_file, self._CONF_FILE)
+    self._bundle = bundle.load_bundle(config_file)
+    if self._bundle is not None:
+      self._config = self._bundle.config
+      self._schema = self._bundle.schema
+    else:
+      self._config = self._load_config(config_file)
+      # Validate configuration once, fail fast (with line numbers).
+      self._schema = schema.Schema.compile(self._config)
     self.font = font
 
-  def _load_config(self):
+  def _load_config(self, config_file):
     """Load game configuration."""
-    config_file = os.path.dirname(os.path.realpath(__file__))
-    config_file = os.path.join(config_file, self._CONF_FILE)
-    return config_reader.ConfigReader.read_config(config_file)
+    return config_reader.ConfigReader.read_config(config_file,
+                                                  lazy=schema.Schema.LAZY)
 
   def draw_loading(self, screen):
     """Draw 'Laddar...' on screen when starting up."""
@@ -279,27 +356,27 @@ class _Loader():
 
   def create_model(self):
     """Creates a fresh model with initialized state."""
-    return Model(self._config)
+    return Model(self._schema)
 
   def create_screen(self):
     """Initiate pygame and center and create (main-) screen."""
     os.environ['SDL_VIDEO_CENTERED'] = '1'  # Center dialog.
-    WIN_SIZE = self._config.get_eval_property('', 'window.size')
+    WIN_SIZE = self._schema.window_size
     return pygame.display.set_mode(WIN_SIZE, 0)
 
   def create_tile_manager(self):
     """Create tile manager, containing all images sliced into tiles."""
-    return manager.TileManager(self._config)
+    return manager.TileManager(self._schema, bundle=self._bundle)
 
   def create_sprite_manager(self, tile_manager, audio_manager):
     """Create sprite manager, containing functionality for creating
     different types of sprites."""
-    return manager.SpriteManager(self._config, tile_manager, audio_manager)
+    return manager.SpriteManager(self._schema, tile_manager, audio_manager)
 
   def create_audio_manager(self):
     """Create audio manager, containing functionality surrounding sounds
     and music."""
-    return manager.AudioManager(self._config)
+    return manager.AudioManager(self._schema)
 
   def create_bar(self, screen):
     image = pygame.image.load('tiles/bar.png').convert()
@@ -1,13 +1,16 @@
 # -*- coding: iso-8859-1 -*
 
 import pygame
+import time
 from pygame.locals import SRCALPHA
 from utilities import TimeCount
 
 global DEBUG
 DEBUG = True
 
-__all__ = ['Debug']
+__all__ = ['Debug', 'trace']
+
+_START = time.perf_counter()  # Used by trace, when module is imported.
 
 """
 Containing some useful debugging funnctionality.
@@ -23,6 +26,14 @@ Practices:
 """
 
 
+def trace(message):
+  """Print message with time elapsed since start (ms) if DEBUG is set,
+  used to trace the startup."""
+  if DEBUG:
+    print('[TRACE %8.1f ms] %s' % ((time.perf_counter() - _START) * 1000,
+                                   message))
+
+
 class Debug():
   """Class contain some useful debugging methods.
   Note that the global value DEBUG is used in several places in the code
@@ -35,7 +46,7 @@ class Debug():
   def draw_grid(self, size):
     """Draw grid on given area/size."""
     w, h = size
-    x_max, y_max = w / 32, h / 32
+    x_max, y_max = w // 32, h // 32
     grid = pygame.Surface(size, SRCALPHA)
 
     for y in range(1, y_max):
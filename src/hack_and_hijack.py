@@ -7,8 +7,10 @@ from pygame.locals import KEYDOWN, QUIT, K_ESCAPE, K_F1
 from view import *
 from pygame.constants import K_SPACE, SRCALPHA
 from context import Context
+from room import ChunkedRoomSurface, RingRoomSurface
 from utilities import OptionDialog
 import utilities
+import debug
 from transitions import BitBlipper
 
 """
@@ -45,10 +47,11 @@ class HackAndHijack():
     self._debug = self._context.get_debug()
     self._screen = self._context.get_screen()
     self._room = self._context.create_room("main_room")
-    self._room_surface = self._room.get_rendered_surface()
+    self._room_surface = self._room.create_surface()
     self._view = self._build_view(self._screen, self._room)
     self._player = self._room.renderer._player
     self._bar = self._context.get_bar()
+    self._merge_waste = self._context.get_schema().render.merge_waste
     self._context.get_audio_manager().load_music('title')
     # grid = d.draw_grid(room.get_size())
 
@@ -56,7 +59,7 @@ class HackAndHijack():
     """This will start the game. Screen will display graphics and
     interaction will be responsive."""
     init_surface = self._init_render()  # Render screen.
-    print('hej')
+    debug.trace('First frame rendered')
 
     # TODO: load image from configuration instead.
     self._show_splash('tiles/help.png', init_surface)
@@ -73,20 +76,34 @@ class HackAndHijack():
       # Render remaining time on screen.
       self._context.tick_and_draw()
 
-      # Check and perform move on _player character.
-      self._player.inquire_move(self._room.block_manager)
+      # Check and perform move on _player character, the movement depend
+      # on the time of the last frame (not on the frame rate).
+      self._player.inquire_move(self._room.block_manager, clock.get_time())
+
+      # Move roaming sprites and collide all moved sprites.
+      self._room.renderer.update_movers(
+          clock.get_time(), self._room.block_manager,
+          navigation=self._room.navigation)
 
       # Update view with _player sprite position.
       self._view.update(self._player)
 
-      if self._room.renderer.draw(self._room_surface):
-        # Drawing to screen directly to increases performance.
-        self._screen.blit(self._room_surface, *self._view.get_rect())
-
-        # We do not not use hardware acceleration, so flip is not of
-        # any use. Change this if hardware acceleration should be
-        # activated.
+      # Drawing to screen directly to increases performance. We do not
+      # not use hardware acceleration, so flip is not of any use. Change
+      # this if hardware acceleration should be activated.
+      dirty_rects = self._room.renderer.draw(self._room_surface)
+      if self._view.is_scrolled():
+        # The whole view has moved, update all of it.
+        self._blit_room(self._screen)
         pygame.display.update(self._view.get_clip())
+      elif dirty_rects:
+        # Only blit and update the repainted areas, merged into fewer.
+        rects = utilities.merge_rects(
+            [self._view.translate(rect) for rect in dirty_rects],
+            self._merge_waste)
+        for rect in rects:
+          self._blit_room(self._screen, rect)
+        pygame.display.update(rects)
 
       clock.tick(60)
 
@@ -144,7 +161,10 @@ class HackAndHijack():
 
     bit_blipper = BitBlipper(self._context, self._screen.get_rect())
     bit_blipper.fade_in(self._screen, image, out_position)
+    interactions = self._context.get_interactions()
     while True:
+      # Build mini games, one for each frame, while the splash is shown.
+      interactions.build_next()
       for e in pygame.event.get():
         if e.type == QUIT:
           if self._show_quit_dialog():
@@ -241,12 +261,24 @@ class HackAndHijack():
     init_surface.blit(image, (0, 0))
     self._bar.update(init_surface)
     self._view.update(self._player)
-    init_surface.blit(self._room_surface, *self._view.get_rect())
+    self._blit_room(init_surface)
     self._context.blit_remaining_time(init_surface)
     self._context.blit_music_volume(init_surface)
     self._context.blit_sound_volume(init_surface)
     return init_surface
 
+  def _blit_room(self, target, rect=None):
+    """Blit the part of the room surface that is in view on target, or
+    only the part within rect (screen coordinates) if given."""
+    if rect is None:
+      position, area = self._view.get_rect()
+    else:
+      position, area = self._view.get_area(rect)
+    if isinstance(self._room_surface, (ChunkedRoomSurface, RingRoomSurface)):
+      self._room_surface.blit_view(target, position, area)
+    else:
+      target.blit(self._room_surface, position, area)
+
   def _restart(self):
     """Restart game, resetting model and sprite states."""
     self._context.get_model()._time = 0
@@ -1,18 +1,20 @@
 # -*- coding: iso-8859-1 -*
 
+import debug
+import hashlib
 import pygame
-import os
-import re
 
-from ast import literal_eval
-from pygame.locals import SRCALPHA
-from utilities import TimeCount, get_grid_data
+from array import array
+from pygame.locals import RLEACCEL, SRCALPHA
+from utilities import (TimeCount, get_byte_grid, get_grid_cells,
+                       translate_byte_grid)
 # PEP-0328: http://legacy.python.org/dev/peps/pep-0328/
 from sprites import (SingleEntity, DynamicEntity, InteractionEntity,
                      HideOnCollideEntity, RandomHideOnCollideEntity,
-                     SquareEntity, PlayerEntity)
+                     SquareEntity, PlayerEntity, MovingEntity,
+                     ChasingEntity)
 
-__all__ = ['TileManager, SpriteManager, AudioManager', 'BlockManager', 'Block']
+__all__ = ['TileManager, SpriteManager, AudioManager', 'BlockManager']
 
 """
 A module containing management classes.
@@ -29,125 +31,296 @@ Practices:
 
 
 class TileManager():
-  """Manage all reading of tile images. Images are read then segments are
-  split and cached."""
-
-  def __init__(self, config):
-    self.tile_size = config.get_eval_property('', 'image.tile.size')
-    self.tile_config = config.get_prefixed_properties('tile')
-    self.tiles = self._read_image_files()
+  """Manage all reading of tile images. Each tile sheet is kept as one
+  converted surface (atlas) and the tiles are subsurfaces of it, sharing
+  its pixels. Tiles are stored in a flat list indexed by tile id, which is
+  the first id of the sheet + row * columns + column.
+
+  Tiles in sheets with alpha are classified one by one: opaque tiles are
+  subsurfaces of an opaque copy of the atlas, tiles with binary
+  transparency use a colorkey, tiles with true alpha keep per pixel alpha
+  (both RLE accelerated) and fully transparent tiles share one empty
+  image (see is_empty). Tiles with identical pixels (in any sheet) share
+  one canonical image, which also share the static tile palette entry and
+  baked chunks of the renderer. The atlas of a sheet with duplicates only
+  keep its unique tiles (see _pack_atlas).
+
+  Sheets are loaded lazily, when a tile of them is first requested or when
+  a room load the sheets it reference (see load_sheets)."""
+  _COLORKEYS = ((255, 0, 255), (0, 255, 255), (255, 255, 0), (1, 2, 3))
+
+  def __init__(self, game_schema, **kwargs):
+    self.tile_size = game_schema.tile_size
+    self.tile_sheets = game_schema.tile_sheets
+    self.tiles = []  # Tile id -> Surface (subsurface of an atlas).
+    self._sheets = {}  # Key -> (first tile id, rows, columns, atlas).
+    self._unique = {}  # Pixel hash -> canonical tile image.
+    self._shared = 0  # Duplicate tiles sharing a canonical image.
+    self._freed = 0  # Atlas bytes freed by packing, see _pack_atlas.
+    self.empty = pygame.Surface(self.tile_size, SRCALPHA).convert_alpha()
+    self.empty.set_alpha(255, RLEACCEL)  # Shared fully transparent tile.
+    self._bundle = kwargs.get('bundle', None)  # Pre-padded atlases.
+    if not kwargs.get('lazy', True):
+      self.load_sheets(sorted(self.tile_sheets.keys()))
+
+  def load_sheets(self, keys):
+    """Load tile sheets (those not already loaded)."""
+    keys = [key for key in keys
+            if key not in self._sheets and key in self.tile_sheets]
+    for key in keys:
+      if self._bundle is not None:
+        self._add_atlas(key, self._bundle.read_atlas(key, self.tile_size))
+        continue
+      sheet = self.tile_sheets[key]
+      atlas = self._decode_atlas(sheet, self.tile_size)
+      if sheet.alpha:
+        self._add_atlas(key, atlas.convert_alpha())
+      else:
+        self._add_atlas(key, atlas.convert())
+
+  def get_tile_id(self, key, position):
+    """Get tile id from key and (Y, X) position, None if there is no
+    such tile."""
+    sheet = self._sheets.get(key, None)
+    if sheet is None:
+      self.load_sheets((key,))
+      sheet = self._sheets.get(key, None)
+      if sheet is None:
+        return None
+    first, rows, columns, _ = sheet
+    y, x = position
+    if 0 <= y < rows and 0 <= x < columns:
+      return first + y * columns + x
+    return None
 
   def get_tiles(self, key):
-    """Get tiles from key, all segments are returned for this."""
-    return self.tiles.get(key, None)
+    """Get tiles from key, all segments are returned (row by row)."""
+    self.load_sheets((key,))
+    sheet = self._sheets.get(key, None)
+    if sheet is None:
+      return None
+    first, rows, columns, _ = sheet
+    return self.tiles[first:first + rows * columns]
 
   def get_tile(self, key, position):
     """Get tile from key and position, one segments is returned."""
-    tiles = self.get_tiles(key)
-    if tiles:
-      tile_row = tiles.get(position[0], None)
-      if tile_row:
-        return tile_row.get(position[1], None)
-    return None
-
-  def _read_image_files(self):
-    """Get tiles sections from configuration and read _image and split
-    _image into tiles. The tiles are mapped with following data types and
-    structure: dict(tile_section) -> dict(Y) -> dict(X) -> Surface"""
-    tiles = {}
-    for key in self.tile_config.get_keys():
-      properties = self.tile_config.get(key)
-      image_file = properties.get('image')
-      path = os.path.dirname(os.path.realpath(__file__))
-      image_file = path + '/' + re.sub('/', r'/', image_file)
-      image = pygame.image.load(image_file)
-      tiles[key] = self._read_image(image, self.tile_size, properties)
-    return tiles
-
-  def _read_image(self, image, size, properties):
-    """Read one _image and split portions of it to segments.
-    The tiles are stored and returned as following data types and
-    structure: dict(Y) -> dict(X) -> Surface."""
-    tiles = {}
-    py = px = 0
-    alpha = properties.get_eval('alpha', default=False)
-    for y in range(0, image.get_height(), size[1]):
-      py += 1
-      tiles_row = {}
-      for x in range(0, image.get_width(), size[0]):
-        px += 1
-        flag = SRCALPHA if alpha else 0
-        surface = pygame.Surface((size[0], size[1]), flag)
-        surface.blit(image, (0, 0), (x, y, size[0], size[1]))
-        if alpha:
-          surface = surface.convert_alpha()
-        else:
-          surface = surface.convert()
-        tiles_row[len(tiles_row)] = surface
-      tiles[len(tiles)] = tiles_row
-    return tiles
+    tile_id = self.get_tile_id(key, position)
+    return None if tile_id is None else self.tiles[tile_id]
+
+  def is_empty(self, image):
+    """Whether tile image is fully transparent (nothing to draw)."""
+    return image is self.empty
+
+  @staticmethod
+  def _decode_atlas(sheet, size):
+    """Read tile sheet image into an atlas (not converted), padded to
+    whole tiles (transparent with alpha, otherwise black)."""
+    image = pygame.image.load(sheet.image)
+    w = -(-image.get_width() // size[0]) * size[0]
+    h = -(-image.get_height() // size[1]) * size[1]
+    atlas = pygame.Surface((w, h), SRCALPHA if sheet.alpha else 0)
+    atlas.blit(image, (0, 0))
+    return atlas
+
+  def _add_atlas(self, key, atlas):
+    """Split atlas into tiles (subsurfaces), add them to the tiles. Tiles
+    already loaded (same pixels, in any sheet) share the canonical image.
+    If there are any such duplicates the unique tiles are packed into a
+    smaller atlas and the full atlas is released. Tiles of atlases with
+    alpha are classified, see _classify_tile."""
+    w, h = self.tile_size
+    rows, columns = atlas.get_height() // h, atlas.get_width() // w
+    first = len(self.tiles)
+    digests = []  # Digest of each tile, row by row.
+    new = {}  # Digest -> rectangle in atlas, tiles not loaded before.
+    for y in range(0, rows):
+      for x in range(0, columns):
+        rect = (x * w, y * h, w, h)
+        digest = hashlib.blake2b(
+            pygame.image.tobytes(atlas.subsurface(rect), 'RGBA'),
+            digest_size=16).digest()
+        digests.append(digest)
+        if digest not in self._unique and digest not in new:
+          new[digest] = rect
+    height = atlas.get_height()
+    if len(new) < rows * columns:
+      atlas = self._pack_atlas(atlas, new)
+    alpha = atlas.get_flags() & SRCALPHA
+    opaque_atlas = atlas.convert() if alpha else atlas
+    # Bytes freed, of both the atlas and the opaque copy (if any).
+    pixels = atlas.get_width() * (height - atlas.get_height())
+    self._freed += pixels * atlas.get_bytesize()
+    if alpha:
+      self._freed += pixels * opaque_atlas.get_bytesize()
+    for digest, rect in new.items():
+      tile = atlas.subsurface(rect)
+      if alpha:
+        tile = self._classify_tile(tile, opaque_atlas, rect)
+      self._unique[digest] = tile
+    self._shared += rows * columns - len(new)
+    self.tiles.extend(self._unique[digest] for digest in digests)
+    self._sheets[key] = (first, rows, columns, atlas)
+    if debug.DEBUG:
+      print('[DEBUG - manager.TileManager] %s: %s tiles, %s unique in all '
+            'sheets, %s shared, %s bytes freed' % (
+                key, rows * columns, len(self._unique), self._shared,
+                self._freed))
+
+  def _pack_atlas(self, atlas, rects):
+    """Copy the tiles of rects (dictionary of tile rectangles, updated to
+    the new positions) into a new atlas with the same amount of columns and
+    only the rows needed."""
+    w, h = self.tile_size
+    columns = atlas.get_width() // w
+    rows = -(-len(rects) // columns)
+    packed = pygame.Surface((atlas.get_width(), rows * h),
+                            atlas.get_flags() & SRCALPHA, atlas)
+    for i, (digest, rect) in enumerate(list(rects.items())):
+      position = ((i % columns) * w, (i // columns) * h)
+      packed.blit(atlas, position, rect)
+      rects[digest] = position + (w, h)
+    return packed
+
+  def get_unique_count(self):
+    """Get amount of unique tiles (by pixels) in all loaded sheets."""
+    return len(self._unique)
+
+  def get_shared_count(self):
+    """Get amount of duplicate tiles sharing a canonical image."""
+    return self._shared
+
+  def get_freed_bytes(self):
+    """Get amount of pixel bytes freed by packing atlases without their
+    duplicate tiles, see _pack_atlas."""
+    return self._freed
+
+  def _classify_tile(self, tile, opaque_atlas, rect):
+    """Get the cheapest tile image to blit for a tile with alpha."""
+    visible = pygame.mask.from_surface(tile, 0).count()  # Alpha > 0.
+    if visible == 0:
+      return self.empty
+    opaque = pygame.mask.from_surface(tile, 254).count()  # Alpha = 255.
+    if opaque == tile.get_width() * tile.get_height():
+      return opaque_atlas.subsurface(rect)
+    if opaque == visible:  # Binary transparency, use a colorkey.
+      for colorkey in self._COLORKEYS:
+        if pygame.mask.from_threshold(tile, colorkey + (255,),
+                                      (1, 1, 1, 1)).count() == 0:
+          image = pygame.Surface(tile.get_size()).convert()
+          image.fill(colorkey)
+          image.blit(tile, (0, 0))
+          image.set_colorkey(colorkey, RLEACCEL)
+          return image
+    image = tile.copy()
+    image.set_alpha(255, RLEACCEL)
+    return image
 
 
 class SpriteManager():
   """Creates sprites from configuration."""
 
-  def __init__(self, config, tile_manager, audio_manager):
-    self._sprite_config = config.get_prefixed_properties('sprite')
+  def __init__(self, game_schema, tile_manager, audio_manager):
+    self._sprites = game_schema.sprites
     self._tile_manager = tile_manager
     self._audio_manager = audio_manager
+    self._static_images = {}  # Mapping key -> shared image.
+    self._tile_ids = {}  # Mapping key -> tile ids, see _get_tile_ids.
 
   def get_tile(self, key_and_position, x, y):
     """Get Tile sprite, a basic sprite that contains one image."""
     tiles = [self._tile_manager.get_tile(*key_and_position)]
     return SingleEntity(tiles, x, y)
 
+  def get_tile_image(self, key_and_position):
+    """Get (shared) tile image, used for static tiles."""
+    return self._tile_manager.get_tile(*key_and_position)
+
+  def load_sheets(self, sprite_keys, sheet_keys=()):
+    """Load tile sheets referenced by sprites and sheet keys, in one go
+    (see TileManager.load_sheets)."""
+    keys = set(sheet_keys)
+    for sprite_key in sprite_keys:
+      spec = self._sprites.get(sprite_key, None)
+      if spec is not None and spec.sheet is not None:
+        keys.add(spec.sheet)
+    self._tile_manager.load_sheets(sorted(keys))
+
+  def is_empty(self, image):
+    """Whether image is fully transparent, see TileManager.is_empty."""
+    return self._tile_manager.is_empty(image)
+
+  def get_static_image(self, mapping_key):
+    """Get shared image of a static sprite, a sprite without any
+    behaviour that can be drawn as a static tile. None is returned if the
+    sprite is not static, it must then be created with get_sprite."""
+    image = self._static_images.get(mapping_key, None)
+    if image is None:
+      spec = self._sprites[mapping_key]
+      if spec.type == 'square':
+        image = pygame.Surface((32, 32))
+        image.fill(spec.color)
+        image = image.convert()
+      elif spec.type == 'single':
+        image = self._tile_manager.get_tile(spec.sheet, spec.tiles[0])
+      else:
+        return None
+      self._static_images[mapping_key] = image
+    return image
+
   def get_sprite(self, mapping_key, x, y):
     """Get sprite from mapping key. The key represent a prefixed section,
     i.e. sprite*mapping_key."""
-    properties = self._sprite_config.get(mapping_key)
-    sprite_type = properties.get('type').lower()
+    spec = self._sprites[mapping_key]
+    sprite_type = spec.type
 
     if sprite_type == 'square':
-      return SquareEntity(properties.get_eval('color'), x, y)
+      return SquareEntity(spec.color, x, y)
     elif sprite_type == 'player':
-      return PlayerEntity(self._get_keyed_tiles('player'), x, y)
+      return PlayerEntity(self._get_keyed_tiles(spec), x, y)
     elif sprite_type == 'dynamic':
-      return DynamicEntity(self._get_tiles(properties), x, y)
+      return DynamicEntity(self._get_tiles(spec), x, y)
     elif sprite_type == 'hide_on_collide':
-      return HideOnCollideEntity(self._get_tiles(properties), x, y)
+      return HideOnCollideEntity(self._get_tiles(spec), x, y)
     elif sprite_type == 'random_hide_on_collide':
-      return RandomHideOnCollideEntity(self._get_tiles(properties), x, y)
+      return RandomHideOnCollideEntity(self._get_tiles(spec), x, y)
     elif sprite_type == 'interactive':
-      return InteractionEntity(self._get_tiles(properties), x, y)
+      return InteractionEntity(self._get_tiles(spec), x, y)
+    elif sprite_type == 'moving':
+      return MovingEntity(self._get_tiles(spec), x, y, spec.velocity)
+    elif sprite_type == 'chasing':
+      return ChasingEntity(self._get_tiles(spec), x, y, spec.speed)
     else:  # Default to Tile sprite.
-      return SingleEntity(self._get_tiles(properties), x, y)
-
-  def _get_tiles(self, sprite_properties):
-    """Get tiles from the tile property in the current sprite
-    configuration."""
-    tile_property = sprite_properties.get_eval('tile')
-    key = tile_property[0]
-    values = tile_property[1]
-    tiles = []
-    for tile in values:
-      tiles.append(self._tile_manager.get_tile(key, tile))
-    return tiles
-
-  def _get_keyed_tiles(self, key):
-    """Get keyed tiles from property in the sprite configuration.
+      return SingleEntity(self._get_tiles(spec), x, y)
+
+  def _get_tiles(self, spec):
+    """Get tiles from the tile positions in the sprite specification."""
+    tiles = self._tile_manager.tiles
+    return [tiles[i] for i in self._get_tile_ids(spec)[None]]
+
+  def _get_keyed_tiles(self, spec):
+    """Get keyed tiles from the sprite specification.
     Each tile is binded to a key, for example:
     'up': ((0,0), (0,1), ..), down: ((1,0), (1,1), ...), ..."""
-    sprite_properties = self._sprite_config.get(key)
-    tile = sprite_properties.get('tile')
-    tile_map_str = sprite_properties.get('tile.map')
-    tile_map = literal_eval(tile_map_str)
-
-    tiles = self._tile_manager.get_tiles(tile)
+    tiles = self._tile_manager.tiles
     player_mapped_tiles = {}
-    for key in list(tile_map.keys()):
-      player_mapped_tiles[key] = [tiles[y][x] for y, x in tile_map[key]]
+    for key, tile_ids in self._get_tile_ids(spec).items():
+      if key is not None:
+        player_mapped_tiles[key] = [tiles[i] for i in tile_ids]
     return player_mapped_tiles
 
+  def _get_tile_ids(self, spec):
+    """Get (cached) tile ids of a sprite specification: dict(key) ->
+    tile ids, where key None contain the ids of the tile positions and
+    the other keys the ids of the tile map."""
+    tile_ids = self._tile_ids.get(spec.key, None)
+    if tile_ids is None:
+      get_tile_id = self._tile_manager.get_tile_id
+      tile_ids = {None: [get_tile_id(spec.sheet, tile) for tile in spec.tiles]}
+      for key, positions in (spec.tile_map or {}).items():
+        tile_ids[key] = [get_tile_id(spec.sheet, tile) for tile in positions]
+      self._tile_ids[spec.key] = tile_ids
+    return tile_ids
+
 
 class AudioManager():
   """Audio manager, contain functionality for loading and playing sounds
@@ -158,21 +331,18 @@ class AudioManager():
   _MUSIC_VOL_CAPTION = 'Musik: {:.2%}'
   _VOLUME_ADJUSTMENT = 0.025
 
-  def __init__(self, config):
+  def __init__(self, game_schema):
     # Check whether the mixer is initiated.
     self._is_inited = pygame.mixer.get_init() is not None
     # Retrieve audio configuration.
-    self._audio_config = config.get_properties('audio')
+    self._audio_spec = game_schema.audio
     self._volume_delay = TimeCount(1000/10, True)  # 5fps
-    # Set default values.
-    sound_volume = self._audio_config.get('sound_volume', default=0.5)
-    self._sound_volume = float(sound_volume)
-    music_volume = self._audio_config.get('music_volume', default=0.25)
-    self._music_volume = float(music_volume)
+    self._sound_volume = self._audio_spec.sound_volume
+    self._music_volume = self._audio_spec.music_volume
     # Load sounds.
     self._sound = self._load_sound()
     # Structure available music files.
-    self._music = self._audio_config.get_eval('music')
+    self._music = self._audio_spec.music
     self._channels = {}
 
   def load_music(self, music_id):
@@ -214,7 +384,7 @@ class AudioManager():
     if pygame.mixer.get_init() is None:
       return sounds  # No sound card active.
 
-    sound_property = self._audio_config.get_eval('sound')
+    sound_property = self._audio_spec.sound
     for key in sound_property:
       sound = pygame.mixer.Sound(sound_property[key])
       if sound is not None:
@@ -277,67 +447,350 @@ class AudioManager():
 
 
 class BlockManager():
-  """Block manager. Contain a matrix of blocks contained in the map. Each
-  block contain the amount of blockage. For example, a block may only block
+  """Block manager. Contain a grid of blocks in the room, each block cover
+  a cell completely or partially (a modifier with offsets x, y, w, h that
+  is applied to the cell rectangle). For example, a block may only block
   50% of it's total area.
 
-  Instead of using a list of blocks that we iterate through EACH time the
-  player move the character (which is a frequent action) -- retrieve blocks
-  from the character grid position.
-  The implementation use a matrix and calculate the position grid and
-  retrieve these a dictionary. This is ALOT faster than iterating through
-  a list of sprites performing a collide_rect on each these.
-
-  It is a fast collusion detection. It is a performance issue when
-  performing collusion detection on alot of sprites."""
-
-  def __init__(self):
-    self.blocks = {}
-    self.currently_blocked = []
-
-  def add(self, block, x, y):
-    """Add a blocks."""
-    columns = self.blocks.get(y, None)
-    if columns is None:
-      self.blocks[y] = {x: block}
-    else:
-      columns[x] = block
-
-  def get_blocks(self):
-    """Get all blocks."""
-    return self.blocks
+  Instead of iterating through a list of blocks EACH time the player move
+  the character (which is a frequent action) -- only the cells the target
+  rectangle cover are examined. The blocks are a flat array of modifiers
+  (four offsets per cell) indexed by row * columns + column. The coverage
+  of the cells by any block (a block may extend outside of its cell) is
+  kept as a bit mask per row, one for fully and one for partially covered
+  cells. Most queries are answered by the coverage, only the blocks
+  overlapping a partially covered cell are examined when such a cell is
+  hit. The version is increased whenever the blocks change."""
+
+  _CELL = 32  # Cell size in pixels.
+
+  def __init__(self, columns=0, rows=0):
+    self.columns = columns
+    self.rows = rows
+    self._blocked = bytearray(columns * rows)
+    self._modifiers = array('h', bytes(8 * columns * rows))
+    self._full = [0] * rows  # Bit mask of fully covered cells per row.
+    self._partial = [0] * rows  # Bit mask of partially covered cells.
+    self._overlapping = {}  # Partially covered cell -> block edges.
+    # Pixels any block reach outside of its cell (left, up, right, down).
+    self._reach = (0, 0, 0, 0)
+    self.version = 0
+
+  def add(self, x, y, modifier):
+    """Add (or replace) a block on cell (x, y) with modifier (x, y, w, h).
+    A block without area never collide (as pygame.Rect) and is not
+    added."""
+    bx, by, bw, bh = modifier
+    size = self._CELL
+    if bw <= -size or bh <= -size:
+      return
+    i = y * self.columns + x
+    if self._blocked[i]:
+      self.remove(x, y)
+    self._blocked[i] = 1
+    self._modifiers[4 * i:4 * i + 4] = array('h', modifier)
+    self._cover(x, y, modifier)
+    self.version += 1
+
+  def add_grid(self, grid, modifiers):
+    """Add blocks from a grid of modifier ids (indexed by row * columns +
+    column, 0: no block) and the modifier table (id -> modifier), e.g. a
+    packed room. The cells with the same modifier are covered a row at a
+    time, with bit masks built by bytes methods."""
+    ids = get_byte_grid(grid)
+    if ids is None or len(ids) != self.columns * self.rows or\
+       self._blocked.find(1) != -1:
+      for i, modifier_id in enumerate(grid):  # One block at a time.
+        if modifier_id != 0:
+          self.add(i % self.columns, i // self.columns,
+                   modifiers[modifier_id])
+      return
+    size = self._CELL
+    present = bytearray(256)  # Modifier id -> 1 if added.
+    entries = [bytes(8)] * 256  # Modifier id -> modifier as bytes.
+    for modifier_id in range(1, min(len(modifiers), 256)):
+      bx, by, bw, bh = modifiers[modifier_id]
+      if bw > -size and bh > -size and modifier_id in ids:
+        present[modifier_id] = 1
+        entries[modifier_id] = array('h', modifiers[modifier_id]).tobytes()
+    if not any(present):
+      return
+    self._blocked = bytearray(ids.translate(present))
+    self._modifiers = array('h')
+    self._modifiers.frombytes(translate_byte_grid(ids, entries))
+    columns = self.columns
+    for modifier_id, added in enumerate(present):
+      if not added:
+        continue
+      table = bytearray(b'0' * 256)
+      table[modifier_id] = ord('1')
+      marked = ids.translate(table)  # '1' on cells with the modifier.
+      for y in range(self.rows):
+        row = marked[y * columns:(y + 1) * columns]
+        if b'1' in row:
+          self._cover_row(y, int(row[::-1], 2), modifiers[modifier_id])
+    self.version += 1
+
+  def _cover_row(self, y, mask, modifier):
+    """Add the coverage of blocks on row y, on the cells in bit mask, that
+    all have the same modifier. See _cover."""
+    bx, by, bw, bh = modifier
+    size = self._CELL
+    left, up, right, down = self._reach
+    self._reach = (max(left, -bx), max(up, -by), max(right, bx + bw),
+                   max(down, by + bh))
+    all_columns = (1 << self.columns) - 1
+    x1, y1 = bx, by  # Block of the cell (0, 0).
+    x2, y2 = x1 + size + bw, y1 + size + bh
+    cx1, cy1, cx2, cy2 = get_grid_cells((x1, y1, x2 - x1, y2 - y1), size)
+    cells = None  # Cells (x) in mask and edges of their blocks.
+    overlapping = self._overlapping
+    for dy in range(cy1, cy2):
+      cy = y + dy
+      if not 0 <= cy < self.rows:
+        continue
+      for dx in range(cx1, cx2):
+        covered = (mask << dx if dx >= 0 else mask >> -dx) & all_columns
+        if (x1 <= dx * size and y1 <= dy * size and
+            (dx + 1) * size <= x2 and (dy + 1) * size <= y2):
+          self._full[cy] |= covered
+          continue
+        self._partial[cy] |= covered
+        if cells is None:
+          cells = []
+          bits = mask
+          while bits:
+            x = (bits & -bits).bit_length() - 1
+            bits &= bits - 1
+            cells.append((x, (x * size + x1, y * size + y1, x * size + x2,
+                              y * size + y2)))
+        start = cy * self.columns + dx
+        for x, edges in cells:
+          if 0 <= x + dx < self.columns:
+            j = start + x
+            blocks = overlapping.get(j, None)
+            overlapping[j] = (edges,) if blocks is None else\
+                blocks + (edges,)
+
+  def remove(self, x, y):
+    """Remove block on cell (x, y), if any. The coverage is rebuilt."""
+    i = y * self.columns + x
+    if not self._blocked[i]:
+      return
+    self._blocked[i] = 0
+    self._modifiers[4 * i:4 * i + 4] = array('h', bytes(8))
+    self._full = [0] * self.rows
+    self._partial = [0] * self.rows
+    self._overlapping = {}
+    self._reach = (0, 0, 0, 0)
+    i = self._blocked.find(1)
+    while i != -1:
+      self._cover(i % self.columns, i // self.columns,
+                  self._modifiers[4 * i:4 * i + 4])
+      i = self._blocked.find(1, i + 1)
+    self.version += 1
+
+  def _cover(self, x, y, modifier):
+    """Add the coverage of block on cell (x, y)."""
+    bx, by, bw, bh = modifier
+    size = self._CELL
+    left, up, right, down = self._reach
+    self._reach = (max(left, -bx), max(up, -by), max(right, bx + bw),
+                   max(down, by + bh))
+    x1, y1 = x * size + bx, y * size + by
+    x2, y2 = x1 + size + bw, y1 + size + bh
+    cx1, cy1, cx2, cy2 = get_grid_cells((x1, y1, x2 - x1, y2 - y1), size)
+    for cy in range(max(cy1, 0), min(cy2, self.rows)):
+      for cx in range(max(cx1, 0), min(cx2, self.columns)):
+        if (x1 <= cx * size and y1 <= cy * size and
+            (cx + 1) * size <= x2 and (cy + 1) * size <= y2):
+          self._full[cy] |= 1 << cx
+        else:
+          self._partial[cy] |= 1 << cx
+          j = cy * self.columns + cx
+          self._overlapping[j] = self._overlapping.get(j, ()) + (
+              (x1, y1, x2, y2),)
+
+  def get_block(self, x, y):
+    """Get block rectangle on cell (x, y), None if the cell is not
+    blocked."""
+    if not (0 <= x < self.columns and 0 <= y < self.rows):
+      return None
+    i = y * self.columns + x
+    if not self._blocked[i]:
+      return None
+    bx, by, bw, bh = self._modifiers[4 * i:4 * i + 4]
+    size = self._CELL
+    return pygame.Rect(x * size + bx, y * size + by, size + bw, size + bh)
 
   def collide(self, target_rect):
     """See if target_rect is colliding with any blocks, return True
-    if that is the case.
-    TODO: print debug message?"""
-
-
-    target_blocks = get_grid_data(target_rect, self.blocks)
-    print(target_blocks)
-    if target_blocks is not None:
-      for block in target_blocks:
-        if block.collide(target_rect):
-          return True
+    if that is the case."""
+    left, top, w, h = target_rect
+    if w <= 0 or h <= 0:
+      return False
+    size = self._CELL
+    right = left + w
+    bottom = top + h
+    x1 = left // size  # Inlined get_grid_cells, this is the hot path.
+    x2 = (right - 1) // size + 1
+    y1 = top // size
+    y2 = (bottom - 1) // size + 1
+    if x1 < 0 or y1 < 0 or x2 > self.columns or y2 > self.rows:
+      # Blocks may reach outside of the grid.
+      return self._collide_blocks(left, top, right, bottom)
+    cells = ((1 << (x2 - x1)) - 1) << x1
+    full = self._full
+    partial = self._partial
+    hit = 0
+    for y in range(y1, y2):
+      if full[y] & cells:
+        return True
+      hit |= partial[y] & cells
+    if not hit:
+      return False
+    return self._collide_overlapping(left, top, right, bottom, x1, y1, x2,
+                                     y2)
+
+  def collide_many(self, target_rects):
+    """See if each of target_rects is colliding with any blocks, return a
+    list of booleans (in the same order). The bit masks of the rows a
+    rectangle cover are combined once for each span of rows and reused by
+    all rectangles covering the same rows."""
+    size = self._CELL
+    columns = self.columns
+    rows = self.rows
+    full = self._full
+    partial = self._partial
+    spans = {}  # Y1 * (rows + 1) + Y2 -> (full mask, partial mask).
+    result = []
+    append = result.append
+    for left, top, w, h in target_rects:
+      if w <= 0 or h <= 0:
+        append(False)
+        continue
+      right = left + w
+      bottom = top + h
+      x1 = left // size
+      x2 = (right - 1) // size + 1
+      y1 = top // size
+      y2 = (bottom - 1) // size + 1
+      if x1 < 0 or y1 < 0 or x2 > columns or y2 > rows:
+        append(self._collide_blocks(left, top, right, bottom))
+        continue
+      span = y1 * (rows + 1) + y2
+      masks = spans.get(span, None)
+      if masks is None:
+        full_rows = partial_rows = 0
+        for y in range(y1, y2):
+          full_rows |= full[y]
+          partial_rows |= partial[y]
+        masks = spans[span] = (full_rows, partial_rows)
+      cells = ((1 << (x2 - x1)) - 1) << x1
+      if masks[0] & cells:
+        append(True)
+      elif masks[1] & cells:
+        append(self._collide_overlapping(left, top, right, bottom, x1, y1,
+                                         x2, y2))
+      else:
+        append(False)
+    return result
+
+  def _collide_overlapping(self, left, top, right, bottom, x1, y1, x2, y2):
+    """See if rectangle (edges) is colliding with any block overlapping a
+    partially covered cell in cells x1, y1 (inclusive) to x2, y2."""
+    overlapping = self._overlapping
+    for y in range(y1 * self.columns, y2 * self.columns, self.columns):
+      for i in range(y + x1, y + x2):
+        for block_left, block_top, block_right, block_bottom in \
+            overlapping.get(i, ()):
+          if (block_left < right and block_top < bottom and
+              left < block_right and top < block_bottom):
+            return True
     return False
 
-
-class Block():
-  """A block consist of an area that completely or partially blocks the
-  character from moving."""
-
-  def __init__(self, x, y, modifier, renderer):
-    self.renderer = renderer
-    self.position_x = int(x / 32)
-    self.position_y = int(y / 32)
-    self._rect = pygame.Rect(x, y, 32, 32)
-    bx, by, bw, bh = modifier
-    self.block_rect = pygame.Rect(x + bx, y + by, 32 + bw, 32 + bh)
-
-  def collide(self, target_rect):
-    """Will retrieve blocks from a block matrix, which will be ALOT faster
-    than iterating throselfugh a list of blocks."""
-    print(target_rect, self.block_rect);
-    if self.block_rect.colliderect(target_rect):
+  def _collide_blocks(self, left, top, right, bottom):
+    """See if rectangle (edges) is colliding with any block."""
+    for _ in self._get_blocks(left, top, right, bottom):
       return True
     return False
+
+  def _get_blocks(self, left, top, right, bottom):
+    """Generate edges (left, top, right, bottom) of all blocks colliding
+    with rectangle (edges), examine the blocks in all cells that may reach
+    the rectangle."""
+    size = self._CELL
+    columns = self.columns
+    reach_left, reach_up, reach_right, reach_down = self._reach
+    x1 = max((left - reach_right) // size, 0)
+    x2 = min((right - 1 + reach_left) // size + 1, columns)
+    blocked = self._blocked
+    modifiers = self._modifiers
+    for y in range(max((top - reach_down) // size, 0),
+                   min((bottom - 1 + reach_up) // size + 1, self.rows)):
+      row = y * columns
+      cell_top = y * size
+      i = blocked.find(1, row + x1, row + x2)
+      while i != -1:
+        j = 4 * i
+        block_left = (i - row) * size + modifiers[j]
+        block_top = cell_top + modifiers[j + 1]
+        block_right = block_left + size + modifiers[j + 2]
+        block_bottom = block_top + size + modifiers[j + 3]
+        if (block_left < right and block_top < bottom and
+            left < block_right and top < block_bottom):
+          yield (block_left, block_top, block_right, block_bottom)
+        i = blocked.find(1, i + 1, row + x2)
+
+  def sweep(self, target_rect, dx, dy):
+    """Sweep target_rect along one axis, dx or dy pixels (the other must
+    be 0). Return the distance it can move until it touch a block (with
+    the same sign as the movement, 0 if it is blocked). Blocks already
+    colliding with target_rect are ignored, so it can always move out of
+    them. The whole path is examined, a large movement can not pass
+    through a block."""
+    left, top, w, h = target_rect
+    if w <= 0 or h <= 0:
+      return dx or dy
+    right = left + w
+    bottom = top + h
+    # Edges of the path, in front of target_rect.
+    if dx > 0:
+      path = (right, top, right + dx, bottom)
+    elif dx < 0:
+      path = (left + dx, top, left, bottom)
+    elif dy > 0:
+      path = (left, bottom, right, bottom + dy)
+    else:
+      path = (left, top + dy, right, top)
+    distance = dx or dy
+    # Inlined collide of the path, most paths are not blocked.
+    size = self._CELL
+    x1 = path[0] // size
+    x2 = (path[2] - 1) // size + 1
+    y1 = path[1] // size
+    y2 = (path[3] - 1) // size + 1
+    if x1 >= 0 and y1 >= 0 and x2 <= self.columns and y2 <= self.rows:
+      cells = ((1 << (x2 - x1)) - 1) << x1
+      full = partial = 0
+      for y in range(y1, y2):
+        full |= self._full[y]
+        partial |= self._partial[y]
+      if not full & cells and not (partial & cells and
+                                   self._collide_overlapping(
+                                       *(path + (x1, y1, x2, y2)))):
+        return distance
+    for block_left, block_top, block_right, block_bottom in\
+        self._get_blocks(*path):
+      if dx > 0:
+        if block_left >= right:  # Otherwise colliding already.
+          distance = min(distance, block_left - right)
+      elif dx < 0:
+        if block_right <= left:
+          distance = max(distance, block_right - left)
+      elif dy > 0:
+        if block_top >= bottom:
+          distance = min(distance, block_top - bottom)
+      elif block_bottom <= top:
+        distance = max(distance, block_bottom - top)
+    return distance
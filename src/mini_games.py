@@ -29,10 +29,9 @@ class Collector():
         self._context = context
         self._audio_manager = self._context.get_audio_manager()
         self._collected = 0
-        config = self._context.get_config()
-        self._game_config = config.get_properties('game*' + game_key)
-        self._collect_sound = self._game_config.get('collect_sound')
-        room_key = self._game_config.get('room')
+        game_spec = self._context.get_schema().get_game(game_key)
+        self._collect_sound = game_spec.collect_sound
+        room_key = game_spec.room
 
         self._room = self._build_room(context, room_key)
         self._item_amount = self._count_collectable_items(self._room)
@@ -121,7 +120,11 @@ class Collector():
 
             if self._collected < self._item_amount:
                 # Check and perform move on _player character.
-                self._player.inquire_move(self._room.block_manager)
+                self._player.inquire_move(self._room.block_manager,
+                                          clock.get_time())
+                self._room.renderer.update_movers(
+                    clock.get_time(), self._room.block_manager,
+                    navigation=self._room.navigation)
 
                 # Update view to _player sprite position.
                 self._view.update(self._player)
@@ -0,0 +1,194 @@
+# -*- coding: iso-8859-1 -*
+
+import heapq
+
+from array import array
+from collections import deque
+from utilities import LRUCache
+
+__all__ = ['Navigation', 'FlowField']
+
+"""
+Navigation (pathfinding) on the block grid of a room. A walkability grid
+is built from the blocks (see manager.BlockManager, read from matrix.block
+and blocking.map), a cell is walkable if a tile sized agent on the cell
+does not collide with any block. Agents move up, down, left and right.
+
+Paths (A*) are cached by start and goal. Flow fields are cached by target,
+a flow field is one breadth first search from the target that is shared
+by all agents heading to it (e.g. the player or a computer). The grid is
+built upon the first query, it is rebuilt and the caches cleared when the
+blocks change.
+
+Practices:
++ Comply to PEP 0008 for programming with modules, classes, methods and
+  functions (Style Guide for Python Codestyle), see:
+  https://www.python.org/dev/peps/pep-0008
++ Comply to PEP 0257 (Docstring convention), see:
+  https://www.python.org/dev/peps/pep-0257
+
+@author: Peter Borgstedt (peter.borgstedt@gmail.com)
+"""
+
+_NEIGHBOURS = ((0, -1), (0, 1), (-1, 0), (1, 0))  # Up, down, left, right.
+_UNREACHABLE = 0xFFFFFFFF  # Distance of cells that can not reach the target.
+
+
+class FlowField():
+  """Distance (in cells) from every cell to a target, unreachable cells
+  have no distance. An agent follow the field by stepping to the neighbour
+  closest to the target, see get_direction."""
+
+  def __init__(self, target, columns, rows, distances):
+    self.target = target  # Cell (x, y).
+    self.columns = columns
+    self.rows = rows
+    self._distances = distances  # Indexed by row * columns + column.
+
+  def get_distance(self, x, y):
+    """Get distance in cells from cell (x, y) to the target, None if the
+    target can not be reached."""
+    if not (0 <= x < self.columns and 0 <= y < self.rows):
+      return None
+    distance = self._distances[y * self.columns + x]
+    return None if distance == _UNREACHABLE else distance
+
+  def get_direction(self, x, y):
+    """Get direction (dx, dy) of the next step from cell (x, y) toward the
+    target, (0, 0) on the target or if it can not be reached."""
+    best = self.get_distance(x, y)
+    direction = (0, 0)
+    if best is None:
+      return direction
+    for dx, dy in _NEIGHBOURS:
+      distance = self.get_distance(x + dx, y + dy)
+      if distance is not None and distance < best:
+        best = distance
+        direction = (dx, dy)
+    return direction
+
+
+class Navigation():
+  """Navigation grid of a room, built from its block manager. Key word
+  arguments 'paths' and 'fields' are the amount of cached paths and flow
+  fields (default 256 and 16)."""
+
+  def __init__(self, block_manager, **kwargs):
+    self._block_manager = block_manager
+    self._paths = LRUCache(kwargs.get('paths', 256))
+    self._fields = LRUCache(kwargs.get('fields', 16))
+    self._version = None  # Block manager version of the grid.
+    self.columns, self.rows = block_manager.columns, block_manager.rows
+    self._walkable = bytearray()
+
+  def update(self):
+    """Build the walkability grid and clear the caches if the blocks have
+    changed since it was built, return True if built. Run once by all
+    queries."""
+    block_manager = self._block_manager
+    if block_manager.version == self._version:
+      return False
+    columns, rows = block_manager.columns, block_manager.rows
+    size = block_manager._CELL
+    walkable = bytearray(not colliding for colliding in
+                         block_manager.collide_many(
+                             (x * size, y * size, size, size)
+                             for y in range(rows) for x in range(columns)))
+    self.columns, self.rows = columns, rows
+    self._walkable = walkable
+    self._paths.clear()
+    self._fields.clear()
+    self._version = block_manager.version
+    return True
+
+  def get_cell(self, rect):
+    """Get cell (x, y) of the center of a rectangle."""
+    size = self._block_manager._CELL
+    return (rect.centerx // size, rect.centery // size)
+
+  def is_walkable(self, x, y):
+    """See if cell (x, y) is walkable."""
+    self.update()
+    return self._is_walkable(x, y)
+
+  def _is_walkable(self, x, y):
+    """See if cell (x, y) is walkable, without updating the grid."""
+    return (0 <= x < self.columns and 0 <= y < self.rows and
+            self._walkable[y * self.columns + x] == 1)
+
+  def find_path(self, start, goal):
+    """Find a shortest path (A*) from cell start to cell goal, (x, y).
+    Return a tuple of cells from start to goal, None if there is no
+    path."""
+    self.update()
+    key = (start, goal)
+    if key in self._paths:
+      return self._paths.get(key)
+    path = self._search(start, goal)
+    self._paths.put(key, path)
+    return path
+
+  def _search(self, start, goal):
+    """A* search with the manhattan distance as heuristic."""
+    if not (self._is_walkable(*start) and self._is_walkable(*goal)):
+      return None
+    columns, rows = self.columns, self.rows
+    walkable = self._walkable
+    gx, gy = goal
+    goal_index = gy * columns + gx
+    start_index = start[1] * columns + start[0]
+    came_from = {start_index: None}
+    costs = {start_index: 0}
+    heap = [(abs(gx - start[0]) + abs(gy - start[1]), 0, start_index)]
+    while heap:
+      _, cost, i = heapq.heappop(heap)
+      if i == goal_index:
+        path = []
+        while i is not None:
+          path.append((i % columns, i // columns))
+          i = came_from[i]
+        return tuple(reversed(path))
+      if cost > costs[i]:
+        continue  # Already reached with a lower cost.
+      x, y = i % columns, i // columns
+      cost += 1
+      for dx, dy in _NEIGHBOURS:
+        nx, ny = x + dx, y + dy
+        j = ny * columns + nx
+        if (0 <= nx < columns and 0 <= ny < rows and walkable[j] and
+            cost < costs.get(j, cost + 1)):
+          costs[j] = cost
+          came_from[j] = i
+          heapq.heappush(heap, (cost + abs(gx - nx) + abs(gy - ny), cost,
+                                j))
+    return None
+
+  def get_flow_field(self, target):
+    """Get flow field (see FlowField) toward cell target (x, y)."""
+    self.update()
+    field = self._fields.get(target)
+    if field is None:
+      field = self._build_flow_field(target)
+      self._fields.put(target, field)
+    return field
+
+  def _build_flow_field(self, target):
+    """Breadth first search from target over all walkable cells."""
+    columns, rows = self.columns, self.rows
+    walkable = self._walkable
+    distances = array('I', [_UNREACHABLE]) * (columns * rows)
+    if self._is_walkable(*target):
+      x, y = target
+      distances[y * columns + x] = 0
+      queue = deque([target])
+      while queue:
+        x, y = queue.popleft()
+        distance = distances[y * columns + x] + 1
+        for dx, dy in _NEIGHBOURS:
+          nx, ny = x + dx, y + dy
+          j = ny * columns + nx
+          if (0 <= nx < columns and 0 <= ny < rows and walkable[j] and
+              distances[j] == _UNREACHABLE):
+            distances[j] = distance
+            queue.append((nx, ny))
+    return FlowField(target, columns, rows, distances)
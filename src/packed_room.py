@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+# -*- coding: iso-8859-1 -*
+
+import marshal
+import mmap
+import os
+import struct
+import sys
+
+from array import array
+
+__all__ = ['PackedRoom', 'load_room', 'get_room_file']
+
+"""
+Binary packed room format. Rooms are converted from the configuration
+matrices (see schema.RoomSpec) into compact grids that are read directly,
+without any text parsing or literal evaluation. A room is converted the
+first time it is loaded (see load_room), convert all rooms in the
+configuration at once with:
+  python3 packed_room.py
+
+File layout (little endian):
+  header: magic, version, source hash (sha1 of the configuration),
+          room key, legend and modifier table (marshal), layer count.
+  layers: for each layer: layer index, columns, rows and a uint16 grid with
+          legend ids (0: empty).
+  blocks: columns, rows and a uint16 grid with modifier ids (0: no block).
+Grids are 2-byte aligned so they can be used directly from a memory map.
+
+Practices:
++ Comply to PEP 0008 for programming with modules, classes, methods and
+  functions (Style Guide for Python Codestyle), see:
+  https://www.python.org/dev/peps/pep-0008
++ Comply to PEP 0257 (Docstring convention), see:
+  https://www.python.org/dev/peps/pep-0257
+
+@author: Peter Borgstedt (peter.borgstedt@gmail.com)
+"""
+
+_MAGIC = b'HHROOM'
+_VERSION = 1
+_HEADER = struct.Struct('<6sH40s')
+_SIZE = struct.Struct('<I')
+_GRID = struct.Struct('<iII')  # Layer index, columns, rows.
+_ROOM_DIRECTORY = 'rooms'
+_SUFFIX = '.room'
+
+
+class PackedRoom():
+  """Room grids. Each layer is (layer, columns, rows, grid) where grid is
+  a flat sequence of legend ids indexed by row * columns + column. The
+  legend contain the original matrix cell for each id, the blocks grid
+  contain ids in the modifier table (block modifiers: x, y, w, h)."""
+
+  def __init__(self, key, layers, blocks, legend, modifiers, **kwargs):
+    self.key = key
+    self.layers = layers
+    self.blocks = blocks  # (columns, rows, grid)
+    self.legend = legend  # Legend id -> matrix cell, id 0 is empty.
+    self.modifiers = modifiers  # Modifier id -> modifier, id 0 is None.
+    self.source_hash = kwargs.get('source_hash', None)
+    self._mmap = kwargs.get('buffer', None)
+
+  @staticmethod
+  def from_spec(spec, **kwargs):
+    """Pack room specification (schema.RoomSpec)."""
+    legend_ids = {None: 0}
+    legend = [None]
+    layers = []
+    for layer, matrix in spec.layers:
+      rows = len(matrix)
+      columns = len(matrix[0]) if rows > 0 else 0
+      grid = array('H', bytes(2 * columns * rows))
+      for y, row in enumerate(matrix):
+        offset = y * columns
+        for x, cell in enumerate(row[:columns]):
+          cell_id = legend_ids.get(cell, None)
+          if cell_id is None:
+            if len(legend) > 0xFFFF:
+              raise ValueError('Room \'%s\' has too many distinct cells' %
+                               spec.key)
+            legend_ids[cell] = cell_id = len(legend)
+            legend.append(cell)
+          grid[offset + x] = cell_id
+      layers.append((layer, columns, rows, grid))
+
+    modifier_ids = {None: 0}
+    modifiers = [None]
+    matrix = spec.block_matrix
+    rows = len(matrix)
+    columns = max([len(row) for row in matrix] or [0])
+    grid = array('H', bytes(2 * columns * rows))
+    for y, row in enumerate(matrix):
+      for x, cell in enumerate(row):
+        modifier = spec.blocking_map.get(cell, None)
+        if not isinstance(modifier, tuple):
+          continue
+        modifier_id = modifier_ids.get(modifier, None)
+        if modifier_id is None:
+          if len(modifiers) > 0xFFFF:
+            raise ValueError('Room \'%s\' has too many distinct blocks' %
+                             spec.key)
+          modifier_ids[modifier] = modifier_id = len(modifiers)
+          modifiers.append(modifier)
+        grid[y * columns + x] = modifier_id
+    return PackedRoom(spec.key, layers, (columns, rows, grid), tuple(legend),
+                      tuple(modifiers), **kwargs)
+
+  def save(self, path):
+    """Write packed room to file."""
+    with open(path, 'wb') as f:
+      self.write(f)
+
+  def write(self, f):
+    """Write packed room to (binary) file object, it must be written on
+    an even file position to keep grids aligned."""
+    source_hash = (self.source_hash or '').encode('ascii')
+    meta = marshal.dumps((self.key, self.legend, self.modifiers))
+    start = f.tell()
+    f.write(_HEADER.pack(_MAGIC, _VERSION, source_hash))
+    f.write(_SIZE.pack(len(meta)))
+    f.write(meta)
+    f.write(b'\0' * ((f.tell() - start) % 2))  # Align grids.
+    f.write(_SIZE.pack(len(self.layers)))
+    for layer, columns, rows, grid in self.layers:
+      f.write(_GRID.pack(layer, columns, rows))
+      f.write(_to_little_endian(grid))
+    columns, rows, grid = self.blocks
+    f.write(_GRID.pack(0, columns, rows))
+    f.write(_to_little_endian(grid))
+
+  @staticmethod
+  def load(path):
+    """Load packed room from file. The file is memory mapped and the
+    grids are views into the memory map (no copying) on little endian
+    machines."""
+    with open(path, 'rb') as f:
+      buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+      packed, _ = PackedRoom.read(memoryview(buffer), 0, buffer=buffer)
+    except ValueError as e:
+      buffer.close()
+      raise ValueError('%s: %s' % (e, path))
+    return packed
+
+  @staticmethod
+  def read(view, start, **kwargs):
+    """Read packed room from memory view at (even) offset start, return
+    packed room and the offset after it. The grids are views into the
+    memory view, it must be kept open while the room is used."""
+    try:
+      magic, version, source_hash = _HEADER.unpack_from(view, start)
+      if magic != _MAGIC or version != _VERSION:
+        raise ValueError('Not a packed room (version %s)' % _VERSION)
+      offset = start + _HEADER.size
+      meta_size, = _SIZE.unpack_from(view, offset)
+      offset += _SIZE.size
+      key, legend, modifiers = marshal.loads(view[offset:offset + meta_size])
+      offset += meta_size
+      offset += (offset - start) % 2
+      layer_count, = _SIZE.unpack_from(view, offset)
+      offset += _SIZE.size
+      layers = []
+      for _ in range(layer_count):
+        layer, columns, rows, grid, offset = _read_grid(view, offset)
+        layers.append((layer, columns, rows, grid))
+      _, columns, rows, grid, offset = _read_grid(view, offset)
+    except (TypeError, EOFError, struct.error) as e:
+      raise ValueError('Corrupt packed room (%s)' % e)
+    return PackedRoom(key, layers, (columns, rows, grid), legend, modifiers,
+                      source_hash=source_hash.decode('ascii') or None,
+                      **kwargs), offset
+
+  def close(self):
+    """Release memory map (if loaded from file). The grids are released
+    with it, copy a grid (e.g. array('H', grid)) to keep it. Raise
+    BufferError naming the grid if a view made from it is still held."""
+    if self._mmap is not None:
+      grids = [('layer %s' % layer, grid)
+               for layer, _, _, grid in self.layers]
+      grids.append(('blocks', self.blocks[2]))
+      self.layers = []
+      self.blocks = (0, 0, ())
+      for name, grid in grids:
+        if not isinstance(grid, memoryview):
+          continue  # Copied (big endian).
+        try:
+          grid.release()
+        except BufferError:
+          raise BufferError('Packed room \'%s\' can not be closed, a view '
+                            'of its %s grid is still held' % (self.key, name))
+      try:
+        self._mmap.close()
+      except BufferError:
+        raise BufferError('Packed room \'%s\' can not be closed, a view '
+                          'of one of its grids is still held' % self.key)
+      self._mmap = None
+
+
+def _to_little_endian(grid):
+  """Get grid as little endian bytes."""
+  if sys.byteorder == 'little':
+    return grid.tobytes()
+  swapped = array('H', grid)
+  swapped.byteswap()
+  return swapped.tobytes()
+
+
+def _read_grid(view, offset):
+  """Read a grid, return layer, columns, rows, grid and the new offset."""
+  layer, columns, rows = _GRID.unpack_from(view, offset)
+  offset += _GRID.size
+  end = offset + 2 * columns * rows
+  if end > len(view):
+    raise ValueError('Packed room is truncated')
+  if sys.byteorder == 'little':
+    grid = view[offset:end].cast('H')
+  else:
+    grid = array('H', view[offset:end].tobytes())
+    grid.byteswap()
+  return layer, columns, rows, grid, end
+
+
+def get_room_file(config, key):
+  """Get path of packed room file, located in the rooms directory next
+  to the configuration file."""
+  directory = os.path.dirname(os.path.realpath(config.get_source_file()))
+  return os.path.join(directory, _ROOM_DIRECTORY, key + _SUFFIX)
+
+
+def load_room(config, spec, **kwargs):
+  """Load packed room for room specification. The room is taken from the
+  asset bundle (key word argument 'bundle') or the packed room file if it
+  exist and was converted from the current configuration, otherwise the
+  room is packed from the specification and written to the packed room
+  file, to be loaded from it next time."""
+  source_hash = config.get_source_hash()
+  bundle = kwargs.get('bundle', None)
+  if bundle is not None:
+    packed = bundle.get_room(spec.key)
+    if packed is not None and packed.source_hash == source_hash:
+      return packed
+  if config.get_source_file() is not None:
+    try:
+      packed = PackedRoom.load(get_room_file(config, spec.key))
+      if packed.key == spec.key and packed.source_hash == source_hash:
+        return packed
+      packed.close()  # Stale, configuration has changed.
+    except (OSError, ValueError):
+      pass  # No (valid) packed room, pack in memory instead.
+  packed = PackedRoom.from_spec(spec, source_hash=source_hash)
+  if config.get_source_file() is not None and source_hash is not None:
+    _store(packed, get_room_file(config, spec.key))
+  return packed
+
+
+def _store(packed, path):
+  """Write packed room file. Failing to write it (for example a read-only
+  installation) is not an error, the room is then packed on each start."""
+  tmp_file = path + '.tmp'
+  try:
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+      os.makedirs(directory)
+    packed.save(tmp_file)
+    os.replace(tmp_file, path)  # Atomic on all platforms.
+  except OSError:
+    try:
+      os.remove(tmp_file)
+    except OSError:
+      pass
+
+
+def convert(config, game_schema):
+  """Convert all rooms in configuration to packed room files."""
+  source_hash = config.get_source_hash()
+  for key in sorted(game_schema.rooms.keys()):
+    path = get_room_file(config, key)
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+      os.makedirs(directory)
+    PackedRoom.from_spec(game_schema.get_room(key),
+                         source_hash=source_hash).save(path)
+    print('Converted room \'%s\' -> %s' % (key, path))
+
+
+if __name__ == '__main__':
+  from config_reader import ConfigReader
+  from schema import Schema
+  conf = os.path.join(os.path.dirname(os.path.realpath(__file__)),
+                      'hack_and_hijack.conf')
+  conf_config = ConfigReader.read_config(conf)
+  convert(conf_config, Schema.compile(conf_config))
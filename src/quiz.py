@@ -27,8 +27,7 @@ class Quizz():
 
   def __init__(self, context):
     self._context = context
-    config = context.get_config()
-    self._config = config.get_prefixed_properties('quizz')
+    self._question_specs = context.get_schema().questions
     self._text_font = context.get_font('clacon', 21)
     self._led_font = context.get_font('digital', 40)
     self._build_quizz()
@@ -38,10 +37,9 @@ class Quizz():
     return choice(self.questions).clue
 
   def _build_quizz(self):
-    """Build quizz context."""
-    self.questions = []
-    for key in self._config.get_keys():
-      self.questions.append(Question(self._config.get(key)))
+    """Build quizz context. Questions are schema.QuestionSpec records
+    (question, answer, choices and clue)."""
+    self.questions = list(self._question_specs)
 
   def run(self):
     """Run quizz."""
@@ -125,13 +123,3 @@ class Quizz():
     font_rect = (x, y, 32*6, 32)
     screen.blit(background, (x, y), font_rect)
     screen.blit(font_render, (x, y))
-
-
-class Question():
-  """Contain question, answers, a correct answer and a clue."""
-
-  def __init__(self, properties):
-    self.question = properties.get('question')
-    self.answer = properties.get('answer')
-    self.choices = properties.get_eval('choices')
-    self.clue = properties.get('clue')
@@ -1,11 +1,14 @@
 # -*- coding: iso-8859-1 -*
 
 import pygame
-from manager import BlockManager, Block
-from ast import literal_eval
+import packed_room
+from array import array
+from manager import BlockManager
+from navigation import Navigation
 from sprites import DirtyLayerGrid
+from utilities import LRUCache, get_byte_grid, translate_byte_grid
 
-__all__ = ['Room']
+__all__ = ['Room', 'ChunkedRoomSurface', 'RingRoomSurface']
 
 """
 A module containing context for a room/map/level.
@@ -26,19 +29,24 @@ class Room():
   all necessary to render and interact with it."""
 
   def __init__(self, prefix_section, context):
-    config = context.get_config()
-    self.properties = config.get_properties("room*" + prefix_section)
+    self.spec = context.get_schema().get_room(prefix_section)
+    self._config = context.get_config()
+    self._bundle = context.get_bundle()
+    self._render_spec = context.get_schema().render
     self.renderer = DirtyLayerGrid(prefix_section)
     self.block_manager = BlockManager()
     self.read(context.get_sprite_manager())
 
   def read(self, sprite_manager):
-    """Read blocks and sprites for this room. Build the data structure.
-    TODO: Optimize identical sprites with different positions,
-    TODO: Map sprite to positions.
-    """
-    self.read_blocks()
-    layer_sizes = self.read_sprites(sprite_manager)
+    """Read blocks and sprites for this room. Build the data structure."""
+    packed = packed_room.load_room(self._config, self.spec,
+                                   bundle=self._bundle)
+    self.read_blocks(packed)
+    sprite_manager.load_sheets(self.spec.sprite_map.values(),
+                               self._get_sheet_keys())
+    layer_sizes = self.read_sprites(sprite_manager, packed)
+    packed.close()
+    self.renderer.build_occlusion()
     w = h = 0
     for key in list(layer_sizes.keys()):
       layer_size = layer_sizes[key]
@@ -46,63 +54,92 @@ class Room():
       h = layer_size[1] if layer_size[1] > h else h
     self.size = ((w, h))
 
-  def read_sprites(self, sprite_manager):
-    """Read and create sprites (with sprite_manager) add these to the
-    renderer."""
-    matrix = self.properties.get_prefixed('matrix.layer', '.')
-    sprite_map = self.properties.get_eval('sprite.map', default={})
-    tile_map = self.properties.get_eval('tile.map', default={})
+  def read_sprites(self, sprite_manager, packed):
+    """Read static tiles and create sprites (with sprite_manager) add these
+    to the renderer. Each distinct cell in the legend is resolved once,
+    static tiles and sprites are added as shared tile images (flyweights)
+    and only interactive or dynamic sprites are created as sprites."""
+    tile_ids = [0] * len(packed.legend)  # Legend id -> tile id.
+    sprite_keys = {}  # Legend id -> sprite mapping key.
+    for cell_id, cell in enumerate(packed.legend):
+      resolved = self._resolve_cell(cell)
+      if resolved is None:
+        continue  # Cell is not mapped (or empty), skip it.
+      is_tile, key = resolved
+      if is_tile:
+        image = sprite_manager.get_tile_image(key)
+      else:
+        image = sprite_manager.get_static_image(key)
+        if image is None:
+          sprite_keys[cell_id] = key
+          continue
+      if image is not None and not sprite_manager.is_empty(image):
+        tile_ids[cell_id] = self.renderer.get_tile_id(image)
 
     layer_sizes = {}
-    for layer in sorted(matrix.keys()):
-      layer_matrix_str = matrix[layer]
-      layer_matrix = literal_eval(layer_matrix_str)
-      layer_sizes[layer] = (len(layer_matrix[0]) * 32,
-                            len(layer_matrix) * 32)
-      x = y = 0
-      for row in layer_matrix:
-        for column in row:
-          key = tile_map.get(column, None)
-          if key:
-            sprite = sprite_manager.get_tile(key, x, y)
-            self.renderer.add(sprite, layer=int(layer))
-          else:
-            key = sprite_map.get(column, None)
-            if key:
-              self._set_sprite(sprite_manager, key, x, y, layer)
-            elif isinstance(column, tuple):
-              z, i = column
-              z = tile_map.get(z, None)
-              sprite = sprite_manager.get_tile((z, i), x, y)
-              self.renderer.add(sprite, layer=int(layer))
-          x += 32
-        y += 32
-        x = 0
+    for layer, columns, rows, _ in packed.layers:
+      layer_sizes[layer] = (columns * 32, rows * 32)
+    grid_columns = max([w for w, _ in layer_sizes.values()] or [0]) // 32
+    grid_rows = max([h for _, h in layer_sizes.values()] or [0]) // 32
+    self.renderer.set_grid_size(grid_columns, grid_rows)
+
+    for layer, columns, rows, grid in packed.layers:
+      tiles = self.renderer.get_tile_layer(layer)
+      ids = get_byte_grid(grid)  # Scanned and mapped in bulk if not None.
+      mapped = _map_grid(grid, ids, tile_ids)
+      if columns == grid_columns:
+        tiles[:len(mapped)] = mapped
+      else:
+        for y in range(rows):
+          start = y * grid_columns
+          tiles[start:start + columns] = mapped[y * columns:
+                                                (y + 1) * columns]
+      for i, key in _find_cells(grid, ids, sprite_keys):
+        x, y = (i % columns) * 32, (i // columns) * 32
+        self._set_sprite(sprite_manager, key, x, y, layer)
     return layer_sizes
 
-  def read_blocks(self):
-    """Read blocks and add these to block_manager."""
-    blocking_matrix = self.properties.get_eval('matrix.block', default={})
-    blocking_map = self.properties.get_eval('blocking.map', default={})
-
-    x = y = 0
-    for row in blocking_matrix:
-      for column in row:
-        block_key = blocking_map.get(column, None)
-        if block_key:
-          if isinstance(block_key, tuple):
-            block = Block(x, y, block_key, self.renderer)
-            self.block_manager.add(block, x/32, y/32)
-        x += 32
-      y += 32
-      x = 0
+  def _get_sheet_keys(self):
+    """Get keys of the tile sheets referenced by the tile map."""
+    keys = set()
+    for value in self.spec.tile_map.values():
+      if isinstance(value, tuple):
+        keys.add(value[0])
+      elif value is not None:
+        keys.add(value)
+    return keys
+
+  def _resolve_cell(self, cell):
+    """Resolve matrix cell to (True, (tile key, position)) for tiles or
+    (False, sprite key) for sprites, None if cell is not mapped."""
+    tile_map = self.spec.tile_map
+    key = tile_map.get(cell, None)
+    if key:
+      return (True, key)
+    key = self.spec.sprite_map.get(cell, None)
+    if key:
+      return (False, key)
+    if isinstance(cell, tuple):
+      z, i = cell
+      z = tile_map.get(z, None)
+      if z is not None:
+        return (True, (z, i))
+    return None
+
+  def read_blocks(self, packed):
+    """Read blocks into a new block_manager and create the navigation
+    (see navigation.Navigation) of it, its grid is built upon first use."""
+    columns, rows, grid = packed.blocks
+    self.block_manager = BlockManager(columns, rows)
+    self.block_manager.add_grid(grid, packed.modifiers)
+    self.navigation = Navigation(self.block_manager)
 
   def _set_sprite(self, sprite_manager, key, x, y, layer):
     """Create and set sprite in renderer from mapping key, location and
     layer."""
     if key is not None:
       sprite = sprite_manager.get_sprite(key, x, y)
-      self.renderer.add(sprite, layer=int(layer))
+      self.renderer.add(sprite, layer=layer)
 
   def get_size(self):
     """Get size of room surface to be rendered."""
@@ -111,7 +148,337 @@ class Room():
   def get_rendered_surface(self):
     """Get a full rendered surface of the room."""
     surface = pygame.Surface(self.get_size())
-    surface.fill((32, 32, 32))
+    surface.fill(self.renderer._BACKGROUND)
     surface = surface.convert()
     self.renderer.draw_all(surface)
     return surface.convert()
+
+  def create_surface(self):
+    """Create the surface the room is rendered on, depending on render
+    mode: a full rendered surface, a ChunkedRoomSurface or a
+    RingRoomSurface."""
+    if self._render_spec.mode == 'chunked':
+      return ChunkedRoomSurface(self.renderer, self.get_size(),
+                                self._render_spec)
+    if self._render_spec.mode == 'ring':
+      return RingRoomSurface(self.renderer, self.get_size())
+    return self.get_rendered_surface()
+
+
+class ChunkedRoomSurface():
+  """Room surface split into chunks, only chunks near the view are
+  rendered and kept in memory. Chunks ahead in the direction of movement
+  are prefetched (one chunk each update) and the least recently used
+  chunks are evicted when the memory budget is exceeded. The cost of a
+  chunk is its surface and the baked chunks of the renderer located in it
+  (see DirtyLayerGrid.get_baked_bytes), these are released with it.
+
+  Works as a surface for the renderer (blit), blits on chunks that are not
+  loaded are dropped, the chunk is rendered with the current state when
+  it is loaded."""
+
+  def __init__(self, renderer, size, render_spec):
+    self._renderer = renderer
+    self._size = size
+    self._rect = pygame.Rect((0, 0), size)
+    self._chunk_size = render_spec.chunk_size * 32
+    self._prefetch = render_spec.prefetch
+    self._budget = render_spec.budget * 1024 * 1024
+    # Key -> (surface, key), the cost include the baked bytes of the key.
+    self._chunks = LRUCache(self._budget, cost=self._get_cost,
+                            on_evict=self._evict)
+    self._baked = {}  # Key -> bytes of the baked chunks located in it.
+    self._bake_count = None  # Bake count of the renderer when counted.
+    self._renderer.clear_dirty()  # Chunks are rendered when loaded.
+    self._view = None  # Last view rectangle.
+    self._direction = (0, 0)  # Last direction of movement (X, Y).
+
+  def get_size(self):
+    return self._size
+
+  def blit(self, source, dest, area=None, special_flags=0):
+    """Blit source on all loaded chunks it overlap."""
+    w, h = source.get_size() if area is None else (area[2], area[3])
+    x, y = dest[0], dest[1]
+    size = self._chunk_size
+    for cy in range(max(y // size, 0), (y + h - 1) // size + 1):
+      for cx in range(max(x // size, 0), (x + w - 1) // size + 1):
+        chunk = self._chunks.get((cx, cy))
+        if chunk is not None:
+          chunk[0].blit(source, (x - cx * size, y - cy * size), area,
+                     special_flags)
+    return pygame.Rect(x, y, w, h)
+
+  def blits(self, blit_sequence, doreturn=True):
+    """Blit a sequence of (source, dest[, area[, special_flags]])."""
+    rects = [self.blit(*blit) for blit in blit_sequence]
+    return rects if doreturn else None
+
+  def blit_view(self, target, position, area):
+    """Blit area of the room on target at position (see View.get_rect),
+    the chunks are loaded and prefetched first."""
+    size = self._chunk_size
+    for key in self.update(area):
+      chunk_rect = pygame.Rect(key[0] * size, key[1] * size, size, size)
+      clip = chunk_rect.clip(area)
+      target.blit(self._chunks.get(key)[0],
+                  (position[0] + clip.x - area.x,
+                   position[1] + clip.y - area.y),
+                  clip.move(-chunk_rect.x, -chunk_rect.y))
+
+  def update(self, view_rect):
+    """Load chunks in view and prefetch one chunk ahead in the direction
+    of movement, return keys of the chunks in view."""
+    if self._view is not None and view_rect.topleft != self._view.topleft:
+      self._direction = ((view_rect.x > self._view.x) -
+                         (view_rect.x < self._view.x),
+                         (view_rect.y > self._view.y) -
+                         (view_rect.y < self._view.y))
+    self._view = pygame.Rect(view_rect)
+
+    visible = self._get_chunk_keys(view_rect)
+    # Chunks in view must fit, no matter the budget.
+    self._chunks.budget = max(self._budget,
+                              (len(visible) + 1) * self._get_max_cost())
+    for key in visible:
+      if self._chunks.get(key) is None:
+        self._load(key)
+
+    distance = self._prefetch * self._chunk_size
+    dx, dy = self._direction
+    if distance > 0 and (dx or dy):
+      ahead = view_rect.move(dx * distance, dy * distance)
+      for key in self._get_chunk_keys(ahead):
+        if key not in self._chunks:
+          self._load(key)
+          break  # Spread prefetching over several updates.
+    if self._renderer.get_bake_count() != self._bake_count:
+      self._count_baked()
+    return visible
+
+  def _get_cost(self, chunk):
+    """Get memory size of a chunk (surface, key) and the baked chunks
+    located in it."""
+    return _get_surface_bytes(chunk[0]) + self._baked.get(chunk[1], 0)
+
+  def _get_max_cost(self):
+    """Get the largest possible cost of a chunk: the surface and baked
+    chunks of all bands (4 bytes per pixel)."""
+    size = self._chunk_size
+    span = self._renderer._CHUNK * 32
+    baked = -(-size // span) * span  # Baked chunks located in a chunk.
+    bands = len(self._renderer._get_bands())
+    return 4 * (size * size + bands * baked * baked)
+
+  def _count_baked(self):
+    """Count the baked chunks of the renderer in the chunks they are
+    located in (top left), chunks are evicted if the budget is exceeded.
+    Baked chunks located in chunks that are not loaded are released, e.g.
+    baked when repainting a sprite moving outside of the view."""
+    self._bake_count = self._renderer.get_bake_count()
+    size = self._chunk_size
+    baked = {}
+    for (x, y), baked_bytes in self._renderer.get_baked_bytes().items():
+      key = (x // size, y // size)
+      baked[key] = baked.get(key, 0) + baked_bytes
+    changed = set(self._baked.keys()) | set(baked.keys())
+    self._baked = baked
+    for key in changed:
+      if key in self._chunks:
+        self._chunks.update_cost(key)
+      elif key in baked:
+        self._evict(key, None)
+
+  def _get_chunk_keys(self, rect):
+    """Get keys (X-chunk, Y-chunk) of chunks overlapping rect."""
+    rect = rect.clip(self._rect)
+    if rect.width == 0 or rect.height == 0:
+      return []
+    size = self._chunk_size
+    return [(cx, cy)
+            for cy in range(rect.y // size, (rect.bottom - 1) // size + 1)
+            for cx in range(rect.x // size, (rect.right - 1) // size + 1)]
+
+  def _load(self, key):
+    """Render chunk and put it in the cache."""
+    size = self._chunk_size
+    rect = pygame.Rect(key[0] * size, key[1] * size, size, size)
+    rect = rect.clip(self._rect)
+    surface = pygame.Surface(rect.size).convert()
+    surface.fill(self._renderer._BACKGROUND)
+    self._renderer.draw_region(surface, rect)
+    self._chunks.put(key, (surface, key))
+
+  def _evict(self, key, _chunk):
+    """Release baked tiles of the renderer in evicted chunk."""
+    size = self._chunk_size
+    self._renderer.release_region(pygame.Rect(key[0] * size, key[1] * size,
+                                              size, size))
+    self._baked.pop(key, None)
+
+
+class RingRoomSurface():
+  """Room surface of a back buffer slightly larger than the view (one
+  tile in each direction), used as a wrap-around ring: room position
+  (x, y) is kept on buffer position (x % width, y % height). The buffer
+  cover a tile aligned area of the room, when the view scroll outside of
+  it the area is moved and only the newly exposed rows and columns are
+  rendered. Memory depend on the view size, not the room size.
+
+  Works as a surface for the renderer (blit), blits outside of the
+  covered area are dropped, the area is rendered with the current state
+  when it is exposed."""
+
+  def __init__(self, renderer, size):
+    self._renderer = renderer
+    self._size = size
+    self._rect = pygame.Rect((0, 0), size)
+    self._buffer = None  # Created on first view, see _allocate.
+    self._covered = pygame.Rect(0, 0, 0, 0)  # Room area in buffer.
+    self._renderer.clear_dirty()  # Areas are rendered when exposed.
+
+  def get_size(self):
+    return self._size
+
+  def blit(self, source, dest, area=None, special_flags=0):
+    """Blit source on the part of the buffer it overlap, wrapped."""
+    x, y = dest[0], dest[1]
+    if area is None:
+      ax, ay = 0, 0
+      w, h = source.get_size()
+    else:
+      ax, ay, w, h = area
+    rect = pygame.Rect(x, y, w, h)
+    if self._buffer is not None:
+      for piece, position in self._split(rect.clip(self._covered)):
+        self._buffer.blit(source, position, (ax + piece.x - x,
+                                             ay + piece.y - y,
+                                             piece.w, piece.h),
+                          special_flags)
+    return rect
+
+  def blits(self, blit_sequence, doreturn=True):
+    """Blit a sequence of (source, dest[, area[, special_flags]])."""
+    rects = [self.blit(*blit) for blit in blit_sequence]
+    return rects if doreturn else None
+
+  def blit_view(self, target, position, area):
+    """Blit area of the room on target at position (see View.get_rect),
+    in at most four blits. The covered area is moved first if the area is
+    not within it."""
+    clip = area.clip(self._rect)
+    if clip.width == 0 or clip.height == 0:
+      return
+    self.update(clip)
+    x, y = position[0] - area.x, position[1] - area.y
+    for piece, buffer_position in self._split(clip):
+      target.blit(self._buffer, (x + piece.x, y + piece.y),
+                  pygame.Rect(buffer_position, piece.size))
+
+  def update(self, view_rect):
+    """Move the covered area (tile aligned) to contain the view rectangle
+    and render newly exposed rows and columns."""
+    if self._buffer is None:
+      self._allocate(view_rect.size)
+    if self._covered.contains(view_rect):
+      return
+    w, h = self._buffer.get_size()
+    room_w, room_h = self._size
+    covered = pygame.Rect(
+        max(0, min(view_rect.x // 32 * 32, -(-room_w // 32) * 32 - w)),
+        max(0, min(view_rect.y // 32 * 32, -(-room_h // 32) * 32 - h)),
+        w, h)
+    exposed = self._get_exposed(self._covered, covered)
+    self._covered = covered
+    for rect in exposed:
+      self._render(rect)
+    # Keep baked chunks near the covered area only.
+    self._renderer.retain_region(covered.inflate(w, h))
+
+  def _allocate(self, view_size):
+    """Create the buffer for a view size, whole tiles and one extra tile
+    in each direction, no larger than the room."""
+    w = min(-(-view_size[0] // 32) + 1, -(-self._size[0] // 32)) * 32
+    h = min(-(-view_size[1] // 32) + 1, -(-self._size[1] // 32)) * 32
+    self._buffer = pygame.Surface((w, h)).convert()
+
+  @staticmethod
+  def _get_exposed(old, new):
+    """Get rectangles of the new area that are not in the old area, at
+    most one column and one row strip on each side."""
+    if not old.colliderect(new):
+      return [new]
+    exposed = []
+    if new.x < old.x:
+      exposed.append(pygame.Rect(new.x, new.y, old.x - new.x, new.h))
+    if new.right > old.right:
+      exposed.append(pygame.Rect(old.right, new.y, new.right - old.right,
+                                 new.h))
+    x = max(new.x, old.x)
+    w = min(new.right, old.right) - x
+    if new.y < old.y:
+      exposed.append(pygame.Rect(x, new.y, w, old.y - new.y))
+    if new.bottom > old.bottom:
+      exposed.append(pygame.Rect(x, old.bottom, w, new.bottom - old.bottom))
+    return exposed
+
+  def _render(self, rect):
+    """Render area of the room into the buffer, wrapped."""
+    for piece, position in self._split(rect.clip(self._rect)):
+      surface = self._buffer.subsurface(pygame.Rect(position, piece.size))
+      surface.fill(self._renderer._BACKGROUND)
+      self._renderer.draw_region(surface, piece)
+
+  def _split(self, rect):
+    """Split a rectangle within the covered area where it wrap around the
+    buffer: [(rectangle, buffer position)], at most four."""
+    if rect.width == 0 or rect.height == 0:
+      return []
+    w, h = self._buffer.get_size()
+    bx, by = rect.x % w, rect.y % h
+    w1, h1 = min(rect.w, w - bx), min(rect.h, h - by)
+    pieces = []
+    for x, pw, px in ((rect.x, w1, bx), (rect.x + w1, rect.w - w1, 0)):
+      for y, ph, py in ((rect.y, h1, by), (rect.y + h1, rect.h - h1, 0)):
+        if pw > 0 and ph > 0:
+          pieces.append((pygame.Rect(x, y, pw, ph), (px, py)))
+    return pieces
+
+
+def _map_grid(grid, ids, table):
+  """Map a grid of ids with table (id -> uint16 value), return an
+  array('H'). Ids of bytes (see utilities.get_byte_grid) are mapped in
+  bulk."""
+  if ids is None:
+    return array('H', map(table.__getitem__, grid))
+  values = list(table[:256]) + [0] * (256 - len(table))
+  mapped = array('H')
+  mapped.frombytes(translate_byte_grid(
+      ids, [array('H', (value,)).tobytes() for value in values]))
+  return mapped
+
+
+def _find_cells(grid, ids, keys):
+  """Find cells in a grid with ids in keys (id -> key), return sorted
+  [(index, key), ...]. Ids of bytes are found with bytes.find."""
+  if not keys:
+    return []
+  if ids is None:
+    return [(i, keys[cell_id]) for i, cell_id in enumerate(grid)
+            if cell_id in keys]
+  cells = []
+  for cell_id, key in keys.items():
+    if cell_id > 0xFF:
+      continue  # Not in a grid of bytes.
+    i = ids.find(cell_id)
+    while i != -1:
+      cells.append((i, key))
+      i = ids.find(cell_id, i + 1)
+  cells.sort(key=lambda cell: cell[0])
+  return cells
+
+
+def _get_surface_bytes(surface):
+  """Get (approximate) memory size of a surface."""
+  w, h = surface.get_size()
+  return w * h * surface.get_bytesize()
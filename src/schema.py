@@ -0,0 +1,446 @@
+# -*- coding: iso-8859-1 -*
+
+import functools
+import os
+
+__all__ = ['SchemaError', 'Schema', 'TileSheetSpec', 'SpriteSpec',
+           'RoomSpec', 'QuestionSpec', 'AudioSpec', 'RenderSpec', 'GameSpec']
+
+"""
+Typed configuration schema. The parsed configuration is compiled into
+records (specifications) that are validated once, when the game is loaded.
+Managers and other consumers then use the records directly instead of
+reading and converting raw property values themselves. Room matrices are
+the exception, they are large and only needed when a room is packed, so
+they are evaluated and validated upon first use (see RoomSpec).
+
+Practices:
++ Comply to PEP 0008 for programming with modules, classes, methods and
+  functions (Style Guide for Python Codestyle), see:
+  https://www.python.org/dev/peps/pep-0008
++ Comply to PEP 0257 (Docstring convention), see:
+  https://www.python.org/dev/peps/pep-0257
+
+@author: Peter Borgstedt (peter.borgstedt@gmail.com)
+"""
+
+_RENDER_MODES = ('full', 'chunked', 'ring')
+_SPRITE_TYPES = ('single', 'square', 'player', 'dynamic', 'hide_on_collide',
+                 'random_hide_on_collide', 'interactive', 'moving', 'chasing')
+
+
+class SchemaError(ValueError):
+  """Raised when the configuration does not comply to the schema. The
+  message contain file name and line number of the faulty value."""
+
+
+class TileSheetSpec():
+  """Tile sheet, an image that is split into tiles."""
+  __slots__ = ('key', 'image', 'alpha')
+
+  def __init__(self, key, image, alpha):
+    self.key = key
+    self.image = image  # Absolute path to image file.
+    self.alpha = alpha
+
+
+class SpriteSpec():
+  """Sprite, type and tiles (or color) used when creating the sprite.
+  Tiles are given as (Y, X) positions in the sheet. For the player
+  tile_map contain positions keyed by direction, moving sprites have a
+  velocity (x, y) and chasing sprites a speed, in pixels per second."""
+  __slots__ = ('key', 'type', 'sheet', 'tiles', 'tile_map', 'color',
+               'velocity', 'speed')
+
+  def __init__(self, key, sprite_type, **kwargs):
+    self.key = key
+    self.type = sprite_type
+    self.sheet = kwargs.get('sheet', None)
+    self.tiles = kwargs.get('tiles', ())
+    self.tile_map = kwargs.get('tile_map', None)
+    self.color = kwargs.get('color', None)
+    self.velocity = kwargs.get('velocity', (0, 0))
+    self.speed = kwargs.get('speed', 0)
+
+
+class RoomSpec():
+  """Room, maps and matrices. Layers are sorted: [(layer, matrix), ...].
+  The matrices are evaluated and validated upon first use, they are not
+  used at all when the room is read from a packed room (or bundle)."""
+  __slots__ = ('key', 'tile_map', 'sprite_map', 'blocking_map', '_matrices',
+               '_evaluated')
+
+  def __init__(self, key, tile_map, sprite_map, blocking_map, matrices):
+    self.key = key
+    self.tile_map = tile_map
+    self.sprite_map = sprite_map
+    self.blocking_map = blocking_map
+    self._matrices = matrices  # (layers, block matrix) or a function.
+    self._evaluated = None
+
+  def __reduce__(self):
+    """Pickle without evaluated matrices (e.g. in the asset bundle)."""
+    return (RoomSpec, (self.key, self.tile_map, self.sprite_map,
+                       self.blocking_map, self._matrices))
+
+  @property
+  def layers(self):
+    return self._get_matrices()[0]
+
+  @property
+  def block_matrix(self):
+    return self._get_matrices()[1]
+
+  def _get_matrices(self):
+    if self._evaluated is None:
+      matrices = self._matrices
+      self._evaluated = matrices() if callable(matrices) else matrices
+    return self._evaluated
+
+
+class QuestionSpec():
+  """Quizz question, with choices, the correct answer and a clue."""
+  __slots__ = ('key', 'question', 'answer', 'choices', 'clue')
+
+  def __init__(self, key, question, answer, choices, clue):
+    self.key = key
+    self.question = question
+    self.answer = answer
+    self.choices = choices
+    self.clue = clue
+
+
+class AudioSpec():
+  """Audio settings, volumes and sound and music files keyed by id."""
+  __slots__ = ('sound_volume', 'music_volume', 'music', 'sound')
+
+  def __init__(self, sound_volume, music_volume, music, sound):
+    self.sound_volume = sound_volume
+    self.music_volume = music_volume
+    self.music = music
+    self.sound = sound
+
+
+class RenderSpec():
+  """Render settings, mode 'full' renders the whole room on one surface,
+  'chunked' streams chunks (chunk_size tiles) near the view and keep them
+  within a memory budget (MB), prefetch is the amount of chunks to load
+  ahead in the direction of movement. Mode 'ring' renders on a back
+  buffer slightly larger than the view. Repainted areas are merged before
+  the display is updated if at most merge_waste (0-1) of the merged area
+  is not repainted."""
+  __slots__ = ('mode', 'chunk_size', 'budget', 'prefetch', 'merge_waste')
+
+  def __init__(self, mode, chunk_size, budget, prefetch, merge_waste):
+    self.mode = mode
+    self.chunk_size = chunk_size
+    self.budget = budget
+    self.prefetch = prefetch
+    self.merge_waste = merge_waste
+
+
+class GameSpec():
+  """Game interaction (mini game), the room played and sound used."""
+  __slots__ = ('key', 'room', 'collect_sound')
+
+  def __init__(self, key, room, collect_sound):
+    self.key = key
+    self.room = room
+    self.collect_sound = collect_sound
+
+
+class Schema():
+  """Compiled configuration, contain global settings and all records.
+  Use Schema.compile to create and validate it from a configuration."""
+  __slots__ = ('caption', 'window_size', 'tile_size', 'max_time', 'audio',
+               'render', 'tile_sheets', 'sprites', 'rooms', 'games',
+               'questions')
+
+  LAZY = ('matrix.',)  # Keys only evaluated when used, see RoomSpec.
+
+  def get_room(self, key):
+    """Get room specification, raise KeyError if there is none."""
+    return self.rooms[key]
+
+  def get_game(self, key):
+    """Get game specification, raise KeyError if there is none."""
+    return self.games[key]
+
+  @staticmethod
+  def compile(config):
+    """Compile and validate configuration, SchemaError is raised on the
+    first fault that is found."""
+    return _Compiler(config).compile()
+
+
+class _Compiler():
+  """Compile configuration into a Schema. Only used by Schema.compile."""
+
+  def __init__(self, config):
+    self._config = config
+    source_file = config.get_source_file()
+    self._file = source_file or 'configuration'
+    self._directory = os.path.dirname(os.path.realpath(source_file or '.'))
+
+  def compile(self):
+    """Compile all sections, order matters as later sections refer to
+    earlier ones (sprites refer to tile sheets and so on)."""
+    schema = Schema()
+    props = self._config.get_properties('')
+    if props is None:
+      self._fail(None, None, 'missing global section []')
+    schema.caption = props.get('window.caption', default='')
+    schema.window_size = self._size(props, 'window.size')
+    schema.tile_size = self._size(props, 'image.tile.size')
+    schema.max_time = self._eval(props, 'max_time', int, default=60)
+    schema.audio = self._compile_audio()
+    schema.render = self._compile_render()
+    schema.tile_sheets = self._compile_prefixed('tile', self._tile_sheet)
+    schema.sprites = self._compile_prefixed(
+        'sprite', lambda k, p: self._sprite(k, p, schema))
+    schema.rooms = self._compile_prefixed(
+        'room', lambda k, p: self._room(k, p, schema))
+    schema.games = self._compile_prefixed(
+        'game', lambda k, p: self._game(k, p, schema))
+    questions = self._compile_prefixed('quizz', self._question)
+    schema.questions = [questions[k] for k in sorted(questions.keys())]
+    return schema
+
+  def _compile_prefixed(self, prefix, compile_function):
+    """Compile all sections with prefix, return dict: name -> record."""
+    prefixed = self._config.get_prefixed_properties(prefix)
+    records = {}
+    for key in prefixed.get_keys():
+      records[key] = compile_function(key, prefixed.get(key))
+    return records
+
+  def _fail(self, properties, key, message):
+    """Raise SchemaError with file name and line number."""
+    line = None
+    if properties is not None:
+      line = properties.get_line(key)
+      if line is None:
+        line = properties.get_line()  # Fallback on section line.
+    location = self._file if line is None else '%s:%s' % (self._file, line)
+    if key is not None:
+      message = '%s: %s' % (key, message)
+    raise SchemaError('%s: %s' % (location, message))
+
+  def _text(self, properties, key, **kwargs):
+    """Get required (unless default is given) raw text value."""
+    value = properties.get(key)
+    if value is None:
+      if 'default' in kwargs:
+        return kwargs['default']
+      self._fail(properties, None, 'missing required value \'%s\'' % key)
+    return value.strip()
+
+  def _eval(self, properties, key, types, **kwargs):
+    """Get required (unless default is given) evaluated value of given
+    type(s)."""
+    if properties.get(key) is None:
+      if 'default' in kwargs:
+        return kwargs['default']
+      self._fail(properties, None, 'missing required value \'%s\'' % key)
+    try:
+      value = properties.get_eval(key)
+    except (ValueError, SyntaxError, TypeError, MemoryError,
+            RecursionError) as e:
+      self._fail(properties, key, 'invalid value (%s)' % e)
+    if not isinstance(value, types):
+      self._fail(properties, key, 'expected %s, got %s' % (
+          self._type_name(types), type(value).__name__))
+    return value
+
+  @staticmethod
+  def _type_name(types):
+    if isinstance(types, tuple):
+      return ' or '.join(t.__name__ for t in types)
+    return types.__name__
+
+  def _size(self, properties, key):
+    """Get a size, (width, height) with positive integers."""
+    value = self._eval(properties, key, tuple)
+    if len(value) != 2 or not all(self._is_int(v) and v > 0 for v in value):
+      self._fail(properties, key, 'expected (width, height)')
+    return value
+
+  @staticmethod
+  def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+  def _position(self, properties, key, position):
+    """Validate a tile (Y, X) position."""
+    if not (isinstance(position, (tuple, list)) and len(position) == 2 and
+            all(self._is_int(v) and v >= 0 for v in position)):
+      self._fail(properties, key, 'invalid tile position %r' % (position,))
+    return tuple(position)
+
+  def _file_path(self, properties, key):
+    """Get path of a file relative to the configuration, must exist."""
+    path = os.path.join(self._directory, self._text(properties, key))
+    if not os.path.isfile(path):
+      self._fail(properties, key, 'file not found \'%s\'' % path)
+    return path
+
+  def _volume(self, properties, key, default):
+    return self._fraction(properties, key, default, 'volume')
+
+  def _fraction(self, properties, key, default, name='number'):
+    value = self._text(properties, key, default=str(default))
+    try:
+      value = float(value)
+    except ValueError:
+      self._fail(properties, key, 'expected a number')
+    if not 0 <= value <= 1:
+      self._fail(properties, key, 'expected a %s between 0 and 1' % name)
+    return value
+
+  def _compile_audio(self):
+    properties = self._config.get_properties('audio')
+    if properties is None:
+      self._fail(None, None, 'missing section [audio]')
+    return AudioSpec(self._volume(properties, 'sound_volume', 0.5),
+                     self._volume(properties, 'music_volume', 0.25),
+                     self._eval(properties, 'music', dict, default={}),
+                     self._eval(properties, 'sound', dict, default={}))
+
+  def _compile_render(self):
+    properties = self._config.get_properties('render')
+    if properties is None:
+      return RenderSpec('full', 16, 64, 1, 0.25)  # Section is optional.
+    mode = self._text(properties, 'mode', default='full').lower()
+    if mode not in _RENDER_MODES:
+      self._fail(properties, 'mode', 'unknown mode \'%s\'' % mode)
+    values = []
+    for key, default in (('chunk.size', 16), ('memory.budget', 64),
+                         ('prefetch', 1)):
+      value = self._eval(properties, key, int, default=default)
+      if not self._is_int(value) or value < (0 if key == 'prefetch' else 1):
+        self._fail(properties, key, 'expected a positive integer')
+      values.append(value)
+    values.append(self._fraction(properties, 'merge.waste', 0.25))
+    return RenderSpec(mode, *values)
+
+  def _tile_sheet(self, key, properties):
+    return TileSheetSpec(key, self._file_path(properties, 'image'),
+                         self._eval(properties, 'alpha', bool,
+                                    default=False))
+
+  def _sheet_key(self, properties, key, sheet, schema):
+    """Validate that a tile sheet exist."""
+    if sheet not in schema.tile_sheets:
+      self._fail(properties, key, 'unknown tile sheet \'%s\'' % sheet)
+    return sheet
+
+  def _sprite(self, key, properties, schema):
+    sprite_type = self._text(properties, 'type').lower()
+    if sprite_type not in _SPRITE_TYPES:
+      self._fail(properties, 'type', 'unknown type \'%s\'' % sprite_type)
+
+    if sprite_type == 'square':
+      color = self._eval(properties, 'color', tuple)
+      if len(color) not in (3, 4) or\
+         not all(self._is_int(c) and 0 <= c <= 255 for c in color):
+        self._fail(properties, 'color', 'expected (r, g, b)')
+      return SpriteSpec(key, sprite_type, color=color)
+
+    if sprite_type == 'player':
+      sheet = self._text(properties, 'tile')
+      self._sheet_key(properties, 'tile', sheet, schema)
+      tile_map = {}
+      for direction, positions in\
+          self._eval(properties, 'tile.map', dict).items():
+        tile_map[direction] = tuple(self._position(properties, 'tile.map', p)
+                                    for p in positions)
+      return SpriteSpec(key, sprite_type, sheet=sheet, tile_map=tile_map)
+
+    tile = self._eval(properties, 'tile', tuple)
+    if len(tile) != 2 or not isinstance(tile[1], (tuple, list)) or\
+       len(tile[1]) == 0:
+      self._fail(properties, 'tile', 'expected (sheet, (position, ...))')
+    sheet = self._sheet_key(properties, 'tile', tile[0], schema)
+    tiles = tuple(self._position(properties, 'tile', p) for p in tile[1])
+    if sprite_type == 'moving':
+      velocity = self._eval(properties, 'velocity', tuple)
+      if len(velocity) != 2 or\
+         not all(isinstance(v, (int, float)) for v in velocity):
+        self._fail(properties, 'velocity', 'expected (x, y)')
+      return SpriteSpec(key, sprite_type, sheet=sheet, tiles=tiles,
+                        velocity=velocity)
+    if sprite_type == 'chasing':
+      speed = self._eval(properties, 'speed', (int, float))
+      if speed <= 0:
+        self._fail(properties, 'speed', 'expected a positive number')
+      return SpriteSpec(key, sprite_type, sheet=sheet, tiles=tiles,
+                        speed=speed)
+    return SpriteSpec(key, sprite_type, sheet=sheet, tiles=tiles)
+
+  def _room(self, key, properties, schema):
+    tile_map = self._eval(properties, 'tile.map', dict, default={})
+    for value in tile_map.values():
+      if value is None:
+        continue
+      if isinstance(value, tuple) and len(value) == 2:
+        self._sheet_key(properties, 'tile.map', value[0], schema)
+        self._position(properties, 'tile.map', value[1])
+      elif isinstance(value, str):  # Sheet only, position in matrix.
+        self._sheet_key(properties, 'tile.map', value, schema)
+      else:
+        self._fail(properties, 'tile.map', 'invalid value %r' % (value,))
+
+    sprite_map = self._eval(properties, 'sprite.map', dict, default={})
+    for value in sprite_map.values():
+      if value is not None and value not in schema.sprites:
+        self._fail(properties, 'sprite.map', 'unknown sprite \'%s\'' % value)
+
+    blocking_map = self._eval(properties, 'blocking.map', dict, default={})
+    for value in blocking_map.values():
+      if value is not None and not (
+              isinstance(value, tuple) and len(value) == 4 and
+              all(self._is_int(v) for v in value)):
+        self._fail(properties, 'blocking.map',
+                   'invalid block modifier %r' % (value,))
+
+    layers = []
+    for layer in properties.get_prefixed('matrix.layer', '.'):
+      layer_key = 'matrix.layer.' + layer
+      try:
+        index = int(layer)
+      except ValueError:
+        self._fail(properties, layer_key, 'layer must be an integer')
+      layers.append((index, layer_key))
+    layers.sort(key=lambda layer: layer[0])
+    return RoomSpec(key, tile_map, sprite_map, blocking_map,
+                    functools.partial(self._matrices, properties, layers))
+
+  def _matrices(self, properties, layers):
+    """Get layers and block matrix of a room, run upon first use."""
+    return ([(index, self._matrix(properties, key)) for index, key in layers],
+            self._matrix(properties, 'matrix.block', default=()))
+
+  def _matrix(self, properties, key, **kwargs):
+    """Get a matrix, a sequence of rows (sequences)."""
+    matrix = self._eval(properties, key, (tuple, list), **kwargs)
+    for row in matrix:
+      if not isinstance(row, (tuple, list)):
+        self._fail(properties, key, 'expected a sequence of rows')
+    return matrix
+
+  def _game(self, key, properties, schema):
+    room = self._text(properties, 'room')
+    if room not in schema.rooms:
+      self._fail(properties, 'room', 'unknown room \'%s\'' % room)
+    collect_sound = self._text(properties, 'collect_sound')
+    if collect_sound not in schema.audio.sound:
+      self._fail(properties, 'collect_sound',
+                 'unknown sound \'%s\'' % collect_sound)
+    return GameSpec(key, room, collect_sound)
+
+  def _question(self, key, properties):
+    choices = self._eval(properties, 'choices', dict)
+    answer = self._text(properties, 'answer')
+    if answer.upper() not in (choice.upper() for choice in choices):
+      self._fail(properties, 'answer', 'answer is not one of the choices')
+    return QuestionSpec(key, properties.get('question'), answer, choices,
+                        properties.get('clue'))
@@ -2,14 +2,18 @@
 # -*- coding: iso-8859-1 -*
 
 import pygame
-from utilities import TimeCount, add_to_set_in_dict, get_grid_data
+from array import array
+from pygame.locals import BLEND_PREMULTIPLIED, SRCALPHA
+from utilities import (TimeCount, add_to_set_in_dict, get_byte_grid,
+                       get_grid_cells, get_grid_data, translate_byte_grid)
 import debug
 
 from random import randint
 
 __all__ = ['DirtyLayerGrid', 'SingleEntity', 'DynamicEntity',
            'VisibilityEntity', 'HideOnCollideEntity', 'InteractionEntity',
-           'SquareEntity', 'PlayerEntity']
+           'SquareEntity', 'PlayerEntity', 'MovingEntity', 'ChasingEntity',
+           'SpatialHash']
 
 
 """
@@ -26,6 +30,103 @@ Practices:
 """
 
 
+class _TranslatedSurface():
+  """Surface proxy that translate the destination of all blits."""
+
+  def __init__(self, surface, dx, dy):
+    self._surface = surface
+    self._dx = dx
+    self._dy = dy
+
+  def blit(self, source, dest, area=None, special_flags=0):
+    return self._surface.blit(source, (dest[0] + self._dx,
+                                       dest[1] + self._dy), area,
+                              special_flags)
+
+  def blits(self, blit_sequence, doreturn=True):
+    rects = [self.blit(*blit) for blit in blit_sequence]
+    return rects if doreturn else None
+
+
+# Baking of layers on top of sprites require premultiplied alpha blending.
+_PREMULTIPLIED = hasattr(pygame.Surface, 'premul_alpha')
+_NOT_OCCLUDED = -0x80000000  # Occlusion of cells without opaque cover.
+
+
+def _is_opaque(image):
+  """See if image is fully opaque and cover a whole cell, tiles are
+  classified by their alpha (see manager.TileManager) so opaque tiles have
+  neither per pixel alpha, a colorkey nor surface alpha."""
+  return (image.get_size() == (32, 32) and
+          not image.get_flags() & SRCALPHA and
+          image.get_colorkey() is None and
+          image.get_alpha() in (None, 255))
+
+
+class SpatialHash():
+  """Spatial hash of moving sprites (broad phase), grid cells mapped to the
+  sprites overlapping them. Relocate and remove only update the cells of
+  the sprite, a query only examine the cells of the queried rectangle, all
+  are O(1) for sprites and rectangles of a few cells."""
+
+  def __init__(self, size=32):
+    self.size = size  # Cell size in pixels.
+    self._cells = {}  # (X-grid, Y-grid) -> set(sprites).
+    self._sprite_cells = {}  # Sprite -> cells (x1, y1, x2, y2).
+
+  def __contains__(self, sprite):
+    return sprite in self._sprite_cells
+
+  def __iter__(self):
+    return iter(list(self._sprite_cells))
+
+  def __len__(self):
+    return len(self._sprite_cells)
+
+  def relocate(self, sprite):
+    """Add sprite, or move it, to the cells of its current rectangle."""
+    cells = get_grid_cells(sprite.get_rect(), self.size)
+    previous = self._sprite_cells.get(sprite, None)
+    if cells == previous:
+      return  # Moved within the same cells.
+    if previous is not None:
+      self._discard(sprite, previous)
+    self._sprite_cells[sprite] = cells
+    x1, y1, x2, y2 = cells
+    for y in range(y1, y2):
+      for x in range(x1, x2):
+        self._cells.setdefault((x, y), set()).add(sprite)
+
+  def remove(self, sprite):
+    """Remove sprite, if present."""
+    cells = self._sprite_cells.pop(sprite, None)
+    if cells is not None:
+      self._discard(sprite, cells)
+
+  def _discard(self, sprite, cells):
+    """Remove sprite from cells, empty cells are removed."""
+    x1, y1, x2, y2 = cells
+    for y in range(y1, y2):
+      for x in range(x1, x2):
+        sprites = self._cells[(x, y)]
+        sprites.discard(sprite)
+        if not sprites:
+          del self._cells[(x, y)]
+
+  def query(self, rect):
+    """Get set of sprites in the cells overlapped by rect, they may not
+    collide with rect (narrow phase is up to the caller)."""
+    sprites = set()
+    cells = self._cells
+    x1, y1, x2, y2 = get_grid_cells(rect, self.size)
+    for y in range(y1, y2):
+      for x in range(x1, x2):
+        cell = cells.get((x, y), None)
+        if cell is not None:
+          sprites.update(cell)
+    return sprites
+
+
 class DirtyLayerGrid(pygame.sprite.Sprite):
   """Handles drawing of all sprites in the map. Will paint and repaint
   dirty sprites. Created with efficiency and performance in mind.
@@ -34,18 +135,52 @@ class DirtyLayerGrid(pygame.sprite.Sprite):
   group. I needed something simple and super fast. This class extends the
   Sprite with just the methods and functionality I need.
 
+  Static tiles (tiles without any behaviour) are not sprites, they are
+  stored as flyweights: one grid of tile ids for each layer, where each id
+  refer to a shared image in the tile palette. Only interactive and dynamic
+  sprites (and the player) are sprite objects. Both are drawn in layer
+  order, a dirty grid cell repaint the static tiles in that cell.
+
+  Static tiles are baked into chunks (see bake) the first time a cell in
+  the chunk is repainted, a dirty cell is then repainted with one blit for
+  each band of static layers.
+
+  Moving sprites (MovingEntity and the player) are kept in a spatial hash
+  instead of the static sprite matrix, see update_movers and
+  update_collisions which are run once each frame.
+
   @note: Requires all sprites to be of type pygame.sprite.DirtySprite.
   """
+  _CHUNK = 8  # Size of baked chunks, in tiles.
+  _BACKGROUND = (32, 32, 32)  # Background color, under all static tiles.
 
   def __init__(self, name):
     super(DirtyLayerGrid, self).__init__()
     self.name = name
     self._spritelist = []  # List of all sprites, for fast iteration.
     self._sprite_matrix = {}  # Y-grid -> X-grid -> Layer -> (X-) sprites.
+    self._movers = SpatialHash()  # Moving sprites, including the player.
+    self._moved = set()  # Sprites moved since last update_collisions.
+    self._contacts = {}  # Sprite -> colliding sprites (with a mover).
     self._layer_to_dirty = {}  # Layer -> dirty sprites.
     self._listeners = {}
     self._collided_sprites = set()
     self._player = None
+    self._columns = self._rows = 0  # Grid size of static tile layers.
+    self._tile_images = [None]  # Tile id -> image, id 0 is empty.
+    self._tile_ids = {}  # Image -> tile id.
+    self._tile_layers = {}  # Layer -> tile ids (row * columns + column).
+    self._dirty_cells = set()  # (X-grid, Y-grid) to repaint static tiles.
+    self._bands = None  # Static tile layer bands, see _get_bands.
+    self._chunks = {}  # (Band, X-chunk, Y-chunk) -> baked surface.
+    self._stale_chunks = set()  # Chunks that must be baked again.
+    self._bake_count = 0  # Chunk surfaces created, see get_bake_count.
+    self._premultiplied_images = [None]  # See _get_premultiplied_images.
+    self._blit_list = []  # Reused (image, rect) list, see _blit_sprites.
+    self._occlusion = None  # Cell -> draw order, see build_occlusion.
+    self._static_occlusion = None  # Same as above, static tiles only.
+    self._occluders = {}  # Opaque sprite -> cell it cover.
+    self._cell_occluders = {}  # Cell -> opaque sprites covering it.
 
   def draw_all(self, surface, **kwargs):
     """Draw all sprites, whether they are dirty or not. Clear any
@@ -54,20 +189,319 @@ class DirtyLayerGrid(pygame.sprite.Sprite):
     layer_to_sprites = {}
     for sprite in self._spritelist:
       add_to_set_in_dict(layer_to_sprites, sprite, sprite._layer)
+    if self._occlusion is not None:
+      self._update_occluders(self._spritelist)
 
-    layers = None
     if 'layer' in kwargs:
-      layers = [kwargs['layer']]
-    else:
-      layers = sorted(layer_to_sprites.keys())
+      layer = kwargs['layer']
+      tiles = self._tile_layers.get(layer, None)
+      if tiles is not None:
+        self._draw_all_tiles(surface, tiles)
+      self._draw_all_sprites(surface, layer_to_sprites.get(layer, ()),
+                             False)  # Layers on top are not drawn.
+      self._layer_to_dirty.get(layer, set()).clear()
+      return
+
+    for band, (_, sprite_layer) in enumerate(self._get_bands()):
+      self._draw_all_band(surface, band)
+      if sprite_layer is not None:
+        self._draw_all_sprites(surface, layer_to_sprites.get(sprite_layer, ()))
+        self._layer_to_dirty.get(sprite_layer, set()).clear()
+    self._dirty_cells.clear()
 
-    for layer in sorted(layers):
-      dirty_sprites = self._layer_to_dirty.get(layer, set())
-      for sprite in layer_to_sprites[layer]:
-        sprite.draw(surface)
-#                self._draw_sprite_grid(sprite, surface)
+  def _draw_all_sprites(self, surface, sprites, cull=True):
+    """Draw all sprites (in a layer) and set them as not dirty."""
+    self._blit_sprites(surface, sprites, cull)
+    for sprite in sprites:
+      sprite._dirty = 0
+
+  def _blit_sprites(self, surface, sprites, cull=True):
+    """Draw sprites (in a layer) with one Surface.blits call, the images
+    and rectangles are gathered in a reused list. Sprites hidden by opaque
+    tiles or sprites on top of them are skipped if cull is set."""
+    blit_list = self._blit_list
+    cull = cull and self._occlusion is not None
+    for sprite in sprites:
+      if cull and self._is_occluded(sprite):
+        continue
+      image = sprite.get_image()
+      if image is not None:
+        blit_list.append((image, sprite._rect))
+    if blit_list:
+      surface.blits(blit_list, False)
+      blit_list.clear()
+
+  def _draw_all_band(self, surface, band):
+    """Draw a band of static tile layers, using the baked chunks."""
+    layers, _ = self._bands[band]
+    if band > 0 and not layers:
+      return  # Nothing to draw, the first band is drawn with background.
+    if band > 0 and not _PREMULTIPLIED:
+      for layer in layers:
+        self._draw_all_tiles(surface, self._tile_layers[layer])
+      return
+    size = self._CHUNK * 32
+    flags = BLEND_PREMULTIPLIED if band > 0 else 0
+    for cy in range(0, (self._rows + self._CHUNK - 1) // self._CHUNK):
+      for cx in range(0, (self._columns + self._CHUNK - 1) // self._CHUNK):
+        key = (band, cx, cy)
+        if key in self._chunks and key not in self._stale_chunks:
+          surface.blit(self._chunks[key], (cx * size, cy * size), None,
+                       flags)
+        else:  # Not baked until a cell in it is repainted.
+          self._draw_chunk_tiles(surface, band, cx, cy, cx * size,
+                                 cy * size)
+
+  def _draw_all_tiles(self, surface, tiles):
+    """Draw all static tiles in a layer."""
+    images = self._tile_images
+    columns = self._columns
+    for i, tile_id in enumerate(tiles):
+      if tile_id != 0:
+        surface.blit(images[tile_id],
+                     ((i % columns) * 32, (i // columns) * 32))
+
+  def _draw_dirty_tiles(self, surface, layer):
+    """Draw static tiles in a layer that are located in dirty cells and
+    not hidden, return the amount of tiles drawn."""
+    images = self._tile_images
+    tiles = self._tile_layers[layer]
+    columns = self._columns
+    occlusion = self._occlusion
+    order = 2 * layer
+    drawn = 0
+    for x, y in self._dirty_cells:
+      i = y * columns + x
+      if occlusion is not None and occlusion[i] > order:
+        continue  # Hidden by an opaque tile or sprite on top.
+      tile_id = tiles[i]
+      if tile_id != 0:
+        surface.blit(images[tile_id], (x * 32, y * 32))
+        drawn += 1
+    return drawn
+
+  def _draw_dirty_band(self, surface, band):
+    """Repaint dirty cells of a band of static tile layers, each cell is
+    one blit from the baked chunk. Return the amount of blits."""
+    layers, _ = self._bands[band]
+    if band > 0 and not layers:
+      return 0
+    if band > 0 and not _PREMULTIPLIED:
+      return sum(self._draw_dirty_tiles(surface, layer) for layer in layers)
+    chunk_size = self._CHUNK
+    columns = self._columns
+    occlusion = self._occlusion
+    order = 2 * max(layers) if layers else -1  # See build_occlusion.
+    flags = 0
+    if band > 0:
+      flags = BLEND_PREMULTIPLIED
+      band_tiles = [self._tile_layers[layer] for layer in layers]
+    drawn = 0
+    for x, y in self._dirty_cells:
+      i = y * columns + x
+      if occlusion is not None and occlusion[i] > order:
+        continue  # The band is hidden by an opaque tile or sprite on top.
+      if band > 0:
+        if not any(tiles[i] for tiles in band_tiles):
+          continue  # No static tiles in this cell.
+      chunk = self._get_chunk(band, x // chunk_size, y // chunk_size)
+      area = ((x % chunk_size) * 32, (y % chunk_size) * 32, 32, 32)
+      surface.blit(chunk, (x * 32, y * 32), area, flags)
+      drawn += 1
+    return drawn
+
+  def _get_bands(self):
+    """Get bands of static tile layers: [(tile layers, sprite layer)].
+    Static tile layers are grouped between the layers that contain sprites,
+    the sprites in the sprite layer are drawn on top of the band (static
+    tiles in the sprite layer itself belong to the band). The last band
+    has sprite layer None."""
+    if self._bands is None:
+      sprite_layers = set(sprite._layer for sprite in self._spritelist)
+      bands = []
+      layers = []
+      for layer in sorted(sprite_layers | set(self._tile_layers.keys())):
+        if layer in self._tile_layers:
+          layers.append(layer)
+        if layer in sprite_layers:
+          bands.append((tuple(layers), layer))
+          layers = []
+      bands.append((tuple(layers), None))
+      self._bands = bands
+      self._chunks.clear()  # Bands has changed, bake again.
+    return self._bands
+
+  def bake(self):
+    """Pre-bake all static tile layers into chunk surfaces (of _CHUNK x
+    _CHUNK tiles). The first band is baked on the background color, the
+    other bands are baked with premultiplied alpha so they can be blended
+    on top of sprites. Chunks are otherwise baked the first time a cell in
+    them is repainted (or drawn with draw_region)."""
+    bands = self._get_bands()
+    self._chunks.clear()
+    self._stale_chunks.clear()
+    for band in range(len(bands)):
+      for cy in range(0, (self._rows + self._CHUNK - 1) // self._CHUNK):
+        for cx in range(0, (self._columns + self._CHUNK - 1) // self._CHUNK):
+          self._get_chunk(band, cx, cy)
+
+  def _get_chunk(self, band, cx, cy):
+    """Get baked chunk, bake it if it does not exist or is stale."""
+    key = (band, cx, cy)
+    chunk = self._chunks.get(key, None)
+    if chunk is None or key in self._stale_chunks:
+      self._stale_chunks.discard(key)
+      if chunk is None:
+        self._bake_count += 1
+      self._chunks[key] = chunk = self._bake_chunk(band, cx, cy, chunk)
+    return chunk
+
+  def get_bake_count(self):
+    """Get amount of chunk surfaces baked so far, changed if any chunk has
+    been baked since last time."""
+    return self._bake_count
+
+  def get_baked_bytes(self):
+    """Get memory size of the baked chunks, summed by the position (x, y)
+    of their top left in room coordinates."""
+    size = self._CHUNK * 32
+    baked = {}
+    for (_, cx, cy), chunk in self._chunks.items():
+      w, h = chunk.get_size()
+      position = (cx * size, cy * size)
+      baked[position] = baked.get(position, 0) + w * h * chunk.get_bytesize()
+    return baked
+
+  def _bake_chunk(self, band, cx, cy, chunk):
+    """Bake static tile layers of a band into a chunk surface, the
+    existing (stale) chunk surface is reused if given."""
+    x1, y1 = cx * self._CHUNK, cy * self._CHUNK
+    x2 = min(x1 + self._CHUNK, self._columns)
+    y2 = min(y1 + self._CHUNK, self._rows)
+    if band == 0:
+      if chunk is None:
+        chunk = pygame.Surface(((x2 - x1) * 32, (y2 - y1) * 32)).convert()
+    else:
+      if chunk is None:
+        chunk = pygame.Surface(((x2 - x1) * 32, (y2 - y1) * 32), SRCALPHA)
+        chunk = chunk.convert_alpha()
+      chunk.fill((0, 0, 0, 0))
+    self._draw_chunk_tiles(chunk, band, cx, cy, 0, 0)
+    return chunk
+
+  def _draw_chunk_tiles(self, surface, band, cx, cy, dx, dy):
+    """Draw static tile layers of a band in chunk (cx, cy) on surface, the
+    top left of the chunk at (dx, dy). The first band is drawn on the
+    background color, the other bands are blended with premultiplied
+    alpha."""
+    layers, _ = self._bands[band]
+    x1, y1 = cx * self._CHUNK, cy * self._CHUNK
+    x2 = min(x1 + self._CHUNK, self._columns)
+    y2 = min(y1 + self._CHUNK, self._rows)
+    if band == 0:
+      surface.fill(self._BACKGROUND,
+                   (dx, dy, (x2 - x1) * 32, (y2 - y1) * 32))
+      images = self._tile_images
+      flags = 0
+    else:
+      images = self._get_premultiplied_images()
+      flags = BLEND_PREMULTIPLIED
+    columns = self._columns
+    occlusion = self._static_occlusion
+    for layer in layers:
+      tiles = self._tile_layers[layer]
+      order = 2 * layer
+      for y in range(y1, y2):
+        for x in range(x1, x2):
+          tile_id = tiles[y * columns + x]
+          if tile_id != 0 and (occlusion is None or
+                               occlusion[y * columns + x] <= order):
+            surface.blit(images[tile_id], (dx + (x - x1) * 32,
+                                           dy + (y - y1) * 32), None, flags)
+
+  def _get_premultiplied_images(self):
+    """Get tile images with premultiplied alpha (tile id -> image)."""
+    images = self._premultiplied_images
+    for image in self._tile_images[len(images):]:
+      images.append(image if image is None else
+                    image.convert_alpha().premul_alpha())
+    return images
+
+  def set_tile(self, image, x, y, **kwargs):
+    """Set (or remove if image is None) static tile on grid position (x, y)
+    after the room has been built. Only the chunk containing the tile is
+    baked again."""
+    layer = kwargs.get('layer', 0)
+    if layer not in self._tile_layers:
+      self._bands = None  # New static layer, bands must be rebuilt.
+    tiles = self.get_tile_layer(layer)
+    tiles[y * self._columns + x] = 0 if image is None else\
+        self.get_tile_id(image)
+    occluded = self._occlusion is not None
+    if occluded:
+      self._update_static_occlusion(y * self._columns + x)
+    for band, (layers, _) in enumerate(self._get_bands()):
+      if occluded or layer in layers:  # Culled tiles may become visible.
+        chunk_key = (band, x // self._CHUNK, y // self._CHUNK)
+        if chunk_key in self._chunks:
+          self._stale_chunks.add(chunk_key)
+    self._dirty_cells.add((x, y))
+
+  def draw_region(self, surface, rect):
+    """Draw everything (static tiles and sprites) within rect, in room
+    coordinates, on surface where the surface top left is the rect top
+    left. Dirty flags are left untouched."""
+    layer_to_sprites = {}
+    for sprite in self._spritelist:
+      if rect.colliderect(sprite.get_rect()):
+        add_to_set_in_dict(layer_to_sprites, sprite, sprite._layer)
+    translated = _TranslatedSurface(surface, -rect.x, -rect.y)
+    size = self._CHUNK * 32
+    cx1, cy1 = max(rect.x // size, 0), max(rect.y // size, 0)
+    cx2 = min((rect.right - 1) // size, (self._columns - 1) // self._CHUNK)
+    cy2 = min((rect.bottom - 1) // size, (self._rows - 1) // self._CHUNK)
+    for band, (layers, sprite_layer) in enumerate(self._get_bands()):
+      if band == 0 or layers:
+        if band > 0 and not _PREMULTIPLIED:
+          for layer in layers:
+            self._draw_all_tiles(translated, self._tile_layers[layer])
+        else:
+          flags = BLEND_PREMULTIPLIED if band > 0 else 0
+          for cy in range(cy1, cy2 + 1):
+            for cx in range(cx1, cx2 + 1):
+              surface.blit(self._get_chunk(band, cx, cy),
+                           (cx * size - rect.x, cy * size - rect.y), None,
+                           flags)
+      self._blit_sprites(translated, layer_to_sprites.get(sprite_layer, ()))
+
+  def clear_dirty(self):
+    """Set all sprites and cells as not dirty, used when everything is
+    drawn with draw_region instead of draw_all."""
+    for sprite in self._spritelist:
+      if sprite._dirty == 1:
         sprite._dirty = 0
-      dirty_sprites.clear()
+    for dirty in self._layer_to_dirty.values():
+      dirty.clear()
+    self._dirty_cells.clear()
+
+  def release_region(self, rect):
+    """Release baked chunks located (top left) within rect, these are
+    baked again when needed."""
+    size = self._CHUNK * 32
+    for key in [key for key in self._chunks
+                if rect.collidepoint(key[1] * size, key[2] * size)]:
+      del self._chunks[key]
+      self._stale_chunks.discard(key)
+
+  def retain_region(self, rect):
+    """Release baked chunks not overlapping rect, these are baked again
+    when needed."""
+    size = self._CHUNK * 32
+    for key in [key for key in self._chunks
+                if not rect.colliderect(key[1] * size, key[2] * size, size,
+                                        size)]:
+      del self._chunks[key]
+      self._stale_chunks.discard(key)
 
   def _create_grid_sprites(self):
     """TODO: Unfinished, remove or finish. Show in debug."""
@@ -90,24 +524,46 @@ class DirtyLayerGrid(pygame.sprite.Sprite):
     pygame.draw.lines(surface, (255, 0, 0), False, y_list, 1)
 
   def draw(self, surface):
-    """Draw dirty sprites, return True/False whether any sprites where
-    drawn or not."""
+    """Draw dirty sprites, return the rectangles (room coordinates) that
+    were repainted, empty if nothing was drawn. Dirty cells are repainted
+    from the baked static tile chunks, with the dirty sprites drawn in
+    between."""
+    if self._occlusion is not None:
+      # Dirty sprites may have been hidden or changed image, cells where
+      # the occlusion changed are repainted with everything in them.
+      for i in self._update_occluders([sprite for dirty in
+                                       self._layer_to_dirty.values()
+                                       for sprite in dirty]):
+        self.add_dirty_area(self._get_cell_rect(i))
+    repainted = [pygame.Rect(x * 32, y * 32, 32, 32)
+                 for x, y in self._dirty_cells]
     sprites_drawn = 0
-    for layer in sorted(self._layer_to_dirty.keys()):
-      dirty_layer = self._layer_to_dirty.get(layer)
-      for dirty_sprite in set(dirty_layer):
-        dirty_sprite.draw(surface)
-#                self.draw_sprite_grid(dirty_sprite, surface)
-        sprites_drawn += 1
+    for band, (_, sprite_layer) in enumerate(self._get_bands()):
+      if self._dirty_cells:
+        sprites_drawn += self._draw_dirty_band(surface, band)
+      if sprite_layer is None:
+        continue
+      dirty_layer = self._layer_to_dirty.get(sprite_layer, None)
+      if not dirty_layer:
+        continue
+      self._blit_sprites(surface, dirty_layer)
+      always_dirty = []
+      for dirty_sprite in dirty_layer:
+        repainted.append(pygame.Rect(dirty_sprite._rect))
         # If _dirty is 2, then it should always be rendered.
         if dirty_sprite._dirty == 1:
           dirty_sprite._dirty = 0
-        self.modify_dirty(dirty_sprite)
+        elif dirty_sprite._dirty == 2:
+          always_dirty.append(dirty_sprite)
+      sprites_drawn += len(dirty_layer)
+      dirty_layer.clear()
+      dirty_layer.update(always_dirty)
+    self._dirty_cells.clear()
 
     if debug.DEBUG is True and sprites_drawn > 0:
       print('[DEBUG - sprites.DirtyLayerGrid.draw - %s] %s sprites drawn' \
           % (self.name, sprites_drawn))
-    return sprites_drawn > 0
+    return repainted
 
   def add_event_listeners(self, listener, event_type):
     """Add event listener, current possible events:
@@ -119,17 +575,18 @@ class DirtyLayerGrid(pygame.sprite.Sprite):
       self._listeners[event_type] = listeners = []
     listeners.append(listener)
 
-  def set_colliding_dirt(self, player):
-    """Set the given sprite and any colliding neighbours to _dirty."""
+  def set_colliding_dirt(self, player, target_rect=None):
+    """Set the given sprite and any colliding neighbours to _dirty. If the
+    player is moving to target_rect the area of both the current and the
+    target rectangle is used."""
     player._dirty = 1
     self.modify_dirty(player)
-    surrounding_sprites = self.get_flat_sprites_at(player.get_rect())
+    rect = player.get_rect()
+    if target_rect is not None:
+      rect = rect.union(target_rect)
+    self.add_dirty_area(rect)
+    surrounding_sprites = self.get_flat_sprites_at(rect)
     previous, current = self._get_current_and_previous(surrounding_sprites)
-    if len(surrounding_sprites) > 0:
-      for sprite in surrounding_sprites:
-        if sprite._dirty == 0:
-          sprite._dirty = 1
-          self.modify_dirty(sprite)
 
     for s in current:
       # If _Entity.collide_in return True it indicated that
@@ -163,6 +620,118 @@ class DirtyLayerGrid(pygame.sprite.Sprite):
     self._collided_sprites = surrounding_sprites
     return previous, current
 
+  def add_dirty_area(self, rect):
+    """Add grid cells overlapped by rect as dirty and all sprites in them,
+    the cells of these sprites are in turn added (as they are drawn on top
+    of the repainted cells)."""
+    pending = [rect]
+    while pending:
+      x1, y1, x2, y2 = get_grid_cells(pending.pop())
+      area = pygame.Rect(x1 * 32, y1 * 32, (x2 - x1) * 32, (y2 - y1) * 32)
+      self._add_dirty_cells(area)
+      for sprite in self.get_flat_sprites_at(area) | self._movers.query(area):
+        if sprite._dirty == 0:
+          sprite._dirty = 1
+          self.modify_dirty(sprite)
+          pending.append(sprite.get_rect())
+
+  def move_sprite(self, sprite, rect):
+    """Move a moving sprite to rect, the area of both the current and the
+    new rectangle is repainted."""
+    sprite._dirty = 1
+    self.modify_dirty(sprite)
+    self.add_dirty_area(sprite.get_rect().union(rect))
+    sprite._rect = rect
+    self.relocate(sprite)
+
+  def relocate(self, sprite):
+    """Update the spatial hash with the current rectangle of a moving
+    sprite (e.g. the player), collisions are updated in
+    update_collisions."""
+    self._movers.relocate(sprite)
+    self._moved.add(sprite)
+
+  def update_movers(self, frame_time, block_manager, **kwargs):
+    """Move all moving sprites (MovingEntity) for frame_time milliseconds,
+    swept against the blocks, then update the collisions. Run once each
+    frame. Chasing sprites (ChasingEntity) are steered by the flow field
+    toward the player from key word argument 'navigation' (see
+    navigation.Navigation), one field shared by all of them."""
+    navigation = kwargs.get('navigation', None)
+    field = None
+    for sprite in self._movers:
+      if not isinstance(sprite, MovingEntity):
+        continue  # The player move itself.
+      if isinstance(sprite, ChasingEntity):
+        if navigation is None or self._player is None:
+          continue  # Nothing to chase.
+        if field is None:
+          field = navigation.get_flow_field(
+              navigation.get_cell(self._player.get_rect()))
+        sprite.steer(field, block_manager._CELL)
+      rect = pygame.Rect(sprite.get_rect())
+      for axis, pixels in enumerate(sprite.get_displacement(frame_time)):
+        if pixels == 0:
+          continue
+        moved = block_manager.sweep(rect, *((pixels, 0) if axis == 0 else
+                                            (0, pixels)))
+        if moved != pixels:
+          sprite.collide_block(axis)
+        rect[axis] += moved
+      if rect.topleft != sprite.get_rect().topleft:
+        self.move_sprite(sprite, rect)
+    self.update_collisions()
+
+  def update_collisions(self):
+    """Collide all sprites moved since last update with the moving and
+    static sprites, in one batch. collide_in is run (both ways) once when a
+    pair start to collide, not again while they keep overlapping, and
+    collide_out once they no longer collide. Collisions between the player
+    and static sprites are handled by set_colliding_dirt."""
+    moved = self._moved
+    self._moved = set()
+    for sprite in moved:
+      if sprite not in self._movers:
+        continue  # Removed.
+      rect = sprite.get_rect()
+      candidates = self._movers.query(rect)
+      if sprite is not self._player:
+        candidates.update(self.get_flat_sprites_at(rect))
+      colliding = set(other for other in candidates if other is not sprite
+                      and rect.colliderect(other.get_rect()))
+      contacts = self._contacts.get(sprite, set())
+      for other in colliding:
+        if other not in contacts:  # New contact, not still overlapping.
+          self._collide('collide_in', sprite, other)
+        self._contacts.setdefault(other, set()).add(sprite)
+      for other in contacts - colliding:
+        self._contacts[other].discard(sprite)
+        self._collide('collide_out', sprite, other)
+      self._contacts[sprite] = colliding
+
+  def _collide(self, event_type, sprite, other):
+    """Run collide_in or collide_out on both sprites with the other as
+    argument, and listeners if requested."""
+    for a, b in ((sprite, other), (other, sprite)):
+      if getattr(a, event_type)(b):
+        self._run_listeners(event_type, a)
+
+  def remove_mover(self, sprite):
+    """Remove a moving sprite, colliding sprites are collided out."""
+    self._movers.remove(sprite)
+    self._moved.discard(sprite)
+    for other in self._contacts.pop(sprite, ()):
+      self._contacts[other].discard(sprite)
+      self._collide('collide_out', sprite, other)
+    self._spritelist.remove(sprite)
+    self._layer_to_dirty.get(sprite._layer, set()).discard(sprite)
+    cell = self._occluders.pop(sprite, None)
+    if cell is not None:
+      self._cell_occluders[cell].discard(sprite)
+      self._update_cell_occlusion(cell)
+    sprite.remove_internal(self)
+    self.add_dirty_area(sprite.get_rect())
+
   def _run_listeners(self, event_type, sprite):
     """Run listeners that inquire following event_type."""
     listeners = self._listeners.get(event_type, None)
@@ -184,6 +753,7 @@ class DirtyLayerGrid(pygame.sprite.Sprite):
       player.add_internal(self)
       self._spritelist.append(player)
       self._add_dirty(player)
+      self._movers.relocate(player)
       self._player = player
 
   def add(self, *sprites, **kwargs):
@@ -196,16 +766,200 @@ class DirtyLayerGrid(pygame.sprite.Sprite):
         sprite._layer = layer
         sprite.add_internal(self)
         self._spritelist.append(sprite)
-        self._add_sprite_to_grid(sprite)
+        if isinstance(sprite, MovingEntity):
+          self.relocate(sprite)
+        else:
+          self._add_sprite_to_grid(sprite)
         self._add_dirty(sprite)
 
+  def set_grid_size(self, columns, rows):
+    """Set grid size (in tiles) of the static tile layers, existing tiles
+    are kept."""
+    for layer, tiles in list(self._tile_layers.items()):
+      resized = array('H', bytes(2 * columns * rows))
+      for y in range(min(rows, self._rows)):
+        width = min(columns, self._columns)
+        start = y * self._columns
+        resized[y * columns:y * columns + width] = tiles[start:start + width]
+      self._tile_layers[layer] = resized
+    self._columns, self._rows = columns, rows
+    self._occlusion = self._static_occlusion = None  # Build again.
+    self._occluders.clear()
+    self._cell_occluders.clear()
+
+  def build_occlusion(self):
+    """Build the occlusion map, the draw order of the top fully opaque
+    static tile or sprite in each cell. Anything below it in the cell is
+    hidden and not drawn. Draw order is 2 * layer for static tiles and
+    2 * layer + 1 for sprites (drawn on top of the tiles in their layer),
+    only sprites covering exactly one cell occlude."""
+    size = self._columns * self._rows
+    opaque = [image is not None and _is_opaque(image)
+              for image in self._tile_images]
+    layers = sorted(self._tile_layers.keys())
+    if len(layers) < 0xFF:
+      static = self._build_static_occlusion(layers, opaque)
+    else:
+      static = array('i', [_NOT_OCCLUDED]) * size
+      for layer in layers:
+        order = 2 * layer
+        for i, tile_id in enumerate(self._tile_layers[layer]):
+          if opaque[tile_id]:
+            static[i] = order
+    self._static_occlusion = static
+    self._occlusion = array('i', static)
+    self._occluders.clear()
+    self._cell_occluders.clear()
+    self._update_occluders(self._spritelist)
+    self._chunks.clear()  # Hidden tiles are not baked.
+    if debug.DEBUG is True:
+      print('[DEBUG - sprites.DirtyLayerGrid.build_occlusion - %s] %s of %s '
+            'cells covered' % (self.name, size - self._occlusion.count(
+                _NOT_OCCLUDED), size))
+
+  def _build_static_occlusion(self, layers, opaque):
+    """Build the occlusion map of the static tiles in bulk. The top opaque
+    layer (index in layers + 1, 0 for none) of all cells is kept as bytes
+    in one integer, each layer replace the bytes of its opaque cells. The
+    bytes are then mapped to draw orders."""
+    size = self._columns * self._rows
+    table = bytes(0xFF if is_opaque else 0 for is_opaque in opaque[:256])
+    table += bytes(256 - len(table))
+    top = 0
+    for index, layer in enumerate(layers, 1):
+      tiles = self._tile_layers[layer]
+      ids = get_byte_grid(tiles)
+      if ids is None:
+        marked = bytes(0xFF if opaque[tile_id] else 0 for tile_id in tiles)
+      else:
+        marked = ids.translate(table)  # 0xFF on opaque tiles.
+      mask = int.from_bytes(marked, 'little')
+      top = (top & ~mask) | (mask & int.from_bytes(bytes((index,)) * size,
+                                                   'little'))
+    orders = [array('i', [_NOT_OCCLUDED]).tobytes()]
+    orders.extend(array('i', [2 * layer]).tobytes() for layer in layers)
+    orders.extend(orders[:1] * (256 - len(orders)))
+    static = array('i')
+    static.frombytes(translate_byte_grid(top.to_bytes(size, 'little'),
+                                         orders))
+    return static
+
+  def _update_static_occlusion(self, i):
+    """Update occlusion of cell i (row * columns + column) from the static
+    tiles in it."""
+    order = _NOT_OCCLUDED
+    for layer, tiles in self._tile_layers.items():
+      image = self._tile_images[tiles[i]]
+      if image is not None and 2 * layer > order and _is_opaque(image):
+        order = 2 * layer
+    self._static_occlusion[i] = order
+    self._update_cell_occlusion(i)
+
+  def _update_cell_occlusion(self, i):
+    """Update occlusion of cell i from its static tiles and sprites."""
+    order = self._static_occlusion[i]
+    for sprite in self._cell_occluders.get(i, ()):
+      order = max(order, 2 * sprite._layer + 1)
+    self._occlusion[i] = order
+
+  def _update_occluders(self, sprites):
+    """Update the occlusion map with the current image and position of
+    sprites (e.g. hidden or changed index), return the cells that changed
+    occlusion."""
+    changed = []
+    for sprite in sprites:
+      cell = self._get_occluder_cell(sprite)
+      previous = self._occluders.get(sprite, None)
+      if cell == previous:
+        continue
+      if previous is not None:
+        del self._occluders[sprite]
+        self._cell_occluders[previous].discard(sprite)
+        self._update_cell_occlusion(previous)
+        changed.append(previous)
+      if cell is not None:
+        self._occluders[sprite] = cell
+        self._cell_occluders.setdefault(cell, set()).add(sprite)
+        self._update_cell_occlusion(cell)
+        changed.append(cell)
+    return changed
+
+  def _get_occluder_cell(self, sprite):
+    """Get cell (row * columns + column) that the sprite cover with an
+    opaque image, None if the sprite does not occlude."""
+    x, y, w, h = sprite._rect
+    if x % 32 or y % 32 or w != 32 or h != 32:
+      return None
+    x, y = x // 32, y // 32
+    if not (0 <= x < self._columns and 0 <= y < self._rows):
+      return None
+    image = sprite.get_image()
+    if image is None or not _is_opaque(image):
+      return None
+    return y * self._columns + x
+
+  def _is_occluded(self, sprite):
+    """See if sprite is hidden in all cells it overlap, by opaque static
+    tiles or sprites on top of it."""
+    x1, y1, x2, y2 = get_grid_cells(sprite._rect)
+    columns = self._columns
+    if x1 < 0 or y1 < 0 or x2 > columns or y2 > self._rows:
+      return False  # Outside of the grid is never occluded.
+    occlusion = self._occlusion
+    order = 2 * sprite._layer + 1
+    for y in range(y1, y2):
+      for x in range(x1, x2):
+        if occlusion[y * columns + x] <= order:
+          return False
+    return True
+
+  def _get_cell_rect(self, i):
+    """Get rectangle of cell i (row * columns + column)."""
+    return pygame.Rect((i % self._columns) * 32, (i // self._columns) * 32,
+                       32, 32)
+
+  def get_tile_id(self, image):
+    """Get tile id of a (shared) static tile image, the image is added to
+    the tile palette if absent."""
+    tile_id = self._tile_ids.get(image, None)
+    if tile_id is None:
+      if len(self._tile_images) > 0xFFFF:
+        raise ValueError('Too many distinct tile images in %s' % self.name)
+      self._tile_ids[image] = tile_id = len(self._tile_images)
+      self._tile_images.append(image)
+    return tile_id
+
+  def get_tile_layer(self, layer):
+    """Get tile ids of a static tile layer (created if absent), indexed by
+    row * columns + column."""
+    tiles = self._tile_layers.get(layer, None)
+    if tiles is None:
+      tiles = array('H', bytes(2 * self._columns * self._rows))
+      self._tile_layers[layer] = tiles
+    return tiles
+
+  def add_tile(self, image, x, y, **kwargs):
+    """Add static tile image on grid position (x, y)."""
+    tiles = self.get_tile_layer(kwargs.get('layer', 0))
+    tiles[y * self._columns + x] = self.get_tile_id(image)
+
+  def _add_dirty_cells(self, rect):
+    """Add grid cells colliding with rectangle as dirty, the static tiles
+    will be repainted upon next draw."""
+    x1, y1, x2, y2 = get_grid_cells(rect)
+    for y in range(max(y1, 0), min(y2, self._rows)):
+      for x in range(max(x1, 0), min(x2, self._columns)):
+        self._dirty_cells.add((x, y))
+
   def add_dirt(self, grid_positions):
-    """Add dirt on all sprites in grid positions. Matrix uses following
-    structure: {y1:(x1, ...), ...}"""
+    """Add dirt on all sprites and static tiles in grid positions. Matrix
+    uses following structure: {y1:(x1, ...), ...}"""
     for y in list(grid_positions.keys()):
-      y_sprites = self._sprite_matrix[y]  # Should not be None.
+      y_sprites = self._sprite_matrix.get(y, {})
       for x in grid_positions[y]:
-        for layer in list(y_sprites.get(x, None).values()):
+        if 0 <= x < self._columns and 0 <= y < self._rows:
+          self._dirty_cells.add((x, y))
+        for layer in list(y_sprites.get(x, {}).values()):
           for sprite in layer:
             sprite._dirty = 1
             self._add_dirty(sprite)
@@ -219,12 +973,13 @@ class DirtyLayerGrid(pygame.sprite.Sprite):
       self._append_dirty_if_absence(sprite, sprite._layer)
 
   def get_sprites_at(self, target_rect):
-    """Get sprite from target rectangle (currently only support 32x32)."""
+    """Get sprites (dict(layer) -> set(sprites)) of each grid cell the
+    target rectangle overlap."""
     return get_grid_data(target_rect, self._sprite_matrix)
 
   def get_flat_sprites_at(self, target_rect):
-    """Get sprite all layers of given target rectangle (currently only
-    support 32x32). Do a flattening and return all sprites in alist.
+    """Get sprite all layers of given target rectangle. Do a flattening
+    and return all sprites in a set.
     TODO: Use set instead for hash operations?
     """
     sprites = set()
@@ -235,24 +990,18 @@ class DirtyLayerGrid(pygame.sprite.Sprite):
     return sprites
 
   def _add_sprite_to_grid(self, sprite):
-    """Add sprite to grid matrix mapping x, y, layer to sprites.
+    """Add sprite to grid matrix mapping x, y, layer to sprites, in each
+    grid cell the sprite overlap.
     Following data types and structure is used:
     dict(y-grid) -> dict(x-grid) -> dict(layer) -> Set(sprites).
     TODO: Read tile resolution from config.
     """
-    x = sprite.get_rect().x / 32
-    y = sprite.get_rect().y / 32
-    columns = self._sprite_matrix.get(y, None)
-    if columns is None:
-      self._sprite_matrix[y] = {x: {sprite._layer: [sprite]}}
-    else:
-      layers = columns.get(x, None)
-      if layers is None:
-        columns[x] = layers = {}
-      layer = layers.get(sprite._layer, None)
-      if layer is None:
-        layers[sprite._layer] = layer = set()
-      layer.add(sprite)
+    x1, y1, x2, y2 = get_grid_cells(sprite.get_rect())
+    for y in range(y1, y2):
+      columns = self._sprite_matrix.setdefault(y, {})
+      for x in range(x1, x2):
+        layers = columns.setdefault(x, {})
+        layers.setdefault(sprite._layer, set()).add(sprite)
 
   def modify_dirty(self, sprite):
     """Modify sprite that are dirty. Append them to the queue.
@@ -283,8 +1032,21 @@ class _Entity(pygame.sprite.DirtySprite):
     """Get rectangle."""
     return self._rect
 
+  def _relocate(self):
+    """Update the position of a moving sprite in its renderer."""
+    for group in self.groups():
+      if isinstance(group, DirtyLayerGrid):
+        group.relocate(self)
+
+  def get_image(self):
+    return None  # Overridden in extension classes, None is not drawn.
+
   def draw(self, surface):
-    pass  # Overridden in extension classes.
+    """Draw image (see get_image), sprites are drawn in batches by the
+    renderer so extension classes override get_image instead."""
+    image = self.get_image()
+    if image is not None:
+      surface.blit(image, self._rect)
 
   def collide_out(self, _self):
     # Overridden in extension classes.
@@ -313,9 +1075,9 @@ class SingleEntity(_Entity):
     super(SingleEntity, self).__init__(pygame.Rect(x, y, 32, 32))
     self._image = images[0]
 
-  def draw(self, surface):
-    """Draw tile."""
-    surface.blit(self._image, self._rect)
+  def get_image(self):
+    """Get tile."""
+    return self._image
 
 
 class DynamicEntity(_Entity):
@@ -327,9 +1089,9 @@ class DynamicEntity(_Entity):
     self._images = images
     self._index = 0
 
-  def draw(self, surface):
-    """Draw tile from current index."""
-    surface.blit(self._images[self._index], self._rect)
+  def get_image(self):
+    """Get tile from current index."""
+    return self._images[self._index]
 
   def reset(self):
     """Set sprite to initialized state."""
@@ -344,10 +1106,11 @@ class VisibilityEntity(SingleEntity):
   def __init__(self, images, x, y):
     super(VisibilityEntity, self).__init__(images, x, y)
 
-  def draw(self, surface):
-    """Draw only if sprite entity is visible."""
+  def get_image(self):
+    """Get tile only if sprite entity is visible."""
     if self._visible == 1:
-      SingleEntity.draw(self, surface)
+      return self._image
+    return None
 
   def reset(self):
     self._visible = 1
@@ -379,10 +1142,11 @@ class InteractionEntity(SingleEntity):
     # nicer here. Also if a sprite is in several groups (which will not
     # happen in current implementation) we only act on the first.
     g = self.groups()[0]
-    x = self._rect.x / 32
-    y = (self._rect.y / 32) - 1  # Get grid y one above current one.
+    x = self._rect.x // 32
+    y = self._rect.y // 32 - 1  # Get grid y one above current one.
     spr = []  # Sprites
-    spr.extend([i for sl in list(g._sprite_matrix[y][x].values()) for i in sl])
+    layers = g._sprite_matrix.get(y, {}).get(x, {})
+    spr.extend([i for sl in list(layers.values()) for i in sl])
     for sprite in spr:
       if isinstance(sprite, DynamicEntity):
         # Only get first occurring, should not occur more than one.
@@ -394,15 +1158,21 @@ class InteractionEntity(SingleEntity):
     sprite._index = index
     sprite._dirty = 1
     self.groups()[0]._add_dirty(sprite)
+    # Repaint the cells, the new image is not drawn on top of the old.
+    self.groups()[0].add_dirty_area(sprite.get_rect())
 
-  def collide_out(self, _player):
+  def collide_out(self, player):
     """Set image index to 0 on north sprite."""
+    if not isinstance(player, PlayerEntity):
+      return False  # Only the player interact.
     self._set_state_north_sprite(self._get_north_sprite(), 0)
     return False  # Do not run listeners if any are present.
 
   def collide_in(self, player):
     """Set image index to 1 on north sprite if charactered is faced
     upward and this entity sprite has not been interacted."""
+    if not isinstance(player, PlayerEntity):
+      return False  # Only the player interact.
     sprite = self._get_north_sprite()
     if player._tile_key == 'up' and self._interacted == 0:
       self._set_state_north_sprite(sprite, 1)
@@ -421,8 +1191,8 @@ class HideOnCollideEntity(VisibilityEntity):
   def __init__(self, images, x, y):
     super(HideOnCollideEntity, self).__init__(images, x, y)
 
-  def collide_in(self, _self):
-    if self._visible == 1:
+  def collide_in(self, sprite):
+    if self._visible == 1 and isinstance(sprite, PlayerEntity):
       self._visible = 0
       return True  # Run listeners.
     return False  # Do not run listeners.
@@ -435,13 +1205,14 @@ class RandomHideOnCollideEntity(DynamicEntity):
     super(RandomHideOnCollideEntity, self).__init__(images, x, y)
     self.reset()
 
-  def draw(self, surface):
-    """Draw tile from current index."""
+  def get_image(self):
+    """Get tile from current index, only if visible."""
     if self._visible:
-      DynamicEntity.draw(self, surface)
+      return self._images[self._index]
+    return None
 
-  def collide_in(self, _self):
-    if self._visible == 1:
+  def collide_in(self, sprite):
+    if self._visible == 1 and isinstance(sprite, PlayerEntity):
       self._visible = 0
       return True  # Run listeners.
     return False  # Do not run listeners.
@@ -452,6 +1223,108 @@ class RandomHideOnCollideEntity(DynamicEntity):
     self._index = randint(0, len(self._images) - 1)
 
 
+class MovingEntity(DynamicEntity):
+  """Sprite entity that roam the room with a constant velocity (x, y) in
+  pixels per second, e.g. a patrolling guard. Moved by
+  DirtyLayerGrid.update_movers, turn around when hitting a block."""
+
+  def __init__(self, images, x, y, velocity=(0, 0)):
+    super(MovingEntity, self).__init__(images, x, y)
+    self._start_position = (x, y)
+    self._start_velocity = tuple(velocity)
+    self.velocity = list(velocity)
+    self._remainder = [0.0, 0.0]  # Sub pixel movement (x, y).
+
+  def get_displacement(self, frame_time):
+    """Get whole pixels (dx, dy) to move in frame_time milliseconds, the
+    sub pixel remainder is kept until next frame."""
+    frame_time = min(frame_time, PlayerEntity._MAX_FRAME_TIME)
+    displacement = []
+    for axis in (0, 1):
+      self._remainder[axis] += self.velocity[axis] * frame_time / 1000.0
+      pixels = int(self._remainder[axis])
+      self._remainder[axis] -= pixels
+      displacement.append(pixels)
+    return displacement
+
+  def collide_block(self, axis):
+    """Blocked on axis (0: x, 1: y), turn around on that axis."""
+    self.velocity[axis] = -self.velocity[axis]
+    self._remainder[axis] = 0.0
+
+  def reset(self):
+    """Set sprite to initialized state."""
+    DynamicEntity.reset(self)
+    self._rect.topleft = self._start_position
+    self.velocity = list(self._start_velocity)
+    self._remainder = [0.0, 0.0]
+    self._relocate()
+
+
+class ChasingEntity(MovingEntity):
+  """Sprite entity that chase the player with a speed in pixels per
+  second. Follow the cells of a flow field (see navigation.FlowField)
+  toward the player, steered by DirtyLayerGrid.update_movers. Stop when
+  hitting a block, until steered again."""
+
+  def __init__(self, images, x, y, speed):
+    super(ChasingEntity, self).__init__(images, x, y)
+    self.speed = speed
+    self._limit = [None, None]  # Pixels left to a cell center (x, y).
+
+  def steer(self, field, size):
+    """Set velocity toward the next cell of flow field, cells are size
+    pixels. Turn only when centered on the cell, the sprite is centered on
+    the other axis first."""
+    rect = self._rect
+    x, y = rect.centerx // size, rect.centery // size
+    dx, dy = field.get_direction(x, y)
+    # Offset (x, y) to the center of the cell.
+    offset = (x * size + size // 2 - rect.centerx,
+              y * size + size // 2 - rect.centery)
+    if dx != 0 and offset[1] != 0:
+      direction = (0, 1)  # Center vertically before moving horizontally.
+    elif dy != 0 and offset[0] != 0:
+      direction = (1, 0)  # Center horizontally before moving vertically.
+    elif (dx, dy) == (0, 0):
+      if field.get_distance(x, y) is None:
+        direction = (0, 0)  # Can not reach the target, wait.
+      else:
+        direction = (1, 1)  # On the target cell, move to its center.
+    else:
+      direction = None
+    for axis in (0, 1):
+      if direction is None:
+        self.velocity[axis] = (dx, dy)[axis] * self.speed
+        self._limit[axis] = None
+      else:
+        sign = (offset[axis] > 0) - (offset[axis] < 0)
+        self.velocity[axis] = direction[axis] * sign * self.speed
+        self._limit[axis] = abs(offset[axis])
+      if self.velocity[axis] == 0:
+        self._remainder[axis] = 0.0
+
+  def get_displacement(self, frame_time):
+    """Overridden method in MovingEntity, do not move past the center of
+    the cell when centering."""
+    displacement = super(ChasingEntity, self).get_displacement(frame_time)
+    for axis, limit in enumerate(self._limit):
+      if limit is not None and abs(displacement[axis]) > limit:
+        displacement[axis] = limit if displacement[axis] > 0 else -limit
+        self._remainder[axis] = 0.0
+    return displacement
+
+  def collide_block(self, axis):
+    """Overridden method in MovingEntity, stop on that axis."""
+    self.velocity[axis] = 0
+    self._remainder[axis] = 0.0
+
+  def reset(self):
+    """Set sprite to initialized state."""
+    MovingEntity.reset(self)
+    self._limit = [None, None]
+
+
 class SquareEntity(SingleEntity):
   """Sprite entity that will draw a rectangle filled with a given color."""
 
@@ -467,7 +1340,13 @@ class PlayerEntity(_Entity):
   animated with a set delay. PlayerEntity can be positioned up, down, right
   and left. PlayerEntity will trigger the DirtyLayer when collisions is
   done over sprites."""
-  _MOVE_AMOUNT = 3  # Pixels
+  _SPEED = 180  # Pixels per second (3 pixels each frame in 60 FPS).
+  _FRAME_TIME = 1000 / 60.0  # Default frame time, milliseconds.
+  _MAX_FRAME_TIME = 100  # Longer frames (e.g. stalls) are clamped.
+  # Direction, key and unit velocity (x, y), in priority order.
+  _DIRECTIONS = (('up', pygame.K_UP, 0, -1), ('down', pygame.K_DOWN, 0, 1),
+                 ('left', pygame.K_LEFT, -1, 0),
+                 ('right', pygame.K_RIGHT, 1, 0))
 
   def __init__(self, tiles, x, y):
     super(PlayerEntity, self).__init__(None)  # Set rectangle below.
@@ -476,66 +1355,59 @@ class PlayerEntity(_Entity):
     self._start_position = (x, y)
     self._start_direction = 'down'  # Start by pointing character down.
     self._rect = pygame.Rect(x, y, w, h)
+    self._remainder = [0.0, 0.0]  # Sub pixel movement (x, y).
     self._tiles = tiles
     self._tile_key = self._start_direction
     self._tile_index = 0
     self._dirty = 1
     self._delay = TimeCount(100, True)  # Milliseconds.
 
-  def draw(self, surface):
+  def get_image(self):
     """Overridden method in _Entity."""
-    surface.blit(self._tiles[self._tile_key][self._tile_index],
-                 self._rect)
+    return self._tiles[self._tile_key][self._tile_index]
 
-  def inquire_move(self, block_manager):
+  def inquire_move(self, block_manager, frame_time=None):
     """Validate if any responsive keys have been pressed and act upon
-    them."""
+    them. The character is moved with constant speed, frame_time is the
+    time of the last frame in milliseconds (see pygame.time.Clock.get_time)
+    and default to one frame in 60 FPS. Only one key is used, the first
+    pressed in order up, down, left and right."""
     keys = pygame.key.get_pressed()
     if pygame.key.get_mods() & (pygame.KMOD_CTRL | pygame.KMOD_SHIFT):
       return
 
-    if keys[pygame.K_UP]:
-      self._move_up(block_manager)
-    elif keys[pygame.K_DOWN]:
-      self._move_down(block_manager)
-    elif keys[pygame.K_LEFT]:
-      self._move_left(block_manager)
-    elif keys[pygame.K_RIGHT]:
-      self._move_right(block_manager)
-
-  def _move_up(self, block_manager):
-    """Move the character upward."""
-    tmp = pygame.Rect(self._rect)
-    tmp.top -= self._MOVE_AMOUNT
-    self._move_direction(block_manager, tmp, 'up')
-
-  def _move_down(self, block_manager):
-    """Move the character downward."""
-    tmp = pygame.Rect(self._rect)
-    tmp.top += self._MOVE_AMOUNT
-    self._move_direction(block_manager, tmp, 'down')
-
-  def _move_left(self, block_manager):
-    """Move the character leftward."""
-    tmp = pygame.Rect(self._rect)
-    tmp.left -= self._MOVE_AMOUNT
-    self._move_direction(block_manager, tmp, 'left')
-
-  def _move_right(self, block_manager):
-    """Move the character rightward."""
-    tmp = pygame.Rect(self._rect)
-    tmp.left += self._MOVE_AMOUNT
-    self._move_direction(block_manager, tmp, 'right')
-
-  def _move_direction(self, block_manager, tmp, direction):
-    """Move character if no collision exist. Set tile index and
-    position on character."""
-    print('hej')
-    if not self._check_collision(block_manager, tmp):
+    for direction, pressed_key, vx, vy in self._DIRECTIONS:
+      if keys[pressed_key]:
+        self.move(block_manager, vx, vy, direction, frame_time)
+        return
+
+  def move(self, block_manager, vx, vy, direction, frame_time=None):
+    """Move the character with velocity (vx, vy), -1, 0 or 1 on each axis,
+    for frame_time milliseconds and face it in direction. The movement is
+    swept against the blocks one axis at a time and stop at the first
+    block."""
+    if frame_time is None:
+      frame_time = self._FRAME_TIME
+    distance = self._SPEED * min(frame_time, self._MAX_FRAME_TIME) / 1000.0
+    rect = pygame.Rect(self._rect)
+    for axis, velocity in ((0, vx), (1, vy)):
+      self._remainder[axis] += velocity * distance
+      pixels = int(self._remainder[axis])  # Whole pixels, toward zero.
+      if pixels == 0:
+        continue
+      self._remainder[axis] -= pixels
+      moved = block_manager.sweep(rect, *((pixels, 0) if axis == 0 else
+                                          (0, pixels)))
+      if moved != pixels:
+        self._remainder[axis] = 0.0  # Stop at the block.
+      rect[axis] += moved
+
+    if rect.topleft != self._rect.topleft:
       # Must repaint previous location before the new rectangle is set.
       self._tile_key = direction
-      self._set_dirty()
-      self._rect = tmp
+      self._set_dirty(rect)
+      self._rect = rect
+      self._relocate()
       if self._delay.is_obsolete():
         self._tile_index = ((self._tile_index + 1) % 4)
     elif self._tile_key != direction:
@@ -543,24 +1415,19 @@ class PlayerEntity(_Entity):
       self._set_dirty()
       # We want to repaint character when changing direction state,
       # even though its blocked.
-      return
 
-  def _set_dirty(self):
-    """Set self and colliding sprites as _dirty."""
+  def _set_dirty(self, target_rect=None):
+    """Set self and colliding sprites as _dirty, including the sprites at
+    target_rect if moving."""
     for group in self.groups():
       if isinstance(group, DirtyLayerGrid):
-        group.set_colliding_dirt(self)
-
-  def _check_collision(self, block_manager, tmp):
-    """Validate if there are any collusion on the new position."""
-    if debug.DEBUG:
-      print('[DEBUG - sprites.Player] Grid position [x: %s, y: %s]'\
-          % (int(float(tmp.x) % 32), int(float(tmp.y) % 32)))
-    return block_manager.collide(tmp)
+        group.set_colliding_dirt(self, target_rect)
 
   def reset(self):
     """Reset to initialized state."""
     self._rect.x = self._start_position[0]
     self._rect.y = self._start_position[1]
+    self._remainder = [0.0, 0.0]
+    self._relocate()
     self._tile_index
     self._tile_key = self._start_direction
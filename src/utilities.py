@@ -2,7 +2,9 @@
 
 import pygame
 from ast import literal_eval
+from collections import OrderedDict
 import re
+import sys
 
 
 """
@@ -20,31 +22,18 @@ Practices:
 
 
 def get_grid_data(target_rect, matrix):
-  """Retrieve blocks from grid positions for a rectangle. For the moment the
-  rectangle must be a resolution of 32x32.
-  Because of this limitation the maximum of 4 (+1 target) blocks/sprites and
-  a minimum of 1 (+1 target) can be retrieved.
-  TODO: Use width and height if the target_rect if larger than 32x32, fetch
-  colliding sprites for the entire rectangle.
-  TODO: Something smarter and dynamic than using None checkers.
-  """
+  """Retrieve data (e.g. blocks or sprites) from a matrix (dict(y-grid) ->
+  dict(x-grid) -> data) for all grid cells overlapped by a rectangle of
+  any size, see get_grid_cells."""
   data = []
-  p_y1, p_y2, p_x1, p_x2 = get_grid_position(target_rect)
-
-  y1 = matrix.get(p_y1, None)
-  if y1 is None:
-    return  # This is okay, a block may not exist
-
-  append_not_none(data, y1.get(p_x1, None))  # 1x1
-  if p_x2 is not None:  # 1x2
-    append_not_none(data, y1.get(p_x2, None))
-
-  if p_y2 is not None:
-    y2 = matrix.get(p_y2, None)  # 2x1
-    if y2 is not None:
-      append_not_none(data, y2.get(p_x1, None))
-      if p_x2 is not None:  # 2x2
-        append_not_none(data, y2.get(p_x2, None))
+  x1, y1, x2, y2 = get_grid_cells(target_rect)
+  for y in range(y1, y2):
+    columns = matrix.get(y, None)
+    if columns is not None:  # This is okay, a row may not exist.
+      for x in range(x1, x2):
+        cell = columns.get(x, None)
+        if cell is not None:
+          data.append(cell)
   return data
 
 
@@ -114,16 +103,81 @@ def add_to_set_in_dict(_dict, value, key):
   values.add(value)
 
 
-def get_grid_position(target_rect):
-  """Get grid positions of a 32x32 rectangle.
-  If rectangle position is 48x48 this will collide with:
-  y0x0, y1x0, y1x0, y1x1). Position is calculated mathematically and
-  retrieved from matrix for increased performance."""
-  y1 = int(target_rect.y / 32)
-  y2 = int(y1 + 1) if float(target_rect.y) % 32 >= 0 else None
-  x1 = int(target_rect.x / 32)
-  x2 = int(x1 + 1) if float(target_rect.x) % 32 >= 0 else None
-  return (y1, y2, x1, x2)
+def get_grid_cells(target_rect, size=32):
+  """Get grid cells overlapped by a rectangle (x, y, w, h) of any size, as
+  ranges of columns and rows (x1, y1, x2, y2) where x2 and y2 are
+  exclusive. Only integer math is used, a rectangle of 32x32 on position
+  48x48 overlap: y1x1, y1x2, y2x1, y2x2. An empty rectangle overlap no
+  cells."""
+  x, y, w, h = target_rect
+  if w <= 0 or h <= 0:
+    return (0, 0, 0, 0)
+  return (x // size, y // size, (x + w - 1) // size + 1,
+          (y + h - 1) // size + 1)
+
+
+def get_byte_grid(grid):
+  """Get a grid of uint16 ids (array('H') or memory view) as bytes, one
+  byte for each id, so the grid can be scanned and mapped with bytes
+  methods (e.g. find and translate). None if any id is 256 or above."""
+  data = grid.tobytes()
+  if sys.byteorder == 'little':
+    low, high = data[0::2], data[1::2]
+  else:
+    low, high = data[1::2], data[0::2]
+  if high.count(0) != len(high):
+    return None
+  return low
+
+
+def translate_byte_grid(ids, entries):
+  """Map each byte id in ids (see get_byte_grid) to its entry in entries
+  (256 bytes objects of the same size, e.g. array('H', [value]).tobytes()),
+  return the concatenated entries as a bytearray. Each byte of the entries
+  is mapped with one bytes.translate."""
+  width = len(entries[0])
+  data = bytearray(width * len(ids))
+  for k in range(width):
+    data[k::width] = ids.translate(bytes(entry[k] for entry in entries))
+  return data
+
+
+def merge_rects(rects, waste=0.25):
+  """Merge overlapping and adjacent rectangles, e.g. the dirty areas of a
+  frame, into fewer rectangles. Two rectangles are merged into their union
+  if the area of the union that neither cover is at most waste (a fraction
+  of the union area). Empty rectangles are dropped, return a new list."""
+  merged = []
+  covered = []  # Area covered by the rectangles merged into each.
+  for rect in rects:
+    if rect[2] > 0 and rect[3] > 0:
+      merged.append(pygame.Rect(rect))
+      covered.append(rect[2] * rect[3])
+  changed = True
+  while changed:
+    changed = False
+    i = 0
+    while i < len(merged):
+      a = merged[i]
+      touching = a.inflate(2, 2)  # Adjacent rectangles collide as well.
+      j = i + 1
+      while j < len(merged):
+        b = merged[j]
+        if touching.colliderect(b):
+          union = a.union(b)
+          clip = a.clip(b)
+          area = covered[i] + covered[j] - clip.w * clip.h
+          if union.w * union.h - area <= waste * union.w * union.h:
+            merged[i] = a = union
+            covered[i] = area
+            touching = a.inflate(2, 2)
+            del merged[j]
+            del covered[j]
+            changed = True
+            continue
+        j += 1
+      i += 1
+  return merged
 
 
 def get_center_of(larger_surface, smaller_surface):
@@ -139,12 +193,6 @@ def get_center_of_size(larger_size, smaller_size):
   return ((a_w - b_w) / 2, (a_h - b_h) / 2)
 
 
-def append_not_none(lst, data):
-  """Append to list if value is not None"""
-  if data is not None:
-    lst.append(data)
-
-
 def get_screen_backup(screen):
   """Create backup of screen content."""
   backup = pygame.Surface(screen.get_size())
@@ -191,6 +239,80 @@ class TimeCount():
     return False
 
 
+class LRUCache():
+  """Least recently used cache with a budget. Each value has a cost
+  (given by the 'cost' key word argument function, default 1), the least
+  recently used values are evicted when the total cost exceed the budget.
+  Function 'on_evict' (key, value) is called for evicted values."""
+
+  def __init__(self, budget, **kwargs):
+    self.budget = budget
+    self._cost = kwargs.get('cost', lambda value: 1)
+    self._on_evict = kwargs.get('on_evict', None)
+    self._values = OrderedDict()  # Key -> (value, cost), oldest first.
+    self._total = 0
+
+  def __contains__(self, key):
+    return key in self._values
+
+  def __len__(self):
+    return len(self._values)
+
+  def get_total(self):
+    """Get total cost of all values in cache."""
+    return self._total
+
+  def get(self, key, default=None):
+    """Get value and mark it as most recently used."""
+    entry = self._values.get(key, None)
+    if entry is None:
+      return default
+    self._values.move_to_end(key)
+    return entry[0]
+
+  def put(self, key, value):
+    """Put value as most recently used, evict values if the budget is
+    exceeded. The value put is never evicted by this call."""
+    self.pop(key)
+    cost = self._cost(value)
+    self._values[key] = (value, cost)
+    self._total += cost
+    self._evict()
+
+  def update_cost(self, key):
+    """Get the cost of a value again (e.g. it has grown), without marking
+    it as used. Evict values if the budget is exceeded."""
+    entry = self._values.get(key, None)
+    if entry is None:
+      return
+    cost = self._cost(entry[0])
+    self._values[key] = (entry[0], cost)  # Keep position.
+    self._total += cost - entry[1]
+    self._evict()
+
+  def _evict(self):
+    """Evict the least recently used values until the total cost is within
+    the budget, the most recently used value is kept."""
+    while self._total > self.budget and len(self._values) > 1:
+      old_key = next(iter(self._values))
+      old_value = self.pop(old_key)
+      if self._on_evict is not None:
+        self._on_evict(old_key, old_value)
+
+  def pop(self, key, default=None):
+    """Remove value from cache (without calling on_evict)."""
+    entry = self._values.pop(key, None)
+    if entry is None:
+      return default
+    self._total -= entry[1]
+    return entry[0]
+
+  def clear(self):
+    """Remove all values (without calling on_evict)."""
+    self._values.clear()
+    self._total = 0
+
+
 class OptionDialog():
   """Display an dialog with Yes and No options.
   Interaction is done with mouse. When mouse is over the button it paints
@@ -45,6 +45,8 @@ class View():
     self._h_height_diff = int(view_size[1]/2) - self._window_half_size[1]
     self._width_diff = view_size[0] - self._window_size[0]
     self._height_diff = view_size[1] - self._window_size[1]
+    self._rect = None
+    self._scrolled = True
 
   def get_rect(self):
     """Get rectangle view, this used when we retrieve parts from the
@@ -56,13 +58,33 @@ class View():
     should be updated."""
     return self._window_clip
 
+  def get_area(self, rect):
+    """Get position and area (see get_rect) of a rectangle in screen
+    coordinates, used when only parts of the view are rendered."""
+    x, y = self._pos
+    return rect.topleft, rect.move(self._rect.x - x, self._rect.y - y)
+
+  def translate(self, rect):
+    """Translate rectangle from surface coordinates to screen coordinates,
+    clipped to the clip rectangle (empty if it is not in view)."""
+    x, y = self._pos
+    return rect.move(x - self._rect.x, y - self._rect.y).clip(
+        self._window_clip)
+
+  def is_scrolled(self):
+    """See if the view rectangle changed on the last update, the whole
+    view must then be rendered again."""
+    return self._scrolled
+
   def update(self, target):
     """Update with target position and calculate a new a view rectangle."""
     if isinstance(target, pygame.Rect):
       rect = target
     else:
       rect = target.get_rect()
-    self._rect = self._calculate_view(rect)
+    view_rect = self._calculate_view(rect)
+    self._scrolled = view_rect != self._rect
+    self._rect = view_rect
 
   def _apply(self, target):
     """Apply view rectangle upon target rectangle."""
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# The game modules import each other from the source directory.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, 'src'))
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
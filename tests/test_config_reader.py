@@ -0,0 +1,55 @@
+import io
+
+from config_reader import ConfigReader
+
+
+def _parse(text):
+  parser = ConfigReader.StreamParser(io.TextIOWrapper(io.BytesIO(
+      text.encode())))
+  return parser.read()
+
+
+def test_block_values():
+  assert _parse('a=1\n[room]\nb=<<[\n(1, 2),\n]>>\nc=<<x>>\nd=2\n') == {
+      None: {'a': '1'}, 'room': {'b': '[(1, 2),\n]', 'c': 'x', 'd': '2'}}
+
+
+def test_block_end_marker_split_over_lines():
+  # The newline between '>' and '>' is part of the value, not an end.
+  content = _parse('[room]\nb=<<abc>\n>\nmore>>\nc=1\n')
+  assert content['room'] == {'b': 'abc>\n>\nmore', 'c': '1'}
+
+
+def test_short_block_joined_without_newline():
+  assert _parse('[room]\nb=<<>\n>\nc=1\n')['room'] == {'b': '', 'c': '1'}
+  assert _parse('[room]\nb=<<\n\n>>\n')['room'] == {'b': ''}
+
+
+def test_escaped_comment():
+  assert _parse('[room]\nb=<<abc\nd\\#e>>\n')['room'] == {'b': 'abc\nd#e'}
+
+
+def test_line_numbers():
+  parser = ConfigReader.StreamParser(io.TextIOWrapper(io.BytesIO(
+      b'a=1\n[room]\nb=<<\n1\n>>\nc=2\n')))
+  parser.read()
+  assert parser.lines == {None: {None: 0, 'a': 1},
+                          'room': {None: 2, 'b': 3, 'c': 6}}
+
+
+def test_cache_keyed_by_lazy_prefixes(tmp_path):
+  conf_file = str(tmp_path / 'test.conf')
+  with open(conf_file, 'w') as f:
+    f.write('[room]\nsize=(1, 2)\nmatrix.block=<<((1, 2),)>>\n')
+  config = ConfigReader.read_config(conf_file)
+  assert 'matrix.block' in config.get_properties('room')._evaluated
+
+  config = ConfigReader.read_config(conf_file, lazy=('matrix.',))
+  properties = config.get_properties('room')
+  assert 'matrix.block' not in properties._evaluated
+  assert properties._evaluated['size'] == (1, 2)
+  assert properties.get_eval('matrix.block') == ((1, 2),)
+
+  # Cached, with the same lazy prefixes.
+  config = ConfigReader.read_config(conf_file, lazy=('matrix.',))
+  assert 'matrix.block' not in config.get_properties('room')._evaluated
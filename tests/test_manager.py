@@ -0,0 +1,131 @@
+import os
+import random
+
+import pygame
+
+from manager import BlockManager
+
+
+def _create_block_manager(columns, rows):
+  random.seed(1)
+  block_manager = BlockManager(columns, rows)
+  modifiers = ((0, 0, 0, 0), (8, 0, -16, 0), (0, 16, 0, -16),
+               (-8, -8, 16, 16), (4, 4, -8, -8))
+  for y in range(rows):
+    for x in range(columns):
+      if random.random() < 0.2:
+        block_manager.add(x, y, random.choice(modifiers))
+  return block_manager
+
+
+def test_collide_many_same_as_collide():
+  block_manager = _create_block_manager(30, 20)
+  random.seed(2)
+  rects = [pygame.Rect(random.randrange(-64, 30 * 32 + 64),
+                       random.randrange(-64, 20 * 32 + 64),
+                       random.randrange(0, 80), random.randrange(0, 80))
+           for _ in range(5000)]
+  expected = [block_manager.collide(rect) for rect in rects]
+  assert block_manager.collide_many(rects) == expected
+  assert True in expected and False in expected
+
+
+def test_collide_many_empty():
+  assert BlockManager(4, 4).collide_many([]) == []
+  assert BlockManager(4, 4).collide_many([(0, 0, 32, 32)]) == [False]
+
+
+def _sweep_all_blocks(block_manager, rect, dx, dy):
+  """Sweep examining every block."""
+  moved = rect.move(dx, dy)
+  distance = dx or dy
+  for i in range(block_manager.columns * block_manager.rows):
+    block = block_manager.get_block(i % block_manager.columns,
+                                    i // block_manager.columns)
+    if block is None or block.colliderect(rect) or\
+       not block.colliderect(rect.union(moved)):
+      continue
+    if dx > 0:
+      distance = min(distance, block.left - rect.right)
+    elif dx < 0:
+      distance = max(distance, block.right - rect.left)
+    elif dy > 0:
+      distance = min(distance, block.top - rect.bottom)
+    else:
+      distance = max(distance, block.bottom - rect.top)
+  return distance
+
+
+def test_sweep_same_as_all_blocks():
+  block_manager = _create_block_manager(30, 20)
+  random.seed(3)
+  for _ in range(3000):
+    rect = pygame.Rect(random.randrange(-40, 30 * 32), random.randrange(
+        -40, 20 * 32), random.randrange(1, 48), random.randrange(1, 48))
+    dx, dy = random.choice(((1, 0), (0, 1), (-1, 0), (0, -1)))
+    dx, dy = dx * random.randrange(1, 40), dy * random.randrange(1, 40)
+    assert block_manager.sweep(rect, dx, dy) ==\
+        _sweep_all_blocks(block_manager, rect, dx, dy)
+
+
+def test_add_grid_same_as_add():
+  from array import array
+
+  block_manager = _create_block_manager(30, 20)
+  modifiers = [None]
+  grid = array('H', bytes(2 * 30 * 20))
+  for i in range(30 * 20):
+    block = block_manager._modifiers[4 * i:4 * i + 4]
+    if block_manager._blocked[i]:
+      if tuple(block) not in modifiers:
+        modifiers.append(tuple(block))
+      grid[i] = modifiers.index(tuple(block))
+  modifiers.append((0, 0, -32, 0))  # Without area, not added.
+  grid[block_manager._blocked.find(0)] = len(modifiers) - 1
+  bulk = BlockManager(30, 20)
+  bulk.add_grid(grid, modifiers)
+  assert bulk._blocked == block_manager._blocked
+  assert bulk._modifiers == block_manager._modifiers
+  assert bulk._full == block_manager._full
+  assert bulk._partial == block_manager._partial
+  assert bulk._reach == block_manager._reach
+  assert {j: set(edges) for j, edges in bulk._overlapping.items()} == {
+      j: set(edges) for j, edges in block_manager._overlapping.items()}
+  assert bulk.version > 0
+
+
+def _get_drawn_bytes(image):
+  target = pygame.Surface(image.get_size()).convert()
+  target.fill((10, 20, 30))
+  target.blit(image, (0, 0))
+  return pygame.image.tobytes(target, 'RGB')
+
+
+def _assert_drawn_alike(image, other):
+  # Blits with per pixel alpha and RLE alpha may round differently.
+  assert max(abs(a - b) for a, b in zip(_get_drawn_bytes(image),
+                                        _get_drawn_bytes(other))) <= 2
+
+
+def test_packed_atlases_keep_tiles(monkeypatch):
+  from config_reader import ConfigReader
+  from manager import TileManager
+  from schema import Schema
+
+  monkeypatch.chdir(os.path.join(os.path.dirname(__file__), os.pardir,
+                                 'src'))
+  pygame.display.init()
+  pygame.display.set_mode((1, 1))
+  game_schema = Schema.compile(ConfigReader.read_config(
+      'hack_and_hijack.conf', cache=False))
+  tile_manager = TileManager(game_schema, lazy=False)
+  size = game_schema.tile_size
+  for key, sheet in game_schema.tile_sheets.items():
+    first, rows, columns, atlas = tile_manager._sheets[key]
+    decoded = TileManager._decode_atlas(sheet, size)
+    for y in range(rows):
+      for x in range(columns):
+        tile = decoded.subsurface((x * size[0], y * size[1]) + size)
+        _assert_drawn_alike(tile, tile_manager.tiles[first + y * columns + x])
+  assert tile_manager.get_shared_count() > 0
+  assert tile_manager.get_freed_bytes() > 0
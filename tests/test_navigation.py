@@ -0,0 +1,94 @@
+import pygame
+
+from manager import BlockManager
+from navigation import Navigation
+from sprites import ChasingEntity, DirtyLayerGrid, PlayerEntity
+
+_FULL = (0, 0, 0, 0)  # Modifier of a block covering its whole cell.
+
+
+def _create_walled(columns, rows, wall):
+  """Block manager with blocks on the cells of wall."""
+  block_manager = BlockManager(columns, rows)
+  for x, y in wall:
+    block_manager.add(x, y, _FULL)
+  return block_manager
+
+
+def _assert_path(navigation, path, start, goal):
+  assert path[0] == start and path[-1] == goal
+  for (x1, y1), (x2, y2) in zip(path, path[1:]):
+    assert abs(x2 - x1) + abs(y2 - y1) == 1
+  assert all(navigation.is_walkable(x, y) for x, y in path)
+
+
+def test_path_around_wall():
+  # Wall on column 2, open only on the last row.
+  block_manager = _create_walled(5, 5, [(2, y) for y in range(4)])
+  navigation = Navigation(block_manager)
+  path = navigation.find_path((0, 0), (4, 0))
+  _assert_path(navigation, path, (0, 0), (4, 0))
+  assert (2, 4) in path
+  assert len(path) == 13  # Down 4, right 4 and up 4 steps.
+  field = navigation.get_flow_field((4, 0))
+  assert field.get_distance(0, 0) == 12
+  assert field.get_direction(0, 0) == (0, 1)
+  assert field.get_direction(4, 0) == (0, 0)
+
+
+def test_unreachable_goal():
+  block_manager = _create_walled(5, 5, [(2, y) for y in range(5)])
+  navigation = Navigation(block_manager)
+  assert navigation.find_path((0, 0), (4, 0)) is None
+  assert navigation.find_path((0, 0), (2, 0)) is None  # Goal is blocked.
+  field = navigation.get_flow_field((4, 0))
+  assert field.get_distance(0, 0) is None
+  assert field.get_direction(0, 0) == (0, 0)
+  assert field.get_distance(3, 4) == 5
+
+
+def test_caches_invalidated_when_blocks_change():
+  block_manager = _create_walled(5, 5, [(2, y) for y in range(4)])
+  navigation = Navigation(block_manager)
+  assert len(navigation.find_path((0, 0), (4, 0))) == 13
+  field = navigation.get_flow_field((4, 0))
+  assert navigation.get_flow_field((4, 0)) is field  # Cached.
+
+  block_manager.add(2, 4, _FULL)  # Close the wall.
+  assert navigation.find_path((0, 0), (4, 0)) is None
+  assert navigation.get_flow_field((4, 0)).get_distance(0, 0) is None
+
+  block_manager.remove(2, 0)  # Open the top of the wall.
+  assert navigation.find_path((0, 0), (4, 0)) == tuple(
+      (x, 0) for x in range(5))
+  assert navigation.get_flow_field((4, 0)).get_distance(0, 0) == 4
+
+
+def test_chasing_sprites_reach_player_around_wall():
+  block_manager = _create_walled(8, 8, [(3, y) for y in range(6)])
+  navigation = Navigation(block_manager)
+  image = pygame.Surface((32, 32))
+  player = PlayerEntity({'down': [image]}, 6 * 32, 0)
+  chasers = [ChasingEntity([image], 0, 0, 120),
+             ChasingEntity([image], 0, 4 * 32 + 10, 120)]
+  renderer = DirtyLayerGrid('test')
+  renderer.set_grid_size(8, 8)
+  renderer.add(player, *chasers)
+  target = player.get_rect()
+  for _ in range(200):  # 10 seconds.
+    renderer.update_movers(50, block_manager, navigation=navigation)
+    for chaser in chasers:
+      assert not block_manager.collide(chaser.get_rect())
+  for chaser in chasers:
+    assert chaser.get_rect().topleft == target.topleft
+
+
+def test_chasing_sprite_waits_without_navigation():
+  image = pygame.Surface((32, 32))
+  player = PlayerEntity({'down': [image]}, 128, 0)
+  chaser = ChasingEntity([image], 0, 0, 120)
+  renderer = DirtyLayerGrid('test')
+  renderer.set_grid_size(8, 8)
+  renderer.add(player, chaser)
+  renderer.update_movers(50, BlockManager(8, 8))
+  assert chaser.get_rect().topleft == (0, 0)
@@ -0,0 +1,56 @@
+import os
+import shutil
+
+import pytest
+
+import packed_room
+from config_reader import ConfigReader
+from schema import Schema
+
+_SOURCE = os.path.join(os.path.dirname(__file__), os.pardir, 'src')
+
+
+def _load(conf_file):
+  config = ConfigReader.read_config(conf_file, lazy=Schema.LAZY)
+  spec = Schema.compile(config).get_room('main_room')
+  return spec, packed_room.load_room(config, spec)
+
+
+def test_packed_room_written_on_first_load(tmp_path):
+  conf_file = str(tmp_path / 'hack_and_hijack.conf')
+  shutil.copy(os.path.join(_SOURCE, 'hack_and_hijack.conf'), conf_file)
+  for directory in ('audio', 'tiles'):  # Validated by the schema.
+    os.symlink(os.path.realpath(os.path.join(_SOURCE, directory)),
+               str(tmp_path / directory))
+  spec, packed = _load(conf_file)
+  assert os.path.isfile(str(tmp_path / 'rooms' / 'main_room.room'))
+  assert packed._mmap is None  # Packed in memory.
+  layers = [(layer, columns, rows, list(grid))
+            for layer, columns, rows, grid in packed.layers]
+
+  # Loaded from the packed room, the matrices are never evaluated.
+  spec, packed = _load(conf_file)
+  assert packed._mmap is not None
+  assert spec._evaluated is None
+  assert [(layer, columns, rows, list(grid))
+          for layer, columns, rows, grid in packed.layers] == layers
+  packed.close()
+
+
+class _Spec():
+
+  def __init__(self, key, layers, block_matrix, blocking_map):
+    self.key = key
+    self.layers = layers
+    self.block_matrix = block_matrix
+    self.blocking_map = blocking_map
+
+
+def test_too_many_distinct_cells():
+  matrix = [list(range(y * 256, (y + 1) * 256)) for y in range(256)]
+  spec = _Spec('big', [(0, matrix)], [], {})
+  with pytest.raises(ValueError, match='too many distinct cells'):
+    packed_room.PackedRoom.from_spec(spec)
+  matrix[-1][-1] = 0  # 0xFFFF distinct cells and the empty cell fit.
+  packed = packed_room.PackedRoom.from_spec(spec)
+  assert len(packed.legend) == 0x10000
@@ -0,0 +1,55 @@
+import pygame
+
+from room import ChunkedRoomSurface
+from schema import RenderSpec
+from sprites import DirtyLayerGrid, MovingEntity
+
+
+def _create_grid(columns, rows):
+  """Grid with opaque tiles under a sprite layer and half transparent
+  tiles on top of it (two bands)."""
+  pygame.display.init()
+  pygame.display.set_mode((1, 1))
+  floor = pygame.Surface((32, 32)).convert()
+  floor.fill((40, 120, 40))
+  glass = pygame.Surface((32, 32), pygame.SRCALPHA).convert_alpha()
+  glass.fill((200, 40, 40, 128))
+  renderer = DirtyLayerGrid('test')
+  renderer.set_grid_size(columns, rows)
+  for y in range(rows):
+    for x in range(columns):
+      renderer.add_tile(floor, x, y, layer=0)
+      if x % 4 == 0:
+        renderer.add_tile(glass, x, y, layer=2)
+  return renderer
+
+
+def _get_used_bytes(surface, renderer):
+  """Memory of the loaded chunk surfaces and all baked chunks."""
+  used = sum(chunk.get_size()[0] * chunk.get_size()[1] *
+             chunk.get_bytesize()
+             for chunk, _ in (value for value, _ in
+                              surface._chunks._values.values()))
+  return used + sum(renderer.get_baked_bytes().values())
+
+
+def test_chunked_surface_counts_baked_chunks():
+  renderer = _create_grid(96, 96)
+  image = pygame.Surface((32, 32)).convert()
+  guard = MovingEntity([image], 90 * 32, 90 * 32)
+  renderer.add(guard, layer=1)
+  surface = ChunkedRoomSurface(renderer, (96 * 32, 96 * 32),
+                               RenderSpec('chunked', 8, 1, 1, 0.25))
+  view = pygame.Rect(0, 0, 320, 240)
+  for step in range(80):
+    view.topleft = (step * 32, step * 28)
+    # The guard is outside of the view, its cells are baked when repainted.
+    renderer.move_sprite(guard, guard.get_rect().move(1 - 2 * (step % 2),
+                                                      0))
+    renderer.draw(surface)
+    surface.update(view)
+    used = _get_used_bytes(surface, renderer)
+    assert surface._chunks.get_total() == used
+    assert used <= surface._chunks.budget
+    for x, y in renderer.get_baked_bytes():  # Only in loaded chunks.
+      assert (x // 256, y // 256) in surface._chunks
@@ -0,0 +1,109 @@
+import pygame
+
+from manager import BlockManager
+from sprites import DirtyLayerGrid, MovingEntity, SingleEntity
+
+
+class _CountingEntity(MovingEntity):
+
+  def __init__(self, x, y, velocity):
+    super(_CountingEntity, self).__init__([pygame.Surface((32, 32))], x, y,
+                                          velocity)
+    self.events = []
+
+  def collide_in(self, sprite):
+    self.events.append(('in', sprite))
+    return False
+
+  def collide_out(self, sprite):
+    self.events.append(('out', sprite))
+    return False
+
+
+def _create_grid(*sprites):
+  renderer = DirtyLayerGrid('test')
+  renderer.set_grid_size(20, 20)
+  renderer.add(*sprites)
+  return renderer
+
+
+def test_collide_in_once_while_overlapping():
+  # Both move the same way, they stay overlapped for all frames.
+  a = _CountingEntity(64, 64, (100, 0))
+  b = _CountingEntity(80, 64, (100, 0))
+  renderer = _create_grid(a, b)
+  block_manager = BlockManager(20, 20)
+  for _ in range(10):
+    renderer.update_movers(50, block_manager)
+  assert a.events == [('in', b)]
+  assert b.events == [('in', a)]
+
+
+def test_collide_out_when_separated():
+  a = _CountingEntity(64, 64, (0, 0))
+  b = _CountingEntity(80, 64, (0, 0))
+  renderer = _create_grid(a, b)
+  renderer.update_collisions()
+  renderer.update_collisions()
+  renderer.move_sprite(b, pygame.Rect(200, 64, 32, 32))
+  renderer.update_collisions()
+  renderer.move_sprite(b, pygame.Rect(90, 64, 32, 32))
+  renderer.update_collisions()
+  assert a.events == [('in', b), ('out', b), ('in', b)]
+  assert b.events == [('in', a), ('out', a), ('in', a)]
+
+
+def _create_layered_grid():
+  """Grid of 20 x 12 tiles, opaque tiles under a sprite layer and half
+  transparent tiles on top of it."""
+  pygame.display.init()
+  pygame.display.set_mode((1, 1))
+  floor = pygame.Surface((32, 32)).convert()
+  floor.fill((40, 120, 40))
+  glass = pygame.Surface((32, 32), pygame.SRCALPHA).convert_alpha()
+  glass.fill((200, 40, 40, 128))
+  renderer = DirtyLayerGrid('test')
+  renderer.set_grid_size(20, 12)
+  for y in range(12):
+    for x in range(20):
+      if (x + y) % 3:
+        renderer.add_tile(floor, x, y, layer=0)
+      if x % 4 == 0:
+        renderer.add_tile(glass, x, y, layer=2)
+  sprite = pygame.Surface((32, 32)).convert()
+  sprite.fill((20, 20, 220))
+  renderer.add(SingleEntity([sprite], 96, 64), layer=1)
+  return renderer
+
+
+def _draw_all(renderer):
+  surface = pygame.Surface((20 * 32, 12 * 32)).convert()
+  renderer.draw_all(surface)
+  return surface
+
+
+def test_chunks_baked_when_repainted():
+  renderer = _create_layered_grid()
+  lazy = _draw_all(renderer)
+  assert not renderer._chunks  # Drawn without baking.
+
+  renderer.add_dirty_area(pygame.Rect(32, 32, 32, 32))
+  renderer.draw(lazy)
+  assert set(key[1:] for key in renderer._chunks) == {(0, 0)}
+
+  baked = _create_layered_grid()
+  baked.bake()
+  expected = _draw_all(baked)
+  for y in range(0, 12 * 32, 7):
+    for x in range(0, 20 * 32, 7):
+      assert all(abs(a - b) <= 2 for a, b in zip(lazy.get_at((x, y)),
+                                                 expected.get_at((x, y))))
+
+
+def test_build_occlusion_top_opaque_layer():
+  renderer = _create_layered_grid()
+  renderer.build_occlusion()
+  tiles = renderer.get_tile_layer(0)
+  for i, order in enumerate(renderer._static_occlusion):
+    assert order == (0 if tiles[i] else -0x80000000)  # Glass is not opaque.
+  assert renderer._occlusion[2 * 20 + 3] == 3  # The sprite on layer 1.